@@ -0,0 +1,396 @@
+"""
+Admission Control and Load Shedding for Surplus-to-Sustain
+
+Every request except static files and the event stream is charged to token
+buckets before its view runs; a request that finds its bucket empty gets
+an immediate 429 with Retry-After:
+
+    page     interactive pages, per user (or IP)     ADMISSION_PAGE_PER_MINUTE
+    api      /api/ and /export/, per user (or IP)    ADMISSION_API_PER_MINUTE
+    key      requests with an X-API-Key header       ADMISSION_KEY_PER_MINUTE
+
+Pages and the page's own fetches (Sec-Fetch-Site: same-origin, no API key)
+count as interactive and draw on their own buckets, so an integration
+hammering /api/ under a farmer's account can't lock that farmer out of
+the site.
+
+Expensive operations also take a slot from a named pool, `@admission.slot
+('inference')` below @login_required. A full pool sheds with 503 and a
+Retry-After of the pool's typical hold time. The last
+ADMISSION_INTERACTIVE_RESERVE slots of each pool are only handed to
+interactive requests. Streamed responses hold their slot until the stream
+closes.
+
+State is per worker process. With ADMISSION_DB set, buckets and slots live
+in that SQLite file instead, shared by every worker on the host; slots are
+leases that expire after ADMISSION_LEASE_SECONDS in case a worker dies
+holding one. If the shared file is busy the worker falls back to its own
+state rather than refusing the request.
+
+    python admission.py     # overhead per request and interactive priority under a flood
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import wraps
+
+from flask import jsonify, make_response, request, session
+
+from auth import TokenBucket
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') != '0'
+ADMISSION_DB = os.environ.get('ADMISSION_DB', '')
+ADMISSION_LEASE_SECONDS = float(os.environ.get('ADMISSION_LEASE_SECONDS', 300))
+ADMISSION_INTERACTIVE_RESERVE = int(os.environ.get('ADMISSION_INTERACTIVE_RESERVE', 1))
+
+# Bucket class -> (sustained requests per minute, burst)
+RATE_LIMITS = {
+    'page': (float(os.environ.get('ADMISSION_PAGE_PER_MINUTE', 600)),
+             int(os.environ.get('ADMISSION_PAGE_BURST', 120))),
+    'api': (float(os.environ.get('ADMISSION_API_PER_MINUTE', 120)),
+            int(os.environ.get('ADMISSION_API_BURST', 30))),
+    'key': (float(os.environ.get('ADMISSION_KEY_PER_MINUTE', 600)),
+            int(os.environ.get('ADMISSION_KEY_BURST', 60))),
+}
+
+# Pool -> concurrent requests per worker (per host with ADMISSION_DB)
+SLOT_LIMITS = {
+    'inference': int(os.environ.get('ADMISSION_INFERENCE_SLOTS', 4)),
+    'bulk_write': int(os.environ.get('ADMISSION_BULK_WRITE_SLOTS', 2)),
+    'export': int(os.environ.get('ADMISSION_EXPORT_SLOTS', 2)),
+}
+
+EXEMPT_PREFIXES = ('/static/', '/events')
+API_PREFIXES = ('/api/', '/export/')
+
+
+class SharedState:
+    """Token buckets and slot leases in a SQLite file shared by all workers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=0.05, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # limiter state doesn't need to survive a crash
+            conn.execute('''CREATE TABLE IF NOT EXISTS admission_buckets (
+                                key TEXT PRIMARY KEY,
+                                tokens REAL NOT NULL,
+                                updated REAL NOT NULL
+                            ) WITHOUT ROWID''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS admission_slots (
+                                pool TEXT NOT NULL,
+                                holder TEXT NOT NULL,
+                                expires REAL NOT NULL,
+                                PRIMARY KEY (pool, holder)
+                            ) WITHOUT ROWID''')
+            self.local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        """Consume one token; returns 0 or seconds until one is available"""
+        now = time.time()
+        conn = self._connection()
+        # One statement, so no transaction is needed; a refused take leaves the row as it was
+        taken = conn.execute('''INSERT INTO admission_buckets (key, tokens, updated) VALUES (?1, ?2 - 1, ?3)
+                                ON CONFLICT(key) DO UPDATE SET
+                                    tokens = MIN(?2, tokens + (?3 - updated) * ?4) - 1, updated = ?3
+                                WHERE MIN(?2, tokens + (?3 - updated) * ?4) >= 1
+                                RETURNING tokens''', (key, burst, now, rate)).fetchall()
+        if taken:
+            return 0
+        tokens, updated = conn.execute('SELECT tokens, updated FROM admission_buckets WHERE key = ?',
+                                       (key,)).fetchone()
+        return (1 - min(burst, tokens + (now - updated) * rate)) / rate
+
+    def acquire(self, pool, free_needed, limit):
+        """Lease a slot if more than free_needed of limit are free; returns its holder id or None"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM admission_slots WHERE pool = ? AND expires < ?', (pool, now))
+            active = conn.execute('SELECT COUNT(*) FROM admission_slots WHERE pool = ?', (pool,)).fetchone()[0]
+            holder = None
+            if limit - active > free_needed:
+                holder = uuid.uuid4().hex
+                conn.execute('INSERT INTO admission_slots (pool, holder, expires) VALUES (?, ?, ?)',
+                             (pool, holder, now + ADMISSION_LEASE_SECONDS))
+            conn.execute('COMMIT')
+            return holder
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release(self, pool, holder):
+        self._connection().execute('DELETE FROM admission_slots WHERE pool = ? AND holder = ?', (pool, holder))
+
+
+class SlotPool:
+    """A named concurrency cap with reserved interactive slots and a running hold time"""
+
+    def __init__(self, name, limit, reserve=ADMISSION_INTERACTIVE_RESERVE, shared=None):
+        self.name = name
+        self.limit = limit
+        self.reserve = min(reserve, max(limit - 1, 0))
+        self.shared = shared
+        self.active = 0
+        self.hold_seconds = 1.0  # moving average, for Retry-After
+        self.lock = threading.Lock()
+        self.stats = {'admitted': 0, 'shed': 0}
+
+    def acquire(self, interactive):
+        """A token to pass to release(), or None if the pool is full for this priority"""
+        free_needed = 0 if interactive else self.reserve
+        if self.shared:
+            try:
+                holder = self.shared.acquire(self.name, free_needed, self.limit)
+            except sqlite3.OperationalError:
+                pass  # shared file busy: count against this worker instead
+            else:
+                with self.lock:
+                    self.stats['admitted' if holder else 'shed'] += 1
+                return (holder, time.perf_counter()) if holder else None
+        with self.lock:
+            if self.limit - self.active <= free_needed:
+                self.stats['shed'] += 1
+                return None
+            self.active += 1
+            self.stats['admitted'] += 1
+        return (None, time.perf_counter())
+
+    def release(self, token):
+        holder, started = token
+        with self.lock:
+            self.hold_seconds += (time.perf_counter() - started - self.hold_seconds) * 0.2
+            if holder is None:
+                self.active -= 1
+        if holder is not None:
+            try:
+                self.shared.release(self.name, holder)
+            except sqlite3.OperationalError:
+                pass  # the lease expires on its own
+
+    def retry_after(self):
+        return max(1, math.ceil(self.hold_seconds))
+
+    def report(self):
+        with self.lock:
+            return dict(self.stats, active=self.active, limit=self.limit, reserve=self.reserve,
+                        hold_seconds=round(self.hold_seconds, 3))
+
+
+class Admission:
+    """Per-request rate limits plus concurrency pools for expensive views"""
+
+    def __init__(self, shared_path=ADMISSION_DB, enabled=ADMISSION_ENABLED):
+        self.enabled = enabled
+        self.shared = SharedState(shared_path) if shared_path else None
+        self.buckets = {name: TokenBucket(rate, burst) for name, (rate, burst) in RATE_LIMITS.items()}
+        self.pools = {name: SlotPool(name, limit, shared=self.shared) for name, limit in SLOT_LIMITS.items()}
+        self.lock = threading.Lock()
+        self.stats = {f'{name}_{outcome}': 0 for name in RATE_LIMITS for outcome in ('admitted', 'limited')}
+
+    # ---------- rate limits ----------
+
+    def take(self, bucket, key):
+        """Charge one request to a bucket; 0 or seconds to wait"""
+        rate, burst = RATE_LIMITS[bucket]
+        wait = None
+        if self.shared:
+            try:
+                wait = self.shared.take(f'{bucket}:{key}', rate / 60.0, burst)
+            except sqlite3.OperationalError:
+                pass  # shared file busy: use this worker's bucket
+        if wait is None:
+            wait = self.buckets[bucket].take(key)
+        with self.lock:
+            self.stats[f'{bucket}_{"limited" if wait else "admitted"}'] += 1
+        return wait
+
+    def check_request(self):
+        """before_request hook: None to proceed, or a 429 response"""
+        if not self.enabled or request.path.startswith(EXEMPT_PREFIXES):
+            return None
+        identity = f"user:{session['user_id']}" if 'user_id' in session else f'ip:{request.remote_addr}'
+        api_key = request.headers.get('X-API-Key')
+        charges = [('page' if is_interactive() else 'api', identity)]
+        if api_key:
+            charges.append(('key', hashlib.sha256(api_key.encode()).hexdigest()[:24]))
+        for bucket, key in charges:
+            wait = self.take(bucket, key)
+            if wait:
+                return refusal(429, 'Too many requests. Please slow down.', math.ceil(wait))
+        return None
+
+    # ---------- concurrency ----------
+
+    def slot(self, pool, methods=None):
+        """
+        Decorator: run the view holding a slot of `pool`, or shed with 503
+
+        methods limits it to those HTTP methods (e.g. the POST of a form).
+        Must sit below @login_required.
+        """
+        slots = self.pools[pool]
+
+        def enter():
+            if not self.enabled or (methods and request.method not in methods):
+                return None, None
+            token = slots.acquire(is_interactive())
+            if token is None:
+                return None, refusal(503, 'Server is busy. Please try again in a moment.', slots.retry_after())
+            return token, None
+
+        def leave(token, rv):
+            if token is None:
+                return rv
+            try:
+                response = make_response(rv)
+            except Exception:
+                slots.release(token)
+                raise
+            if response.is_streamed:
+                response.call_on_close(lambda: slots.release(token))
+            else:
+                slots.release(token)
+            return response
+
+        def decorator(f):
+            if asyncio.iscoroutinefunction(f):
+                @wraps(f)
+                async def decorated_coroutine(*args, **kwargs):
+                    token, shed = enter()
+                    if shed is not None:
+                        return shed
+                    try:
+                        rv = await f(*args, **kwargs)
+                    except BaseException:
+                        if token is not None:
+                            slots.release(token)
+                        raise
+                    return leave(token, rv)
+                return decorated_coroutine
+
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                token, shed = enter()
+                if shed is not None:
+                    return shed
+                try:
+                    rv = f(*args, **kwargs)
+                except BaseException:
+                    if token is not None:
+                        slots.release(token)
+                    raise
+                return leave(token, rv)
+            return decorated_function
+        return decorator
+
+    def report(self):
+        """Admitted/limited counts and pool usage, for /api/metrics"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats['shared'] = bool(self.shared)
+        stats['pools'] = {name: pool.report() for name, pool in self.pools.items()}
+        return stats
+
+
+def is_interactive():
+    """Pages, and the fetches they make themselves; never requests with an API key"""
+    if request.headers.get('X-API-Key'):
+        return False
+    if request.path.startswith(API_PREFIXES):
+        return request.headers.get('Sec-Fetch-Site') == 'same-origin'
+    return True
+
+
+def refusal(status, message, retry_after):
+    """A shed request: JSON for API clients, plain text for pages"""
+    if request.path.startswith(API_PREFIXES) or request.headers.get('X-API-Key'):
+        response = jsonify({'error': message, 'retry_after': retry_after})
+    else:
+        response = make_response(message)
+        response.mimetype = 'text/plain'
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def init_admission(app):
+    """Register the rate limit hook on app and return its Admission"""
+    admission = Admission()
+    app.before_request(admission.check_request)
+    return admission
+
+
+# ==================== BENCHMARK ====================
+
+def benchmark(seconds=3.0, hold=0.02, partners=16):
+    """Limiter overhead per request, and interactive admission while partners flood a pool"""
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    print(f"\n  {'limiter call':<36}{'µs':>10}")
+    with tempfile.TemporaryDirectory() as scratch:
+        for label, shared in (('in-process', None), ('shared SQLite', SharedState(os.path.join(scratch, 'a.db')))):
+            bucket = TokenBucket(1e9, 1e9)
+            n = 20_000
+            start = time.perf_counter()
+            for i in range(n):
+                if shared:
+                    shared.take(f'api:user:{i % 500}', 1e9, 1e9)
+                else:
+                    bucket.take(f'user:{i % 500}')
+            print(f"  {'token bucket, ' + label:<36}{(time.perf_counter() - start) * 1e6 / n:>10.1f}")
+
+            pool = SlotPool('bench', 4, shared=shared)
+            start = time.perf_counter()
+            for _ in range(n // 10):
+                pool.release(pool.acquire(True))
+            print(f"  {'slot acquire + release, ' + label:<36}{(time.perf_counter() - start) * 1e6 / (n // 10):>10.1f}")
+
+    print(f"\n  {partners} partner threads flooding a 4-slot pool ({hold * 1000:.0f} ms per request), "
+          f"one interactive user every 50 ms")
+    print(f"  {'reserve':<10}{'partner req/s':>16}{'interactive admitted':>22}")
+    for reserve in (0, 1):
+        pool = SlotPool('bench', 4, reserve=reserve)
+        stop = threading.Event()
+        served = {'partner': 0, 'interactive': 0, 'interactive_tries': 0}
+        lock = threading.Lock()
+
+        def client(interactive):
+            while not stop.is_set():
+                token = pool.acquire(interactive)
+                if interactive:
+                    with lock:
+                        served['interactive_tries'] += 1
+                if token is not None:
+                    time.sleep(hold)
+                    pool.release(token)
+                    with lock:
+                        served['interactive' if interactive else 'partner'] += 1
+                time.sleep(0.05 if interactive else 0.001)
+
+        with ThreadPoolExecutor(max_workers=partners + 1) as executor:
+            for i in range(partners):
+                executor.submit(client, False)
+            executor.submit(client, True)
+            time.sleep(seconds)
+            stop.set()
+        share = served['interactive'] / max(served['interactive_tries'], 1)
+        print(f"  {reserve:<10}{served['partner'] / seconds:>16.0f}{share:>21.0%}")
+
+
+if __name__ == '__main__':
+    benchmark()
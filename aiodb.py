@@ -0,0 +1,78 @@
+"""
+Async SQLite Access for Surplus-to-Sustain
+A pool of dedicated reader threads, each with its own read-only connection,
+behind awaitable fetch helpers, plus an executor for model inference
+
+Async views await these instead of blocking, so independent queries in one
+request run concurrently. That concurrency is within a request only: Flask
+runs each async view in its own short-lived event loop on the thread
+serving the request (a2wsgi's pool under asgi.py), so while the view awaits
+SQLite that thread is waiting, not serving another request. Capacity comes
+from the thread pool, not from the loop. With the database in WAL mode the
+readers never block, or get blocked by, the single writer.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+READER_THREADS = int(os.environ.get('DB_READER_THREADS', 8))
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 2))
+
+
+class AsyncReader:
+    """Awaitable read-only queries on a fixed pool of reader threads"""
+
+    def __init__(self, db_path, threads=READER_THREADS):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='db-reader')
+
+    def _connection(self, db_path=None):
+        """This thread's connection to db_path (default: the reader's file, else e.g. a shard)"""
+        conns = getattr(self.local, 'conns', None)
+        if conns is None:
+            conns = self.local.conns = {}
+        db_path = db_path or self.db_path
+        conn = conns.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{os.path.abspath(db_path)}?mode=ro', uri=True)
+            conn.row_factory = sqlite3.Row
+            conns[db_path] = conn
+        return conn
+
+    def _fetch(self, query, params, one):
+        cursor = self._connection().execute(query, params)
+        try:
+            return cursor.fetchone() if one else cursor.fetchall()
+        finally:
+            cursor.close()
+
+    async def fetchall(self, query, params=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._fetch, query, params, False)
+
+    async def fetchone(self, query, params=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._fetch, query, params, True)
+
+    async def call(self, func, *args, db_path=None):
+        """Run func(conn, *args) on a reader thread, for helpers that take a connection"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(self._connection(db_path), *args))
+
+    async def run(self, func, *args):
+        """Run a blocking func(*args), e.g. a Storage method, on a reader thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+
+_inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix='inference')
+
+
+async def run_inference(func, *args, **kwargs):
+    """Run a (CPU-bound) prediction call off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_inference_executor, lambda: func(*args, **kwargs))
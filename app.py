@@ -1,29 +1,110 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, send_file, g, has_request_context
 import sqlite3
 import joblib
 import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import json
 from functools import wraps
-from prediction import predict_yield, get_confidence
+from prediction import predict_yield, get_confidence, get_model_version, get_drift_report
+from search import init_search, search, SEARCH_SCOPES
+from exports import create_export_indexes, stream_export, EXPORT_DATASETS, EXPORT_FORMATS
+from reports import submit_report, report_status, report_path, ReportLimitError, REPORT_KINDS
+from scheduler import init_scheduler
+from auth import hash_password, verify_password, needs_rehash, admit_login, LoginThrottled
+from events import init_events, EventBroker, event_stream
+from changelog import init_changelog, rebuild as rebuild_changelog, changes_since
+from aiodb import AsyncReader, run_inference
+from assets import init_assets, compression_stats
+from admission import init_admission
+from fragment_cache import init_fragment_cache, init_generations, Deferred
+from revisions import init_revisions, conditional
+from storage import create_storage, require_sqlite, SQLiteStorage, IntegrityError, TRANSACTION_STATUSES
+from ledger import init_ledger, recompute as recompute_ledger, LEDGER_COLUMNS
+from impact import (init_impact, rebuild as rebuild_impact, parse_flow, new_qr_code, render_labels,
+                    WASTE_FLOW_COLUMNS, FLOW_STATUSES, DISPOSITIONS, MAX_FLOWS_PER_REQUEST, MAX_LABELS)
+from prices import (init_prices, rebuild as rebuild_prices, choose_resolution, bucket_start, merge_buckets,
+                    PRICE_RESOLUTIONS, DEFAULT_POINTS, MAX_POINTS)
+from scenarios import explore, cache as scenario_cache, RANKINGS, DEFAULT_LIMIT as SCENARIO_LIMIT
+from rescore import init_rescore, CROP_SCORE_COLUMNS
+from retention import attach_archive
+import asyncio
 USE_ML_PREDICTION = True
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+DATABASE = os.environ.get('DATABASE', 'database.db')
+reader = AsyncReader(DATABASE)
+storage = create_storage(DATABASE, init_shard=lambda path: init_db(path))
+require_sqlite(storage)  # search, SSE, sync, reports and the rest open SQLite files directly
+brokers = {}  # SQLite file -> EventBroker
+init_assets(app)
+fragments = init_fragment_cache(app, lambda: fragment_db())
+admission = init_admission(app)
 
 # Database setup
-def get_db():
-    """Connect to SQLite database"""
-    conn = sqlite3.connect('database.db')
+def get_db(path=None):
+    """Connect to SQLite database (schema setup and the SQLite-only search and reports)"""
+    conn = sqlite3.connect(path or DATABASE)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    """Initialize database with enhanced tables"""
-    conn = get_db()
+def get_user_db(user_id):
+    """Connect to the SQLite file holding a user's rows (their shard when sharded)"""
+    return get_db(storage.sqlite_path(user_id))
+
+def fragment_db():
+    """The file whose generation counters the fragment cache reads: the signed-in user's (shard)"""
+    user_id = session.get('user_id') if has_request_context() else None
+    return storage.sqlite_path(user_id) if user_id else DATABASE
+
+def get_broker(user_id):
+    """The event broker for the file holding a user's rows, one per shard when sharded"""
+    path = storage.sqlite_path(user_id)
+    broker = brokers.get(path)
+    if broker is None:
+        broker = brokers.setdefault(path, EventBroker(path))
+    return broker
+
+# Enhanced sample buyers
+SAMPLE_BUYERS = [
+    ('ABC Pickle Factory', 'Processor', '9988776655', 'abc@factory.com', 'Plot 45, MIDC Area', 'Nashik', 'Maharashtra', '422010', 19.9975, 73.7898, 50, 15, '["tomato", "onion", "chili"]', 4.5),
+    ('Green Valley Processing', 'Processor', '9988776656', 'info@greenvalley.com', 'Kharadi Industrial', 'Pune', 'Maharashtra', '411014', 18.5511, 73.9470, 80, 12, '["tomato", "potato", "cabbage"]', 4.2),
+    ('Fresh Storage Hub', 'Storage', '9988776657', 'storage@fresh.com', 'Cold Chain Complex', 'Nashik', 'Maharashtra', '422011', 20.0063, 73.7630, 100, 1.5, '["all"]', 4.7),
+    ('Hope Food Bank', 'NGO', '9988776658', 'hope@foodbank.org', 'Gandhi Nagar', 'Mumbai', 'Maharashtra', '400001', 18.9388, 72.8354, 30, 0, '["all"]', 4.9),
+    ('Metro Fresh Market', 'Retailer', '9988776659', 'metro@fresh.com', 'Market Yard', 'Pune', 'Maharashtra', '411037', 18.4977, 73.8536, 25, 18, '["tomato", "onion", "cabbage", "cauliflower"]', 4.3),
+    ('EcoCompost Solutions', 'Compost', '9988776660', 'eco@compost.com', 'Industrial Estate', 'Nashik', 'Maharashtra', '422007', 19.9872, 73.7840, 40, 2, '["all"]', 4.4),
+    ('Farm2Table Retail', 'Retailer', '9988776661', 'info@farm2table.com', 'Commercial Street', 'Mumbai', 'Maharashtra', '400020', 18.9647, 72.8258, 35, 20, '["all"]', 4.6),
+    ('Cattle Feed Industries', 'Animal Feed', '9988776662', 'cattle@feed.com', 'Hadapsar', 'Pune', 'Maharashtra', '411028', 18.5018, 73.9263, 60, 3, '["potato", "cabbage", "damaged"]', 4.1),
+    ('Premium Processors Ltd', 'Processor', '9988776663', 'premium@processors.com', 'MIDC Taloja', 'Navi Mumbai', 'Maharashtra', '410208', 19.0330, 73.1030, 100, 16, '["tomato", "chili"]', 4.5),
+    ('Community Cold Storage', 'Storage', '9988776664', 'community@storage.com', 'Viman Nagar', 'Pune', 'Maharashtra', '411014', 18.5679, 73.9143, 75, 1.2, '["all"]', 4.8),
+    ('Organic Waste Solutions', 'Compost', '9988776665', 'organic@waste.com', 'Bhosari', 'Pune', 'Maharashtra', '411026', 18.6298, 73.8502, 50, 2.5, '["all"]', 4.3),
+    ('City Fresh Supermarket', 'Retailer', '9988776666', 'city@fresh.com', 'Deccan Gymkhana', 'Pune', 'Maharashtra', '411004', 18.5196, 73.8553, 30, 19, '["all"]', 4.4),
+]
+
+def add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table; returns True if it was added"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if any(row['name'] == column for row in cursor.fetchall()):
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+def init_db(path=None):
+    """
+    Initialize database with enhanced tables
+    
+    With a path, builds the same schema in that file (a shard, see
+    sharding.py) and leaves the storage backend alone.
+    """
+    conn = get_db(path)
     cursor = conn.cursor()
     
+    # Only takes effect on a new database; see `retention.py --convert`
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    
+    # WAL: readers (including the async reader pool) don't block the writer
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Users table (enhanced)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -40,11 +121,22 @@ def init_db():
             profile_image TEXT DEFAULT 'default.png',
             user_type TEXT DEFAULT 'farmer',
             is_verified INTEGER DEFAULT 0,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            data_revision INTEGER NOT NULL DEFAULT 0,
+            data_modified_at TIMESTAMP,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_login TIMESTAMP
         )
     ''')
     
+    # Columns added after the first release
+    if add_column_if_missing(cursor, 'users', 'unread_count', 'INTEGER NOT NULL DEFAULT 0'):
+        cursor.execute('''UPDATE users SET unread_count =
+                            (SELECT COUNT(*) FROM notifications n
+                             WHERE n.user_id = users.id AND n.is_read = 0)''')
+    add_column_if_missing(cursor, 'users', 'data_revision', 'INTEGER NOT NULL DEFAULT 0')
+    add_column_if_missing(cursor, 'users', 'data_modified_at', 'TIMESTAMP')
+    
     # Crops table (enhanced)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS crops (
@@ -72,6 +164,10 @@ def init_db():
         )
     ''')
     
+    # Model version behind each stored prediction (see rescore.py)
+    for column, definition in CROP_SCORE_COLUMNS.items():
+        add_column_if_missing(cursor, 'crops', column, definition)
+    
     # Buyers table (enhanced)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS buyers (
@@ -92,10 +188,19 @@ def init_db():
             rating REAL DEFAULT 0,
             total_transactions INTEGER DEFAULT 0,
             is_verified INTEGER DEFAULT 1,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum REAL NOT NULL DEFAULT 0,
+            decayed_weight REAL NOT NULL DEFAULT 0,
+            decayed_sum REAL NOT NULL DEFAULT 0,
+            decayed_rating REAL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
     
+    # Buyer ledger columns (see ledger.py)
+    ledger_added = [add_column_if_missing(cursor, 'buyers', column, definition)
+                    for column, definition in LEDGER_COLUMNS.items()]
+    
     # Transactions table (NEW)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS transactions (
@@ -153,6 +258,8 @@ def init_db():
             compost_generated REAL,
             status TEXT DEFAULT 'pending',
             qr_code TEXT,
+            food_saved REAL,
+            region TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (crop_id) REFERENCES crops (id),
             FOREIGN KEY (farmer_id) REFERENCES users (id),
@@ -160,6 +267,10 @@ def init_db():
         )
     ''')
     
+    # Recorded impact of each flow (see impact.py)
+    impact_added = [add_column_if_missing(cursor, 'waste_flows', column, definition)
+                    for column, definition in WASTE_FLOW_COLUMNS.items()]
+    
     # Notifications table (NEW)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS notifications (
@@ -189,30 +300,78 @@ def init_db():
         )
     ''')
     
-    # Insert enhanced sample buyers
-    cursor.execute("SELECT COUNT(*) as count FROM buyers")
-    if cursor.fetchone()['count'] == 0:
-        sample_buyers = [
-            ('ABC Pickle Factory', 'Processor', '9988776655', 'abc@factory.com', 'Plot 45, MIDC Area', 'Nashik', 'Maharashtra', '422010', 19.9975, 73.7898, 50, 15, '["tomato", "onion", "chili"]', 4.5, 120),
-            ('Green Valley Processing', 'Processor', '9988776656', 'info@greenvalley.com', 'Kharadi Industrial', 'Pune', 'Maharashtra', '411014', 18.5511, 73.9470, 80, 12, '["tomato", "potato", "cabbage"]', 4.2, 95),
-            ('Fresh Storage Hub', 'Storage', '9988776657', 'storage@fresh.com', 'Cold Chain Complex', 'Nashik', 'Maharashtra', '422011', 20.0063, 73.7630, 100, 1.5, '["all"]', 4.7, 200),
-            ('Hope Food Bank', 'NGO', '9988776658', 'hope@foodbank.org', 'Gandhi Nagar', 'Mumbai', 'Maharashtra', '400001', 18.9388, 72.8354, 30, 0, '["all"]', 4.9, 45),
-            ('Metro Fresh Market', 'Retailer', '9988776659', 'metro@fresh.com', 'Market Yard', 'Pune', 'Maharashtra', '411037', 18.4977, 73.8536, 25, 18, '["tomato", "onion", "cabbage", "cauliflower"]', 4.3, 150),
-            ('EcoCompost Solutions', 'Compost', '9988776660', 'eco@compost.com', 'Industrial Estate', 'Nashik', 'Maharashtra', '422007', 19.9872, 73.7840, 40, 2, '["all"]', 4.4, 80),
-            ('Farm2Table Retail', 'Retailer', '9988776661', 'info@farm2table.com', 'Commercial Street', 'Mumbai', 'Maharashtra', '400020', 18.9647, 72.8258, 35, 20, '["all"]', 4.6, 180),
-            ('Cattle Feed Industries', 'Animal Feed', '9988776662', 'cattle@feed.com', 'Hadapsar', 'Pune', 'Maharashtra', '411028', 18.5018, 73.9263, 60, 3, '["potato", "cabbage", "damaged"]', 4.1, 60),
-            ('Premium Processors Ltd', 'Processor', '9988776663', 'premium@processors.com', 'MIDC Taloja', 'Navi Mumbai', 'Maharashtra', '410208', 19.0330, 73.1030, 100, 16, '["tomato", "chili"]', 4.5, 140),
-            ('Community Cold Storage', 'Storage', '9988776664', 'community@storage.com', 'Viman Nagar', 'Pune', 'Maharashtra', '411014', 18.5679, 73.9143, 75, 1.2, '["all"]', 4.8, 220),
-            ('Organic Waste Solutions', 'Compost', '9988776665', 'organic@waste.com', 'Bhosari', 'Pune', 'Maharashtra', '411026', 18.6298, 73.8502, 50, 2.5, '["all"]', 4.3, 70),
-            ('City Fresh Supermarket', 'Retailer', '9988776666', 'city@fresh.com', 'Deccan Gymkhana', 'Pune', 'Maharashtra', '411004', 18.5196, 73.8553, 30, 19, '["all"]', 4.4, 160),
-        ]
-        cursor.executemany('''INSERT INTO buyers 
-            (name, buyer_type, phone, email, address, city, state, pincode, latitude, longitude, 
-             capacity_tons, price_per_kg, specialty_crops, rating, total_transactions) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', sample_buyers)
+    # Denormalized unread counter on users, maintained by triggers
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notifications_unread_ai AFTER INSERT ON notifications
+        WHEN new.is_read = 0 BEGIN
+            UPDATE users SET unread_count = unread_count + 1 WHERE id = new.user_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notifications_unread_au AFTER UPDATE OF is_read ON notifications
+        WHEN old.is_read != new.is_read BEGIN
+            UPDATE users SET unread_count = unread_count + (CASE WHEN new.is_read = 0 THEN 1 ELSE -1 END)
+            WHERE id = new.user_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notifications_unread_ad AFTER DELETE ON notifications
+        WHEN old.is_read = 0 BEGIN
+            UPDATE users SET unread_count = unread_count - 1 WHERE id = old.user_id;
+        END
+    ''')
+    
+    # Per-user data revision for ETags (see revisions.py)
+    init_revisions(cursor)
+    
+    # Buyer totals and ratings, kept current by triggers on transactions
+    init_ledger(cursor)
+    if any(ledger_added):
+        conn.commit()  # ATTACH can't run inside a transaction
+        recompute_ledger(attach_archive(conn, path or DATABASE))
+    
+    # Farmer, region and platform impact, kept current by triggers on waste_flows
+    init_impact(cursor)
+    if any(impact_added):
+        rebuild_impact(conn)
+    
+    # Daily/weekly/monthly price rollups per crop and city, kept current by triggers on transactions
+    if init_prices(cursor):
+        conn.commit()  # ATTACH can't run inside a transaction
+        rebuild_prices(attach_archive(conn, path or DATABASE))
+    
+    # Live event log for Server-Sent Events
+    init_events(cursor)
+    
+    # Change log behind /api/sync; a new log starts with an entry for every existing row
+    if init_changelog(cursor):
+        conn.commit()  # ATTACH can't run inside a transaction
+        rebuild_changelog(attach_archive(conn, path or DATABASE))
+    
+    # Full-text search indexes (FTS5, kept in sync by triggers)
+    init_search(cursor)
+    
+    # Indexes
+    create_export_indexes(cursor)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications(user_id, is_read, created_at)')
+    
+    # Harvest reminder bookkeeping
+    init_scheduler(cursor)
+    
+    # Progress of prediction re-scoring jobs
+    init_rescore(cursor)
+    
+    # Fragment cache invalidation counters
+    init_generations(cursor)
     
     conn.commit()
     conn.close()
+    if path:
+        return
+    
+    # PostgreSQL schema (a no-op on SQLite) or shard directory, then the sample buyers on any backend
+    storage.init_schema()
+    storage.seed_buyers(SAMPLE_BUYERS)
 
 #init_db()
 
@@ -227,6 +386,15 @@ def init_db():
 
 # Login required decorator
 def login_required(f):
+    if asyncio.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_coroutine(*args, **kwargs):
+            if 'user_id' not in session:
+                flash('Please login to access this page.', 'warning')
+                return redirect(url_for('login'))
+            return await f(*args, **kwargs)
+        return decorated_coroutine
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
@@ -238,23 +406,21 @@ def login_required(f):
 # Helper Functions
 def create_notification(user_id, title, message, notification_type='info', action_url=None):
     """Create a notification for user"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''INSERT INTO notifications (user_id, title, message, type, action_url)
-                     VALUES (?, ?, ?, ?, ?)''',
-                  (user_id, title, message, notification_type, action_url))
-    conn.commit()
-    conn.close()
+    storage.create_notification(user_id, title, message, notification_type, action_url)
+    get_broker(user_id).wake(user_id)
 
 def get_unread_notifications(user_id):
-    """Get unread notifications count"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) as count FROM notifications WHERE user_id = ? AND is_read = 0',
-                  (user_id,))
-    count = cursor.fetchone()['count']
-    conn.close()
-    return count
+    """Get unread notifications count (one primary-key read, memoized per request)"""
+    if 'unread_count' not in g:
+        g.unread_count = storage.unread_count(user_id)
+    return g.unread_count
+
+@app.context_processor
+def inject_unread_count():
+    """Unread badge for the navbar on every page"""
+    if 'user_id' not in session:
+        return {}
+    return {'unread_count': get_unread_notifications(session['user_id'])}
 
 def predict_yield_advanced(crop_name, area, soil_type, season, irrigation):
     """Enhanced prediction using ML module"""
@@ -308,31 +474,17 @@ def get_weather_forecast(location):
 # ==================== ROUTES ====================
 
 @app.route('/')
-def home():
+async def home():
     """Enhanced homepage"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) as count FROM users WHERE user_type = "farmer"')
-    total_farmers = cursor.fetchone()['count']
-    
-    cursor.execute('SELECT COUNT(*) as count FROM crops')
-    total_crops = cursor.fetchone()['count']
+    totals = await reader.run(storage.platform_totals)
     
-    cursor.execute('SELECT SUM(predicted_surplus) as total FROM crops WHERE predicted_surplus IS NOT NULL')
-    result = cursor.fetchone()
-    total_surplus = result['total'] if result['total'] else 0
-    
-    cursor.execute('SELECT COUNT(*) as count FROM transactions')
-    total_transactions = cursor.fetchone()['count']
-    
-    conn.close()
+    total_surplus = totals['surplus'] if totals['surplus'] else 0
     
     return render_template('home.html',
-                         total_farmers=total_farmers,
-                         total_crops=total_crops,
+                         total_farmers=totals['farmers'],
+                         total_crops=totals['crops'],
                          total_surplus=round(total_surplus, 2),
-                         total_transactions=total_transactions)
+                         total_transactions=totals['transactions'])
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -354,18 +506,15 @@ def register():
             flash('Password must be at least 6 characters.', 'danger')
             return render_template('register.html')
         
-        hashed_password = generate_password_hash(password)
-        
-        conn = get_db()
-        cursor = conn.cursor()
+        try:
+            hashed_password = hash_password(password)
+        except LoginThrottled as e:
+            flash(str(e), 'warning')
+            return render_template('register.html'), 503, {'Retry-After': str(e.retry_after)}
         
         try:
-            cursor.execute('''INSERT INTO users 
-                            (username, email, password, phone, full_name, city, state, last_login)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                         (username, email, hashed_password, phone, full_name, city, state, datetime.now()))
-            conn.commit()
-            user_id = cursor.lastrowid
+            user_id = storage.create_user(username, email, hashed_password, phone, full_name,
+                                          city, state, datetime.now())
             
             create_notification(user_id, 
                               'Welcome to Surplus-to-Sustain! 🌾',
@@ -375,7 +524,7 @@ def register():
             
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
-        except sqlite3.IntegrityError as e:
+        except IntegrityError as e:
             if 'username' in str(e):
                 flash('Username already exists. Please choose another.', 'danger')
             elif 'email' in str(e):
@@ -384,8 +533,6 @@ def register():
                 flash('Registration failed. Please try again.', 'danger')
         except Exception as e:
             flash(f'An error occurred: {str(e)}', 'danger')
-        finally:
-            conn.close()
     
     return render_template('register.html')
 
@@ -393,18 +540,26 @@ def register():
 def login():
     """Enhanced login"""
     if request.method == 'POST':
-        username = request.form['username']
+        username = request.form['username'].strip()
         password = request.form['password']
         
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ? OR email = ?', (username, username))
-        user = cursor.fetchone()
+        try:
+            admit_login(request.remote_addr or '', username)
+        except LoginThrottled as e:
+            flash(str(e), 'warning')
+            return render_template('login.html'), 429, {'Retry-After': str(e.retry_after)}
+        
+        user = storage.find_user_for_login(username)
         
-        if user and check_password_hash(user['password'], password):
-            cursor.execute('UPDATE users SET last_login = ? WHERE id = ?',
-                         (datetime.now(), user['id']))
-            conn.commit()
+        try:
+            valid = bool(user) and verify_password(user['password'], password)
+            new_hash = hash_password(password) if valid and needs_rehash(user['password']) else None
+        except LoginThrottled as e:
+            flash(str(e), 'warning')
+            return render_template('login.html'), 503, {'Retry-After': str(e.retry_after)}
+        
+        if valid:
+            storage.record_login(user['id'], datetime.now(), new_hash)
             
             session['user_id'] = user['id']
             session['username'] = user['username']
@@ -415,8 +570,6 @@ def login():
             return redirect(url_for('dashboard'))
         else:
             flash('Invalid username or password.', 'danger')
-        
-        conn.close()
     
     return render_template('login.html')
 
@@ -428,40 +581,14 @@ def logout():
 
 @app.route('/dashboard')
 @login_required
-def dashboard():
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''SELECT * FROM crops WHERE farmer_id = ? 
-                     ORDER BY created_at DESC LIMIT 6''', 
-                  (session['user_id'],))
-    crops = cursor.fetchall()
-    
-    cursor.execute('''SELECT 
-                        COUNT(*) as total_crops,
-                        SUM(predicted_surplus) as total_surplus,
-                        SUM(CASE WHEN predicted_surplus > 3 THEN 1 ELSE 0 END) as high_surplus_count,
-                        SUM(predicted_yield) as total_yield
-                      FROM crops WHERE farmer_id = ?''',
-                  (session['user_id'],))
-    stats = cursor.fetchone()
-    
-    cursor.execute('''SELECT t.*, b.name as buyer_name, c.crop_name
-                     FROM transactions t
-                     JOIN buyers b ON t.buyer_id = b.id
-                     JOIN crops c ON t.crop_id = c.id
-                     WHERE t.farmer_id = ?
-                     ORDER BY t.created_at DESC LIMIT 5''',
-                  (session['user_id'],))
-    transactions = cursor.fetchall()
-    
-    cursor.execute('''SELECT * FROM notifications 
-                     WHERE user_id = ? AND is_read = 0
-                     ORDER BY created_at DESC LIMIT 5''',
-                  (session['user_id'],))
-    notifications = cursor.fetchall()
-    
-    conn.close()
+@conditional(storage)
+async def dashboard():
+    user_id = session['user_id']
+    crops, stats, transactions, notifications = await asyncio.gather(
+        reader.run(storage.recent_crops, user_id, 6),
+        reader.run(storage.crop_totals, user_id),
+        reader.run(storage.recent_transactions, user_id, 5),
+        reader.run(storage.unread_notifications, user_id, 5))
     
     total_surplus = stats['total_surplus'] or 0
     total_saved = total_surplus * 0.75
@@ -477,12 +604,12 @@ def dashboard():
                          co2_prevented=round(co2_prevented, 2),
                          extra_income=round(extra_income, 0),
                          transactions=transactions,
-                         notifications=notifications,
-                         unread_count=len(notifications))
+                         notifications=notifications)
 
 @app.route('/add_crop', methods=['GET', 'POST'])
 @login_required
-def add_crop():
+@admission.slot('inference', methods=('POST',))
+async def add_crop():
     if request.method == 'POST':
         crop_name = request.form['crop_name']
         variety = request.form.get('variety', '')
@@ -495,22 +622,15 @@ def add_crop():
         notes = request.form.get('notes', '')
         
         expected_harvest_date = calculate_expected_harvest_date(planting_date, crop_name)
-        predicted_yield = predict_yield_advanced(crop_name, area, soil_type, season, irrigation_type)
+        predicted_yield = await run_inference(predict_yield_advanced, crop_name, area, soil_type, season, irrigation_type)
         predicted_surplus = max(0, predicted_yield - expected_consumption)
         
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO crops (farmer_id, crop_name, variety, area, planting_date, 
-                             expected_harvest_date, soil_type, irrigation_type, season,
-                             expected_consumption, predicted_yield, predicted_surplus, notes, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (session['user_id'], crop_name, variety, area, planting_date, 
-              expected_harvest_date, soil_type, irrigation_type, season,
-              expected_consumption, predicted_yield, predicted_surplus, notes, 'planned'))
-        conn.commit()
-        crop_id = cursor.lastrowid
-        conn.close()
+        crop_id = storage.add_crop(session['user_id'], crop_name=crop_name, variety=variety, area=area,
+                                   planting_date=planting_date, expected_harvest_date=expected_harvest_date,
+                                   soil_type=soil_type, irrigation_type=irrigation_type, season=season,
+                                   expected_consumption=expected_consumption, predicted_yield=predicted_yield,
+                                   predicted_surplus=predicted_surplus, model_version=get_model_version(),
+                                   notes=notes, status='planned')
         
         if predicted_surplus > 3:
             create_notification(session['user_id'],
@@ -526,39 +646,20 @@ def add_crop():
 
 @app.route('/crop/<int:crop_id>')
 @login_required
-def crop_detail(crop_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM crops WHERE id = ? AND farmer_id = ?', 
-                  (crop_id, session['user_id']))
-    crop = cursor.fetchone()
+@conditional(storage)
+async def crop_detail(crop_id):
+    crop = await reader.run(storage.get_crop, crop_id, session['user_id'])
     
     if not crop:
         flash('Crop not found.', 'danger')
         return redirect(url_for('dashboard'))
     
-    specialty_filter = f'%"{crop["crop_name"]}"%'
-    cursor.execute('''SELECT * FROM buyers 
-                     WHERE (specialty_crops LIKE ? OR specialty_crops LIKE '%"all"%')
-                     AND is_verified = 1
-                     ORDER BY rating DESC, total_transactions DESC
-                     LIMIT 8''',
-                  (specialty_filter,))
-    buyers = cursor.fetchall()
-    
-    cursor.execute('''SELECT t.*, b.name as buyer_name
-                     FROM transactions t
-                     JOIN buyers b ON t.buyer_id = b.id
-                     WHERE t.crop_id = ?
-                     ORDER BY t.created_at DESC''',
-                  (crop_id,))
-    transactions = cursor.fetchall()
+    # Only queried if the cached buyer cards for this crop are missing or stale
+    buyers = Deferred(storage.matching_buyers, crop['crop_name'])
+    transactions = await reader.run(storage.crop_transactions, crop_id, session['user_id'])
     
     weather = get_weather_forecast(crop['crop_name'])
     
-    conn.close()
-    
     surplus = crop['predicted_surplus'] or 0
     if surplus > 3:
         surplus_level = 'HIGH'
@@ -594,44 +695,41 @@ def crop_detail(crop_id):
                          surplus_class=surplus_class,
                          recommendations=recommendations)
 
+@app.route('/api/crops/<int:crop_id>/scenarios')
+@login_required
+@admission.slot('inference')
+async def api_crop_scenarios(crop_id):
+    """
+    What-if table for a crop: every soil/season/irrigation/area/weather
+    alternative scored in one batch, best ?ranking= first (fit, surplus
+    or yield), ?limit= rows
+    """
+    crop = await reader.run(storage.get_crop, crop_id, session['user_id'])
+    if not crop:
+        return jsonify({'error': 'Crop not found'}), 404
+    ranking = request.args.get('ranking', 'fit')
+    if ranking not in RANKINGS:
+        return jsonify({'error': f'ranking must be one of {", ".join(RANKINGS)}'}), 400
+    limit = min(max(request.args.get('limit', SCENARIO_LIMIT, type=int), 1), 1000)
+    
+    weather = get_weather_forecast(crop['crop_name'])
+    return jsonify(await run_inference(explore, crop, weather, ranking, limit))
+
 @app.route('/crops')
 @login_required
+@conditional(storage, buyers=False)
 def crop_list():
     filter_status = request.args.get('status', 'all')
     sort_by = request.args.get('sort', 'recent')
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = 'SELECT * FROM crops WHERE farmer_id = ?'
-    params = [session['user_id']]
-    
-    if filter_status != 'all':
-        query += ' AND status = ?'
-        params.append(filter_status)
-    
-    if sort_by == 'recent':
-        query += ' ORDER BY created_at DESC'
-    elif sort_by == 'surplus_high':
-        query += ' ORDER BY predicted_surplus DESC'
-    elif sort_by == 'harvest_date':
-        query += ' ORDER BY expected_harvest_date ASC'
-    
-    cursor.execute(query, params)
-    crops = cursor.fetchall()
-    conn.close()
+    crops = storage.list_crops(session['user_id'], None if filter_status == 'all' else filter_status, sort_by)
     
     return render_template('crop_list.html', crops=crops, filter_status=filter_status, sort_by=sort_by)
 
 @app.route('/delete_crop/<int:crop_id>')
 @login_required
 def delete_crop(crop_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM crops WHERE id = ? AND farmer_id = ?', 
-                  (crop_id, session['user_id']))
-    conn.commit()
-    conn.close()
+    storage.delete_crop(crop_id, session['user_id'])
     
     flash('Crop deleted successfully.', 'info')
     return redirect(url_for('crop_list'))
@@ -640,101 +738,188 @@ def delete_crop(crop_id):
 @login_required
 def profile():
     """User profile page"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],))
-    user = cursor.fetchone()
-    conn.close()
+    user = storage.get_user(session['user_id'])
     return render_template('profile.html', user=user)
 
 @app.route('/buyers')
 @login_required
-def buyers_list():
+async def buyers_list():
     """Buyers list page"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM buyers WHERE is_verified = 1 ORDER BY rating DESC')
-    buyers = cursor.fetchall()
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    has_more = False
+    
+    if query:
+        buyers, has_more = await reader.call(search, session['user_id'], query, 'buyers', page,
+                                             db_path=storage.sqlite_path(session['user_id']))
+    else:
+        buyers = Deferred(storage.verified_buyers)
+    return render_template('buyers_list.html', buyers=buyers, query=query, page=page, has_more=has_more)
+
+@app.route('/search')
+@login_required
+def search_page():
+    """Search buyers, crops and notifications"""
+    query = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'buyers')
+    page = request.args.get('page', 1, type=int)
+    if scope not in SEARCH_SCOPES:
+        scope = 'buyers'
+    
+    conn = get_user_db(session['user_id'])
+    results, has_more = search(conn, session['user_id'], query, scope, page)
     conn.close()
-    return render_template('buyers_list.html', buyers=buyers)
+    
+    return render_template('search.html', query=query, scope=scope, page=page,
+                         results=results, has_more=has_more, scopes=SEARCH_SCOPES)
+
+IMPACT_TOTALS = ('flows', 'quantity_tons', 'food_saved', 'co2_saved', 'compost_generated')
+
+def impact_totals(row):
+    """Rollup values rounded for display; zeros before the first completed flow"""
+    return {name: round(row[name], 2) if row else 0 for name in IMPACT_TOTALS}
 
 @app.route('/impact')
 @login_required
 def impact():
-    """Impact dashboard page"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Impact dashboard page, from the farmer's recorded waste flows"""
+    totals = impact_totals(storage.impact_rollup('farmer', session['user_id']))
+    stats = storage.crop_totals(session['user_id'])
+    flows = storage.list_waste_flows(session['user_id'], limit=20)
     
-    cursor.execute('''SELECT 
-                        SUM(predicted_surplus) as total_surplus,
-                        COUNT(*) as total_crops
-                      FROM crops WHERE farmer_id = ?''',
-                  (session['user_id'],))
-    stats = cursor.fetchone()
+    return render_template('impact.html',
+                         food_saved=totals['food_saved'],
+                         co2_prevented=totals['co2_saved'],
+                         compost_generated=totals['compost_generated'],
+                         completed_flows=totals['flows'],
+                         total_crops=stats['total_crops'],
+                         flows=flows)
+
+@app.route('/impact/platform')
+def platform_impact():
+    """Public impact page: platform totals and the leading regions"""
+    totals = impact_totals(storage.impact_rollup('platform', ''))
+    regions = storage.impact_regions()
+    return render_template('platform_impact.html', totals=totals, regions=regions)
+
+@app.route('/api/impact')
+@login_required
+def api_impact():
+    return jsonify(impact_totals(storage.impact_rollup('farmer', session['user_id'])))
+
+@app.route('/api/impact/platform')
+def api_platform_impact():
+    return jsonify({
+        'platform': impact_totals(storage.impact_rollup('platform', '')),
+        'regions': [dict(impact_totals(row), region=row['scope_key']) for row in storage.impact_regions()]
+    }), 200, {'Cache-Control': 'public, max-age=60'}
+
+@app.route('/api/waste_flows', methods=['GET', 'POST'])
+@login_required
+@admission.slot('bulk_write', methods=('POST',))
+def api_waste_flows():
+    """List the farmer's waste flows, or record one or a batch of them"""
+    if request.method == 'GET':
+        status = request.args.get('status') or None
+        if status and status not in FLOW_STATUSES:
+            return jsonify({'error': f'status must be one of {", ".join(FLOW_STATUSES)}'}), 400
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        return jsonify([dict(row) for row in storage.list_waste_flows(session['user_id'], status, limit)])
     
-    conn.close()
+    payload = request.get_json(silent=True)
+    items = payload if isinstance(payload, list) else [payload] if isinstance(payload, dict) else []
+    if not items or len(items) > MAX_FLOWS_PER_REQUEST:
+        return jsonify({'error': f'send a flow or a list of 1-{MAX_FLOWS_PER_REQUEST} flows as JSON',
+                        'waste_types': list(DISPOSITIONS)}), 400
+    flows = []
+    for i, item in enumerate(items):
+        try:
+            flows.append(parse_flow(item))
+        except ValueError as e:
+            return jsonify({'error': f'flow {i}: {e}'}), 400
     
-    total_surplus = stats['total_surplus'] or 0
-    food_saved = total_surplus * 0.75
-    co2_prevented = food_saved * 2.5
-    compost_generated = total_surplus * 0.15
+    ids = storage.record_waste_flows(session['user_id'], flows)
+    if ids is None:
+        return jsonify({'error': 'Crop or destination not found'}), 404
+    return jsonify({
+        'flows': [{'id': flow_id, 'qr_code': flow['qr_code'], 'status': flow['status'],
+                   'food_saved': flow['food_saved'], 'co2_saved': flow['co2_saved'],
+                   'compost_generated': flow['compost_generated']}
+                  for flow_id, flow in zip(ids, flows)],
+        'labels_url': url_for('waste_labels', ids=','.join(map(str, ids[:MAX_LABELS])))
+    }), 201
+
+@app.route('/api/waste_flows/<int:flow_id>/status', methods=['POST'])
+@login_required
+def update_waste_flow_status(flow_id):
+    """Complete or cancel a flow; the rollups follow in the same write"""
+    status = (request.get_json(silent=True) or request.form).get('status', '')
+    if status not in FLOW_STATUSES:
+        return jsonify({'error': f'status must be one of {", ".join(FLOW_STATUSES)}'}), 400
+    processing_date = datetime.now().strftime('%Y-%m-%d') if status == 'completed' else None
+    if not storage.set_waste_flow_status(flow_id, session['user_id'], status, processing_date):
+        return jsonify({'error': 'Waste flow not found or already ' + status}), 404
+    return jsonify({'id': flow_id, 'status': status})
+
+@app.route('/waste/labels.pdf')
+@login_required
+@admission.slot('export')
+def waste_labels():
+    """Printable QR labels for a batch of the farmer's flows (?ids=1,2,3)"""
+    try:
+        ids = sorted({int(part) for part in request.args.get('ids', '').split(',') if part.strip()})
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of waste flow ids'}), 400
+    if not ids or len(ids) > MAX_LABELS:
+        return jsonify({'error': f'choose 1-{MAX_LABELS} waste flows'}), 400
     
-    return render_template('impact.html',
-                         food_saved=round(food_saved, 2),
-                         co2_prevented=round(co2_prevented, 2),
-                         compost_generated=round(compost_generated, 2),
-                         total_crops=stats['total_crops'])
+    flows = storage.label_waste_flows(session['user_id'], ids, new_qr_code)
+    if not flows:
+        return jsonify({'error': 'Waste flows not found'}), 404
+    pdf = render_labels(flows, lambda code: url_for('trace_waste_flow', qr_code=code, _external=True))
+    return Response(pdf, mimetype='application/pdf',
+                    headers={'Content-Disposition': 'inline; filename=waste_labels.pdf'})
+
+@app.route('/api/waste_flows/trace/<qr_code>')
+def trace_waste_flow(qr_code):
+    """Public: what a scanned label refers to"""
+    flow = storage.trace_waste_flow(qr_code)
+    if flow is None:
+        return jsonify({'error': 'Unknown label'}), 404
+    return jsonify(dict(flow))
 
 @app.route('/notifications')
 @login_required
 def notifications_page():
     """Notifications page"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT * FROM notifications 
-                     WHERE user_id = ?
-                     ORDER BY created_at DESC''',
-                  (session['user_id'],))
-    notifications = cursor.fetchall()
-    conn.close()
+    notifications = storage.list_notifications(session['user_id'])
     return render_template('notifications.html', notifications=notifications)
 
 @app.route('/mark_notification_read/<int:notification_id>')
 @login_required
 def mark_notification_read(notification_id):
     """Mark notification as read"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE notifications SET is_read = 1 WHERE id = ? AND user_id = ?',
-                  (notification_id, session['user_id']))
-    conn.commit()
-    conn.close()
+    storage.mark_notification_read(notification_id, session['user_id'])
+    return redirect(url_for('notifications_page'))
+
+@app.route('/mark_all_notifications_read')
+@login_required
+def mark_all_notifications_read():
+    """Mark every notification as read; the counter triggers run in the same transaction"""
+    storage.mark_all_notifications_read(session['user_id'])
     return redirect(url_for('notifications_page'))
 
 @app.route('/transactions')
 @login_required
 def transactions():
-    """Transactions page"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT t.*, b.name as buyer_name, c.crop_name
-                     FROM transactions t
-                     JOIN buyers b ON t.buyer_id = b.id
-                     JOIN crops c ON t.crop_id = c.id
-                     WHERE t.farmer_id = ?
-                     ORDER BY t.created_at DESC''',
-                  (session['user_id'],))
-    transactions = cursor.fetchall()
-    conn.close()
+    """Transactions page, including archived transactions"""
+    transactions = storage.transaction_history(session['user_id'])
     return render_template('transactions.html', transactions=transactions)
 
 @app.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
     """Edit profile page"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
     if request.method == 'POST':
         full_name = request.form.get('full_name', '').strip()
         email = request.form.get('email', '').strip()
@@ -744,19 +929,12 @@ def edit_profile():
         state = request.form.get('state', '').strip()
         pincode = request.form.get('pincode', '').strip()
         
-        cursor.execute('''UPDATE users 
-                         SET full_name = ?, email = ?, phone = ?, address = ?, city = ?, state = ?, pincode = ?
-                         WHERE id = ?''',
-                      (full_name, email, phone, address, city, state, pincode, session['user_id']))
-        conn.commit()
-        conn.close()
+        storage.update_profile(session['user_id'], full_name, email, phone, address, city, state, pincode)
         
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
-    cursor.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],))
-    user = cursor.fetchone()
-    conn.close()
+    user = storage.get_user(session['user_id'])
     return render_template('edit_profile.html', user=user)
 
 @app.route('/update_crop_status/<int:crop_id>/<status>')
@@ -768,31 +946,242 @@ def update_crop_status(crop_id, status):
         flash('Invalid status.', 'danger')
         return redirect(url_for('crop_detail', crop_id=crop_id))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE crops SET status = ?, updated_at = ? WHERE id = ? AND farmer_id = ?',
-                  (status, datetime.now(), crop_id, session['user_id']))
-    conn.commit()
-    conn.close()
+    storage.set_crop_status(crop_id, session['user_id'], status, datetime.now())
+    get_broker(session['user_id']).wake(session['user_id'])
     
     flash(f'Crop status updated to {status}!', 'success')
     return redirect(url_for('crop_detail', crop_id=crop_id))
 
+@app.route('/crop/<int:crop_id>/sell', methods=['POST'])
+@login_required
+def record_sale(crop_id):
+    """Record a sale of this crop to one of the matched buyers"""
+    try:
+        buyer_id = int(request.form['buyer_id'])
+        quantity = float(request.form['quantity_tons'])
+        price = float(request.form['price_per_kg'])
+    except (KeyError, ValueError):
+        flash('Choose a buyer and enter the quantity and price.', 'danger')
+        return redirect(url_for('crop_detail', crop_id=crop_id))
+    if quantity <= 0 or price < 0:
+        flash('Quantity must be positive and price cannot be negative.', 'danger')
+        return redirect(url_for('crop_detail', crop_id=crop_id))
+    
+    transaction_id = storage.record_transaction(session['user_id'], crop_id, buyer_id, quantity, price,
+                                                request.form.get('delivery_date') or None)
+    if transaction_id is None:
+        flash('Crop or buyer not found.', 'danger')
+    else:
+        flash(f'Sale #{transaction_id} recorded: {quantity:g} tons at ₹{price:g}/kg.', 'success')
+    return redirect(url_for('crop_detail', crop_id=crop_id))
+
+@app.route('/transactions/<int:transaction_id>/status', methods=['POST'])
+@login_required
+def update_transaction_status(transaction_id):
+    """Complete or cancel a transaction; the buyer's ledger follows in the same write"""
+    status = request.form.get('status', '')
+    if status not in TRANSACTION_STATUSES:
+        flash('Invalid status.', 'danger')
+    elif storage.set_transaction_status(transaction_id, session['user_id'], status):
+        flash(f'Transaction #{transaction_id} marked {status}.', 'success')
+    else:
+        flash('Transaction not found.', 'danger')
+    return redirect(url_for('transactions'))
+
+@app.route('/transactions/<int:transaction_id>/rate', methods=['POST'])
+@login_required
+def rate_transaction(transaction_id):
+    """Rate the buyer of a completed transaction (1-5)"""
+    rating = request.form.get('rating', type=int)
+    if rating not in range(1, 6):
+        flash('Rating must be between 1 and 5.', 'danger')
+    elif storage.rate_transaction(transaction_id, session['user_id'], rating,
+                                  request.form.get('review', '').strip() or None):
+        flash('Thanks! Your rating has been recorded.', 'success')
+    else:
+        flash('Only your completed transactions can be rated.', 'warning')
+    return redirect(url_for('transactions'))
+
+@app.route('/events')
+@login_required
+def events():
+    """Server-Sent Events stream of the user's notifications and crop updates"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    stream = event_stream(get_broker(session['user_id']), session['user_id'], last_event_id)
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # API Endpoints
 @app.route('/api/crop_stats')
 @login_required
-def api_crop_stats():
-    conn = get_db()
-    cursor = conn.cursor()
+@conditional(storage, buyers=False)
+async def api_crop_stats():
+    data = await reader.run(storage.crop_summary, session['user_id'])
+    
+    return jsonify([dict(row) for row in data])
+
+@app.route('/api/prices/<crop>')
+@login_required
+def api_prices(crop):
+    """
+    Price history of a crop (?city= for one market) as OHLC/volume points
+    
+    ?from= and ?to= bound the range (default: the last year); the resolution
+    is the coarsest giving at least ?points= points, unless ?resolution= is set.
+    """
+    try:
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else date.today()
+        start = (datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from')
+                 else end - timedelta(days=365))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if start > end:
+        return jsonify({'error': 'from must not be after to'}), 400
+    points = min(max(request.args.get('points', DEFAULT_POINTS, type=int), 1), MAX_POINTS)
+    resolution = request.args.get('resolution') or choose_resolution(start, end, points)
+    if resolution not in PRICE_RESOLUTIONS:
+        return jsonify({'error': f'resolution must be one of {", ".join(PRICE_RESOLUTIONS)}'}), 400
+    city = request.args.get('city', '').strip() or None
+    
+    rows = storage.price_rollups(crop.strip().lower(), resolution, bucket_start(start, resolution).isoformat(),
+                                 end.isoformat(), city)
+    return jsonify({
+        'crop': crop.strip().lower(),
+        'city': city,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'resolution': resolution,
+        'points': merge_buckets(rows)
+    })
+
+@app.route('/api/metrics')
+@login_required
+def api_metrics():
+    """Operational counters for this worker process"""
+    rescore = storage.rescore_progress(get_model_version())
+    return jsonify({
+        'compression': compression_stats(),
+        'fragment_cache': fragments.report(),
+        'scenario_cache': scenario_cache.report(),
+        'rescore': dict(rescore) if rescore else None,
+        'admission': admission.report()
+    })
+
+@app.route('/api/drift')
+@login_required
+def api_drift():
+    """Input and prediction drift against the training profile, for this worker process"""
+    windows = request.args.get('windows', type=int)
+    return jsonify(get_drift_report(max(windows, 1) if windows else None))
+
+@app.route('/api/sync')
+@login_required
+def api_sync():
+    """The next batch of rows changed after ?since=<seq>, for offline clients (see changelog.py)"""
+    since = request.args.get('since', 0, type=int)
+    if since < 0:
+        return jsonify({'error': 'since must be a sequence number'}), 400
+    user_storage = storage.for_user(session['user_id'])
+    if not isinstance(user_storage, SQLiteStorage):
+        return jsonify({'error': 'Sync needs the SQLite or sharded backend'}), 501
+    return jsonify(changes_since(user_storage, session['user_id'], since))
+
+@app.route('/export/<dataset>.<fmt>')
+@login_required
+@admission.slot('export')
+def export_data(dataset, fmt):
+    """Stream crops or transactions as NDJSON, CSV or XLSX"""
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'Unknown export'}), 404
     
-    cursor.execute('''SELECT crop_name, COUNT(*) as count, SUM(predicted_surplus) as surplus
-                     FROM crops WHERE farmer_id = ?
-                     GROUP BY crop_name''',
-                  (session['user_id'],))
-    data = cursor.fetchall()
+    date_from = request.args.get('from') or None
+    date_to = request.args.get('to') or None
+    status = request.args.get('status') or None
+    try:
+        for value in (date_from, date_to):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    # No Content-Length, so the server sends the body with chunked transfer encoding
+    chunks = stream_export(storage.for_user(session['user_id']), dataset, fmt, session['user_id'],
+                           date_from, date_to, status)
+    filename = f'{dataset}_{datetime.now().strftime("%Y%m%d")}.{fmt}'
+    return Response(stream_with_context(chunks),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/reports/<kind>', methods=['POST'])
+@login_required
+def request_report(kind):
+    """Queue a PDF report; returns a job id to poll"""
+    if kind not in REPORT_KINDS:
+        return jsonify({'error': 'Unknown report'}), 404
+    
+    conn = get_user_db(session['user_id'])
+    try:
+        job_id, status = submit_report(conn, kind, session['user_id'], storage.sqlite_path(session['user_id']))
+    except ReportLimitError as e:
+        return jsonify({'error': str(e)}), e.status_code, {'Retry-After': '5'}
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'job_id': job_id,
+        'status': status,
+        'status_url': url_for('report_job', job_id=job_id),
+        'download_url': url_for('download_report', job_id=job_id)
+    }), 200 if status == 'done' else 202
+
+@app.route('/reports/job/<job_id>')
+@login_required
+def report_job(job_id):
+    if not job_id.startswith(f"{session['user_id']}-"):
+        return jsonify({'error': 'Report not found'}), 404
+    status = report_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Report not found'}), 404
+    return jsonify({'job_id': job_id, 'status': status,
+                    'status_url': url_for('report_job', job_id=job_id),
+                    'download_url': url_for('download_report', job_id=job_id)})
+
+@app.route('/reports/job/<job_id>/download')
+@login_required
+def download_report(job_id):
+    if not job_id.startswith(f"{session['user_id']}-") or report_status(job_id) != 'done':
+        flash('Report not available.', 'warning')
+        return redirect(url_for('dashboard'))
+    kind = job_id.split('-')[1]
+    return send_file(os.path.abspath(report_path(job_id)), mimetype='application/pdf',
+                     as_attachment=True, download_name=f'{kind}_statement.pdf')
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    query = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'buyers')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    if scope not in SEARCH_SCOPES:
+        return jsonify({'error': f'scope must be one of {", ".join(SEARCH_SCOPES)}'}), 400
+    
+    conn = get_user_db(session['user_id'])
+    results, has_more = search(conn, session['user_id'], query, scope, page, per_page)
     conn.close()
     
-    return jsonify([dict(row) for row in data])
+    return jsonify({
+        'query': query,
+        'scope': scope,
+        'page': page,
+        'has_more': has_more,
+        'results': [dict(row) for row in results]
+    })
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
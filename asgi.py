@@ -0,0 +1,143 @@
+"""
+ASGI Entry Point for Surplus-to-Sustain
+
+    uvicorn asgi:asgi_app --workers 4 --port 8000
+
+The hot read routes (home, dashboard, crop_detail, buyers_list and
+/api/crop_stats) are async views: their queries run concurrently on the
+reader pool in aiodb.py and predictions run on the inference executor.
+The same app still runs under the sync deployment (`gunicorn app:app`).
+
+Flask itself is a WSGI framework, so the ASGI server hands each request to
+a pool of ASGI_WORKER_THREADS threads (a2wsgi). asgiref's WsgiToAsgi is not
+used: it pins every request to a single thread.
+
+/events is the exception. An SSE stream stays open for as long as the tab
+does, so through the pool every open tab would hold one of those threads
+and a few dozen tabs would starve every other route. Signed-in /events
+requests are served here on the event loop (events.async_event_stream);
+anything else, including the login redirect, goes through Flask.
+
+Benchmark both deployments with the same load (start the server with
+ADMISSION_ENABLED=0, or admission.py's rate limits shed most of it):
+
+    python asgi.py http://localhost:8000 --username farmer1 --password secret123
+"""
+
+import asyncio
+import io
+import os
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import session
+
+from app import app, get_broker
+from events import async_event_stream
+
+wsgi_app = WSGIMiddleware(app, workers=int(os.environ.get('ASGI_WORKER_THREADS', 32)))
+
+SSE_HEADERS = [(b'content-type', b'text/event-stream; charset=utf-8'),
+               (b'cache-control', b'no-cache'),
+               (b'x-accel-buffering', b'no')]
+
+
+async def asgi_app(scope, receive, send):
+    if scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] == '/events':
+        if await events(scope, receive, send):
+            return
+    await wsgi_app(scope, receive, send)
+
+
+async def events(scope, receive, send):
+    """The /events route on the event loop; False (nothing sent) if not signed in"""
+    with app.request_context(build_environ(scope, io.BytesIO())) as ctx:
+        user_id = session.get('user_id')
+        last_event_id = ctx.request.headers.get('Last-Event-ID') or ctx.request.args.get('last_event_id')
+    if not user_id:
+        return False
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+    stream = async_event_stream(get_broker(user_id), user_id, last_event_id)
+
+    async def pump():
+        async for frame in stream:
+            await send({'type': 'http.response.body', 'body': frame.encode(), 'more_body': True})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    streaming, disconnect = asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait((streaming, disconnect), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, disconnect):
+            task.cancel()
+        await asyncio.gather(streaming, disconnect, return_exceptions=True)
+        await stream.aclose()
+    if not disconnect.cancelled():
+        return True
+    # The stream failed while the client was still there: end the response
+    await send({'type': 'http.response.body', 'body': b''})
+    return True
+
+
+def benchmark(base_url, username, password, concurrency=(1, 16, 64), requests_per_level=500,
+              paths=('/', '/dashboard', '/buyers', '/api/crop_stats')):
+    """Requests/sec and latency percentiles at several concurrency levels"""
+    import statistics
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.post(f'{base_url}/login', data={'username': username, 'password': password})
+        return local.session
+
+    def hit(i):
+        start = time.perf_counter()
+        response = client().get(base_url + paths[i % len(paths)], allow_redirects=False)
+        return time.perf_counter() - start, response.status_code
+
+    print(f"Target: {base_url}  paths: {', '.join(paths)}")
+    print(f"\n{'clients':>8}{'req/sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    print("-" * 46)
+    for clients in concurrency:
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(hit, range(clients)))  # log in every client first
+            start = time.perf_counter()
+            results = list(pool.map(hit, range(requests_per_level)))
+            elapsed = time.perf_counter() - start
+        latencies = sorted(r[0] * 1000 for r in results)
+        errors = sum(1 for r in results if r[1] >= 400)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{clients:>8}{requests_per_level / elapsed:>10.1f}"
+              f"{statistics.median(latencies):>10.1f}{p95:>10.1f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Concurrent-request throughput benchmark')
+    parser.add_argument('base_url', help='e.g. http://localhost:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--requests', type=int, default=500, help='requests per concurrency level')
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print(" CONCURRENT THROUGHPUT BENCHMARK ")
+    print("="*60)
+    benchmark(args.base_url.rstrip('/'), args.username, args.password,
+              requests_per_level=args.requests)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Static Asset Pipeline and Response Compression for Surplus-to-Sustain
+
+Build step (run at deploy time):
+    python assets.py
+
+Copies every file under static/ to static/dist/ with a content hash in its
+name (css/style.css -> dist/css/style.3f2a9c1d0b7e.css), pre-compresses
+text assets with gzip and, if installed, brotli, and writes a manifest.
+At runtime url_for('static', filename='css/style.css') resolves to the
+fingerprinted file, which is served with the best variant the browser
+accepts and a one-year immutable Cache-Control.
+
+Dynamic HTML/JSON responses above COMPRESS_MIN_SIZE are compressed on the fly.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json'}
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+# Running totals for dynamic compression, reported through /api/metrics
+_stats = {'responses': 0, 'bytes_in': 0, 'bytes_out': 0}
+_stats_lock = threading.Lock()
+
+
+# ==================== BUILD ====================
+
+def build(static_dir):
+    """Fingerprint and pre-compress every static file; returns the manifest"""
+    dist_root = os.path.join(static_dir, DIST_DIR)
+    manifest = {}
+    totals = {'raw': 0, 'gzip': 0, 'br': 0}
+
+    print(f"\n{'asset':<32}{'raw':>10}{'gzip':>10}{'brotli':>10}")
+    print("-" * 62)
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_root]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            rel_path = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            stem, ext = os.path.splitext(rel_path)
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            hashed_rel = f'{DIST_DIR}/{stem}.{digest}{ext}'
+            target = os.path.join(static_dir, hashed_rel)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(content)
+            manifest[rel_path] = hashed_rel
+
+            if ext not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            gz = gzip.compress(content, compresslevel=9, mtime=0)
+            with open(target + '.gz', 'wb') as f:
+                f.write(gz)
+            br_size = None
+            if brotli is not None:
+                br = brotli.compress(content, quality=11)
+                with open(target + '.br', 'wb') as f:
+                    f.write(br)
+                br_size = len(br)
+
+            totals['raw'] += len(content)
+            totals['gzip'] += len(gz)
+            totals['br'] += br_size or len(gz)
+            br_column = f'{br_size:>10,}' if br_size else f"{'-':>10}"
+            print(f"{rel_path:<32}{len(content):>10,}{len(gz):>10,}{br_column}")
+
+    with open(os.path.join(dist_root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    if totals['raw']:
+        print("-" * 62)
+        print(f"{'total':<32}{totals['raw']:>10,}{totals['gzip']:>10,}{totals['br']:>10,}")
+        print(f"\n✓ Bytes on the wire: {totals['raw']:,} -> {totals['br']:,} "
+              f"({100 - totals['br'] * 100 / totals['raw']:.1f}% saved per cold page load)")
+    print(f"✓ {len(manifest)} assets fingerprinted into {dist_root}")
+    return manifest
+
+
+# ==================== RUNTIME ====================
+
+def _best_encoding(available):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding]:
+            return encoding
+    return None
+
+
+def init_assets(app):
+    """Hook fingerprinted URLs, precompressed serving and dynamic compression into app"""
+    manifest_path = os.path.join(app.static_folder, DIST_DIR, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    def serve_static(filename):
+        if not filename.startswith(DIST_DIR + '/'):
+            return app.send_static_file(filename)
+
+        path = os.path.join(app.static_folder, filename)
+        available = [enc for enc, suffix in (('br', '.br'), ('gzip', '.gz'))
+                     if os.path.exists(path + suffix)]
+        encoding = _best_encoding(available)
+        suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+
+        response = send_from_directory(app.static_folder, filename + suffix,
+                                       mimetype=mimetypes.guess_type(filename)[0],
+                                       max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if available:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE
+        return response
+
+    app.view_functions['static'] = serve_static
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+
+        encoding = _best_encoding(['br', 'gzip'] if brotli is not None else ['gzip'])
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=5)
+        elif encoding == 'gzip':
+            compressed = gzip.compress(data, compresslevel=6)
+        else:
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        with _stats_lock:
+            _stats['responses'] += 1
+            _stats['bytes_in'] += len(data)
+            _stats['bytes_out'] += len(compressed)
+        return response
+
+
+def compression_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+    stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else None
+    return stats
+
+
+if __name__ == "__main__":
+    print("\n" + "="*60)
+    print(" BUILDING STATIC ASSETS ")
+    print("="*60)
+    if brotli is None:
+        print("⚠ brotli not installed: only gzip variants will be generated")
+    build(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
@@ -0,0 +1,155 @@
+"""
+Password Hashing and Login Admission for Surplus-to-Sustain
+Runs the password KDF on a bounded thread pool, rehashes stored passwords
+when the configured cost changes, and rate-limits login attempts per IP
+and per account so a login storm can't monopolise the CPU
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+# hashlib's scrypt/pbkdf2 release the GIL, so these threads run on separate cores
+KDF_WORKERS = int(os.environ.get('KDF_WORKERS', os.cpu_count() or 2))
+KDF_MAX_WAITING = int(os.environ.get('KDF_MAX_WAITING', KDF_WORKERS * 4))
+KDF_TIMEOUT = float(os.environ.get('KDF_TIMEOUT', 5))
+
+# Token buckets: sustained attempts per minute and burst size
+LOGIN_IP_RATE = float(os.environ.get('LOGIN_IP_PER_MINUTE', 20))
+LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST', 10))
+LOGIN_ACCOUNT_RATE = float(os.environ.get('LOGIN_ACCOUNT_PER_MINUTE', 5))
+LOGIN_ACCOUNT_BURST = int(os.environ.get('LOGIN_ACCOUNT_BURST', 5))
+
+
+class LoginThrottled(Exception):
+    """Raised when a login attempt is refused before any hashing is done"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Per-key token buckets held in memory
+
+    Each key refills at `rate_per_minute` up to `burst` tokens. Idle keys
+    are dropped once the table grows past `max_keys`.
+    """
+
+    def __init__(self, rate_per_minute, burst, max_keys=100_000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = {}  # key -> (tokens, last_refill)
+        self.lock = threading.Lock()
+
+    def take(self, key):
+        """Consume one token; returns 0 on success or seconds until one is available"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                if len(self.buckets) > self.max_keys:
+                    self._prune(now)
+                return 0
+            self.buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def _prune(self, now):
+        # A bucket idle long enough to be full again carries no state
+        full_after = self.burst / self.rate
+        self.buckets = {key: value for key, value in self.buckets.items()
+                        if now - value[1] < full_after}
+
+
+_kdf_pool = ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix='kdf')
+_kdf_slots = threading.BoundedSemaphore(KDF_WORKERS + KDF_MAX_WAITING)
+ip_limiter = TokenBucket(LOGIN_IP_RATE, LOGIN_IP_BURST)
+account_limiter = TokenBucket(LOGIN_ACCOUNT_RATE, LOGIN_ACCOUNT_BURST)
+
+
+def _run_kdf(func, *args):
+    """
+    Run a hashing call on the KDF pool, refusing work once the queue is full
+
+    A slot is held until the call really finishes (or is cancelled before
+    starting), not until the caller gives up waiting, so a timed-out hash
+    still running on the pool keeps counting against KDF_MAX_WAITING.
+    """
+    if not _kdf_slots.acquire(blocking=False):
+        raise LoginThrottled('Login service is busy. Please try again in a moment.', 2)
+    try:
+        future = _kdf_pool.submit(func, *args)
+    except BaseException:
+        _kdf_slots.release()
+        raise
+    future.add_done_callback(lambda _: _kdf_slots.release())
+    try:
+        return future.result(timeout=KDF_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()  # still queued: drop it rather than hash for nobody
+        raise LoginThrottled('Login service is busy. Please try again in a moment.', 2)
+
+
+def admit_login(ip, account):
+    """Charge one attempt to the IP and account buckets, or raise LoginThrottled"""
+    wait = ip_limiter.take(ip) or account_limiter.take(account.lower())
+    if wait:
+        raise LoginThrottled('Too many login attempts. Please wait and try again.', int(wait) + 1)
+
+
+def hash_password(password):
+    return _run_kdf(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(stored_hash, password):
+    return _run_kdf(check_password_hash, stored_hash, password)
+
+
+def needs_rehash(stored_hash):
+    """True if the hash was made with a different method or cost than configured"""
+    return stored_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+
+def benchmark(n_logins=200, concurrency=(1, 4, 16)):
+    """Measure verified logins per second through the KDF pool"""
+    stored = generate_password_hash('benchmark-password', PASSWORD_HASH_METHOD)
+    print(f"Method: {PASSWORD_HASH_METHOD}, KDF workers: {KDF_WORKERS}")
+    print(f"\n{'clients':>8}{'logins/sec':>14}{'refused':>10}")
+    print("-" * 32)
+
+    for clients in concurrency:
+        refused = 0
+        refused_lock = threading.Lock()
+
+        def login():
+            nonlocal refused
+            try:
+                verify_password(stored, 'benchmark-password')
+            except LoginThrottled:
+                with refused_lock:
+                    refused += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as client_pool:
+            list(client_pool.map(lambda _: login(), range(n_logins)))
+        elapsed = time.perf_counter() - start
+        print(f"{clients:>8}{(n_logins - refused) / elapsed:>14.1f}{refused:>10}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print(" LOGIN THROUGHPUT BENCHMARK ")
+    print("="*60)
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
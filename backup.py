@@ -0,0 +1,423 @@
+"""
+Online Backup and Restore for Surplus-to-Sustain
+
+    python backup.py backup [--probe]          # snapshot while the app keeps running
+    python backup.py list
+    python backup.py verify snapshots/database-20261019T020000.db.gz
+    python backup.py restore --at "2026-10-19 02:30"
+
+Snapshots are taken with SQLite's online backup API, BACKUP_PAGES_PER_STEP
+pages at a time with a short sleep between steps, so live writers get the
+lock back between steps. Each copy is integrity-checked before it is
+gzipped into BACKUP_DIR. The archive database (see retention.py) is
+snapshotted alongside when it exists, from the same read transaction, so
+the two snapshots agree on which rows had been archived.
+
+Restore picks the newest snapshot taken at or before --at and copies it into
+the live database through the same backup API, after saving the current
+state as a 'pre-restore' snapshot.
+
+With STORAGE_BACKEND=sharded the directory and every shard are snapshotted
+in one run under the same timestamp, and --at restores each of them. Each
+file is consistent on its own; rows written while the run moves from one
+shard to the next may be in one file's snapshot and not another's.
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from retention import archive_path
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'snapshots')
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))
+BACKUP_SLEEP_SECONDS = float(os.environ.get('BACKUP_SLEEP_SECONDS', 0.005))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 14))
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+
+def snapshot_name(db_path, taken_at, label=None):
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    suffix = f'-{label}' if label else ''
+    return f'{stem}-{taken_at.strftime(TIMESTAMP_FORMAT)}{suffix}.db.gz'
+
+
+def integrity_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def copy_pages(source, target_path, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_SLEEP_SECONDS, name='main'):
+    """
+    Online copy of one schema of an open connection into target_path; returns stats
+
+    If another connection writes to the source mid-copy, SQLite restarts
+    the copy from the first page, unless `source` holds a read transaction
+    (see backup()). Restarts are counted; under constant heavy writes use a
+    larger --pages (or -1 for a single step).
+    """
+    target = sqlite3.connect(target_path)
+    stats = {'steps': 0, 'restarts': 0, 'pages': 0}
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['steps'] += 1
+        stats['pages'] = total
+        if last_remaining is not None and remaining > last_remaining:
+            stats['restarts'] += 1
+        last_remaining = remaining
+        # backup()'s own sleep only applies when a step finds the source busy;
+        # pausing here is what lets writers in between steps
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    try:
+        start = time.perf_counter()
+        source.backup(target, pages=pages, progress=progress, name=name)
+        stats['seconds'] = time.perf_counter() - start
+    finally:
+        target.close()
+    return stats
+
+
+def copy_database(source_path, target_path, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_SLEEP_SECONDS,
+                  checkpoint=True):
+    """Online copy of source_path into target_path; returns stats"""
+    source = sqlite3.connect(source_path, timeout=30)
+    try:
+        if checkpoint:
+            # Fold the WAL into the main file first so the copy is as small as it can be
+            source.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+        return copy_pages(source, target_path, pages, sleep)
+    finally:
+        source.close()
+
+
+def _begin_snapshot(db_path, source, schemas):
+    """
+    Start one read transaction on source covering every schema
+
+    archive_batch moves rows under the live database's write lock, so with
+    that lock held for a moment (on a second connection) no move is half
+    committed while the read transaction is opened. Writers wait only for
+    that moment, not for the copy.
+    """
+    fence = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        fence.execute('BEGIN IMMEDIATE')
+        source.execute('BEGIN')
+        for schema in schemas:
+            source.execute(f'SELECT COUNT(*) FROM {schema}.sqlite_master').fetchone()
+        fence.execute('ROLLBACK')
+    finally:
+        fence.close()
+
+
+def backup(db_path, backup_dir=BACKUP_DIR, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_SLEEP_SECONDS,
+           compress=True, checkpoint=True, label=None, taken_at=None):
+    """
+    Snapshot db_path (and its archive) into backup_dir; returns [(path, stats)]
+
+    Both files are copied from a single read transaction, so rows the
+    retention job archives during the run are in exactly one of the two
+    snapshots.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    taken_at = taken_at or datetime.now()
+    results = []
+
+    sources = {'main': db_path}
+    if os.path.exists(archive_path(db_path)):
+        sources['archive'] = archive_path(db_path)
+    source = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        if 'archive' in sources:
+            source.execute('ATTACH DATABASE ? AS archive', (sources['archive'],))
+        if checkpoint:
+            # Fold the WAL into the main file first so the copy is as small as it can be
+            for schema in sources:
+                source.execute(f'PRAGMA {schema}.wal_checkpoint(PASSIVE)').fetchall()
+        _begin_snapshot(db_path, source, sources)
+
+        for schema, source_path in sources.items():
+            fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+            os.close(fd)
+            try:
+                stats = copy_pages(source, tmp_path, pages, sleep, name=schema)
+                stats['integrity'] = integrity_check(tmp_path)
+                stats['raw_bytes'] = os.path.getsize(tmp_path)
+                if stats['integrity'] != 'ok':
+                    raise RuntimeError(f'{source_path}: snapshot failed integrity check: {stats["integrity"]}')
+
+                name = snapshot_name(source_path, taken_at, label)
+                if not compress:
+                    name = name[:-len('.gz')]
+                out_path = os.path.join(backup_dir, name)
+                if compress:
+                    with open(tmp_path, 'rb') as src, gzip.open(out_path + '.tmp', 'wb', compresslevel=6) as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                    os.replace(out_path + '.tmp', out_path)
+                else:
+                    os.replace(tmp_path, out_path)
+                stats['bytes'] = os.path.getsize(out_path)
+                results.append((out_path, stats))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    finally:
+        source.close()
+    return results
+
+
+def list_snapshots(db_path, backup_dir=BACKUP_DIR):
+    """[(taken_at, path)] for db_path's snapshots, oldest first"""
+    stem = os.path.splitext(os.path.basename(db_path))[0] + '-'
+    snapshots = []
+    if not os.path.isdir(backup_dir):
+        return snapshots
+    for name in os.listdir(backup_dir):
+        if not name.startswith(stem) or not name.endswith(('.db', '.db.gz')):
+            continue
+        stamp = name[len(stem):].split('.')[0].split('-')[0]
+        try:
+            taken_at = datetime.strptime(stamp, TIMESTAMP_FORMAT)
+        except ValueError:
+            continue  # e.g. the archive's snapshots when listing the main database
+        snapshots.append((taken_at, os.path.join(backup_dir, name)))
+    return sorted(snapshots)
+
+
+def prune_snapshots(db_path, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` snapshots (pre-restore snapshots are kept)"""
+    removed = []
+    for path in (db_path, archive_path(db_path)):
+        regular = [s for s in list_snapshots(path, backup_dir) if '-pre-restore' not in s[1]]
+        for _, snapshot in regular[:-keep] if keep else []:
+            os.remove(snapshot)
+            removed.append(snapshot)
+    return removed
+
+
+def _open_snapshot(snapshot_path):
+    """Path to a plain database file for a snapshot; decompresses to a temp file"""
+    if not snapshot_path.endswith('.gz'):
+        return snapshot_path, False
+    fd, tmp_path = tempfile.mkstemp(suffix='.db')
+    with os.fdopen(fd, 'wb') as dst, gzip.open(snapshot_path, 'rb') as src:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return tmp_path, True
+
+
+def verify(snapshot_path):
+    """integrity_check result for a (possibly compressed) snapshot"""
+    path, is_temp = _open_snapshot(snapshot_path)
+    try:
+        return integrity_check(path)
+    finally:
+        if is_temp:
+            os.remove(path)
+
+
+def restore(db_path, snapshot_path):
+    """
+    Copy a verified snapshot into the live database through the backup API
+
+    Done in a single step, so the live database switches over atomically
+    and open connections see either the old or the restored contents.
+    """
+    path, is_temp = _open_snapshot(snapshot_path)
+    try:
+        result = integrity_check(path)
+        if result != 'ok':
+            raise RuntimeError(f'{snapshot_path} failed integrity check: {result}')
+        return copy_database(path, db_path, pages=-1, sleep=0, checkpoint=False)
+    finally:
+        if is_temp:
+            os.remove(path)
+
+
+def snapshot_at(db_path, when, backup_dir=BACKUP_DIR):
+    """Newest snapshot taken at or before `when`, or None"""
+    candidates = [s for s in list_snapshots(db_path, backup_dir) if s[0] <= when]
+    return candidates[-1][1] if candidates else None
+
+
+# ==================== LATENCY PROBE ====================
+
+class LatencyProbe:
+    """Times a typical page read and a write-lock acquisition in a loop"""
+
+    def __init__(self, db_path, interval=0.02):
+        self.db_path = db_path
+        self.interval = interval
+        self.samples = {'read': [], 'write': []}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        while not self.stopped.is_set():
+            start = time.perf_counter()
+            conn.execute('''SELECT * FROM crops WHERE farmer_id =
+                              (SELECT farmer_id FROM crops ORDER BY id DESC LIMIT 1)
+                            ORDER BY planting_date DESC LIMIT 6''').fetchall()
+            self.samples['read'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('ROLLBACK')
+            self.samples['write'].append(time.perf_counter() - start)
+            time.sleep(self.interval)
+        conn.close()
+
+    def measure(self, seconds):
+        """Samples for a fixed period with nothing else running"""
+        self.start()
+        time.sleep(seconds)
+        return self.stop()
+
+    def start(self):
+        self.samples = {'read': [], 'write': []}
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return {kind: _percentiles(values) for kind, values in self.samples.items()}
+
+
+def _percentiles(values):
+    if not values:
+        return {'n': 0}
+    ms = sorted(v * 1000 for v in values)
+    return {'n': len(ms), 'p50': statistics.median(ms),
+            'p95': ms[max(0, int(len(ms) * 0.95) - 1)], 'max': ms[-1]}
+
+
+def _print_latency(label, result):
+    for kind, stats in result.items():
+        if stats['n']:
+            print(f"  {label:<16}{kind:<7}{stats['n']:>6}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['max']:>9.2f}")
+
+
+# ==================== CLI ====================
+
+def main():
+    parser = argparse.ArgumentParser(description='Online SQLite backup and restore')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('backup', help='take a snapshot')
+    p.add_argument('--dir', default=BACKUP_DIR)
+    p.add_argument('--pages', type=int, default=BACKUP_PAGES_PER_STEP, help='pages per step (-1: all at once)')
+    p.add_argument('--sleep', type=float, default=BACKUP_SLEEP_SECONDS, help='seconds between steps')
+    p.add_argument('--no-compress', action='store_true')
+    p.add_argument('--no-checkpoint', action='store_true')
+    p.add_argument('--keep', type=int, default=BACKUP_KEEP, help='snapshots to keep (0: all)')
+    p.add_argument('--probe', action='store_true', help='measure query latency before and during the copy')
+
+    p = sub.add_parser('list', help='list snapshots')
+    p.add_argument('--dir', default=BACKUP_DIR)
+
+    p = sub.add_parser('verify', help='integrity-check a snapshot')
+    p.add_argument('snapshot')
+
+    p = sub.add_parser('restore', help='restore a snapshot into the live database')
+    p.add_argument('snapshot', nargs='?')
+    p.add_argument('--at', help='restore the newest snapshot taken at or before this time')
+    p.add_argument('--dir', default=BACKUP_DIR)
+
+    args = parser.parse_args()
+
+    from app import DATABASE, storage
+
+    # The database file, plus every shard when sharded (DATABASE is then the directory)
+    paths = list(dict.fromkeys([DATABASE] + storage.sqlite_paths()))
+
+    if args.command == 'backup':
+        probe = LatencyProbe(paths[-1]) if args.probe else None
+        if probe:
+            baseline = probe.measure(2)
+            probe.start()
+        taken_at = datetime.now()
+        results = [result for path in paths
+                   for result in backup(path, args.dir, args.pages, args.sleep, compress=not args.no_compress,
+                                        checkpoint=not args.no_checkpoint, taken_at=taken_at)]
+        during = probe.stop() if probe else None
+
+        for path, stats in results:
+            print(f"✓ {path}: {stats['pages']:,} pages in {stats['seconds']:.2f}s "
+                  f"({stats['steps']} steps, {stats['restarts']} restarts), "
+                  f"{stats['raw_bytes'] / 1e6:.1f} MB -> {stats['bytes'] / 1e6:.1f} MB, "
+                  f"integrity {stats['integrity']}")
+        for path in paths:
+            for removed in prune_snapshots(path, args.dir, args.keep):
+                print(f"  pruned {removed}")
+        if probe:
+            print(f"\n  {'':<16}{'query':<7}{'n':>6}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+            _print_latency('idle', baseline)
+            _print_latency('during backup', during)
+
+    elif args.command == 'list':
+        for path in paths:
+            for source in (path, archive_path(path)):
+                for taken_at, snapshot in list_snapshots(source, args.dir):
+                    print(f"{taken_at:%Y-%m-%d %H:%M:%S}  {os.path.getsize(snapshot) / 1e6:8.1f} MB  {snapshot}")
+
+    elif args.command == 'verify':
+        result = verify(args.snapshot)
+        print(f"{'✓' if result == 'ok' else '✗'} {args.snapshot}: {result}")
+        raise SystemExit(0 if result == 'ok' else 1)
+
+    elif args.command == 'restore':
+        if args.at:
+            when = datetime.fromisoformat(args.at)
+            targets = [(path, snapshot_at(path, when, args.dir)) for path in paths]
+            for path, snapshot in targets:
+                if snapshot is None:
+                    raise SystemExit(f"✗ No snapshot of {path} at or before {when}")
+        elif args.snapshot:
+            name = os.path.basename(args.snapshot)
+            owners = [path for path in paths
+                      if any(os.path.basename(snapshot) == name
+                             for _, snapshot in list_snapshots(path, os.path.dirname(args.snapshot) or '.'))]
+            if not owners:
+                raise SystemExit(f"✗ {args.snapshot} is not a snapshot of {', '.join(paths)}")
+            targets = [(owners[0], args.snapshot)]
+        else:
+            parser.error('restore needs a snapshot path or --at')
+
+        for path, snapshot in targets:
+            _restore_with_archive(path, snapshot, args.dir)
+
+
+def _restore_with_archive(db_path, snapshot, backup_dir):
+    """Save the current state, restore the snapshot and the matching archive snapshot if any"""
+    saved = backup(db_path, backup_dir, label='pre-restore')
+    print(f"✓ Current state of {db_path} saved to {saved[0][0]}")
+    stats = restore(db_path, snapshot)
+    print(f"✓ Restored {snapshot} into {db_path} ({stats['pages']:,} pages in {stats['seconds']:.2f}s)")
+
+    # Bring the archive back to the same point in time when there is a matching snapshot
+    main_stem = os.path.splitext(os.path.basename(db_path))[0] + '-'
+    archive_stem = os.path.splitext(os.path.basename(archive_path(db_path)))[0] + '-'
+    name = os.path.basename(snapshot)
+    archive_snapshot = os.path.join(os.path.dirname(snapshot), archive_stem + name[len(main_stem):])
+    if name.startswith(main_stem) and os.path.exists(archive_snapshot):
+        restore(archive_path(db_path), archive_snapshot)
+        print(f"✓ Restored {archive_snapshot}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark Scaffolding for Surplus-to-Sustain
+Shared by the rollup benchmarks in ledger.py, impact.py and prices.py
+
+    with scratch_database('ledger', 'transactions', 10_000_000) as (db_path, storage):
+        print(timed_ms(storage.verified_buyers, 50))
+        with_trigger, bare = trigger_cost(conn, 'transactions_ledger_insert', insert_batch)
+
+scratch_database builds the app schema in a temporary directory, loads
+datagen rows into it and points DATABASE and ARCHIVE_DATABASE there, so
+app.storage and any connection opened on db_path see the generated data.
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+# The rest of the world every rollup benchmark generates around the rows it measures
+BACKGROUND = {'farmers': 10_000, 'buyers': 2_000, 'crops': 200_000, 'transactions': 0,
+              'storage_bookings': 0, 'notifications': 0, 'waste_flows': 0}
+
+
+def timed_ms(func, repeat):
+    """Median wall time of func() over `repeat` calls, in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+@contextmanager
+def scratch_database(name, table, rows):
+    """Yield (db_path, app.storage) for a generated database with `rows` rows of `table`"""
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ['DATABASE'] = db_path = os.path.join(scratch, f'{name}.db')
+        os.environ['ARCHIVE_DATABASE'] = os.path.join(scratch, f'{name}_archive.db')
+        from app import init_db, storage
+        from datagen import generate
+
+        init_db()
+        storage.close()
+        print(f"\n🌱 Loading {rows:,} {table.replace('_', ' ')} ...")
+        start = time.perf_counter()
+        generate(db_path, {**BACKGROUND, table: rows}, log=lambda line: None)
+        print(f"  loaded in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(db_path) / 1e6:,.0f} MB)")
+        try:
+            yield db_path, storage
+        finally:
+            storage.close()
+
+
+def trigger_cost(conn, trigger, batch, repeat=3):
+    """(ms with, ms without) for batch() with the named trigger in place and dropped; batch rolls back"""
+    with_trigger = timed_ms(batch, repeat)
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (trigger,)).fetchone()[0]
+    conn.execute(f'DROP TRIGGER {trigger}')
+    try:
+        without_trigger = timed_ms(batch, repeat)
+    finally:
+        conn.execute(sql)
+    return with_trigger, without_trigger
@@ -0,0 +1,396 @@
+"""
+Change Log and Delta Sync for Surplus-to-Sustain
+
+    GET /api/sync?since=<seq>           # rows changed after seq, for offline-first clients
+
+    python changelog.py --compact       # drop superseded entries, in every shard (run from cron, like retention.py)
+    python changelog.py --rebuild       # one entry per current row, e.g. after a bulk load
+    python changelog.py --benchmark     # payload size and latency of a delta vs a full sync after a day of changes
+
+Triggers on crops, transactions, notifications, waste flows and buyers
+append one `change_log` row per write: the table, the row id, the owning
+user (0 for buyers, which every client gets) and whether the row was
+upserted or deleted. `seq` is AUTOINCREMENT, so it only grows and SQLite's single
+writer commits it in order; a client that has applied everything up to a
+seq can never miss a later one.
+
+The log holds keys, not values. A sync reads up to SYNC_BATCH entries
+after the client's seq and sends the current version of each row once,
+as columnar JSON per table (column names once, then value lists) plus the
+ids deleted since. Clients apply the batch, store the returned `seq` and
+ask again while `more` is true. `since=0` is a full snapshot: a new log
+starts with an entry for every existing row.
+
+Transactions and notifications leave the live tables only when
+retention.py archives them, so they have no DELETE triggers and rows are
+read from the *_history views; a client keeps its archived rows, as the
+history pages do.
+
+Compaction deletes every entry that a later entry for the same row
+supersedes. That is safe for clients at any seq: the surviving entry is
+newer than the one it replaces. Deletes stay in the log as tombstones.
+
+The log also gives maintenance jobs a consistent parallel scan:
+pinned_readers() opens reader connections that all see one committed
+state and returns that state's seq. Rows that change during the scan are
+exactly those with a later entry (rows_changed_after). A job reads their
+old values on a pinned reader and their current ones in its final write
+transaction, and applies the difference (ledger.py --repair, impact.py
+--backfill).
+
+Like the SSE event log this is SQLite only; with the sharded backend each
+shard keeps its own log and the endpoint reads the user's shard.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+SYNC_BATCH = int(os.environ.get('SYNC_BATCH', 500))
+
+# table -> (row source, owning user column or None for shared rows, synced columns)
+SYNC_TABLES = {
+    'crops': ('crops', 'farmer_id', (
+        'id', 'crop_name', 'variety', 'area', 'planting_date', 'expected_harvest_date', 'actual_harvest_date',
+        'soil_type', 'irrigation_type', 'season', 'expected_consumption', 'predicted_yield',
+        'predicted_surplus', 'actual_yield', 'actual_surplus', 'status', 'notes', 'created_at', 'updated_at')),
+    'transactions': ('transactions_history', 'farmer_id', (
+        'id', 'crop_id', 'buyer_id', 'quantity_tons', 'price_per_kg', 'total_amount', 'transaction_date',
+        'delivery_date', 'status', 'payment_status', 'rating', 'review', 'created_at')),
+    'notifications': ('notifications_history', 'user_id', (
+        'id', 'title', 'message', 'type', 'is_read', 'action_url', 'created_at')),
+    'waste_flows': ('waste_flows', 'farmer_id', (
+        'id', 'crop_id', 'waste_type', 'quantity_tons', 'destination_id', 'processing_date', 'food_saved',
+        'co2_saved', 'compost_generated', 'status', 'qr_code', 'region', 'created_at')),
+    'buyers': ('buyers', None, (
+        'id', 'name', 'buyer_type', 'phone', 'email', 'address', 'city', 'state', 'pincode', 'latitude',
+        'longitude', 'capacity_tons', 'price_per_kg', 'specialty_crops', 'rating', 'decayed_rating',
+        'total_transactions', 'is_verified')),
+}
+
+# Archived rows must not read as deleted (see the module docstring)
+_DELETE_TRIGGERS = ('crops', 'waste_flows', 'buyers')
+
+
+def _owner(table, row):
+    owner = SYNC_TABLES[table][1]
+    return f'{row}.{owner}' if owner else '0'
+
+
+def init_changelog(cursor):
+    """
+    Log table, its indexes and triggers; returns True if the table is new
+
+    A table added to SYNC_TABLES after the log was created gets an entry for
+    each of its existing rows, so clients at any seq receive them.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'")
+    created = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('upsert', 'delete')),
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_user ON change_log(user_id, seq)')
+    # Compaction groups by row
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(table_name, row_id, seq)')
+    for table, (_, _, columns) in SYNC_TABLES.items():
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                       (f'{table}_change_log_insert',))
+        if not created and cursor.fetchone() is None:
+            cursor.execute(f'''INSERT INTO change_log (table_name, row_id, user_id, op)
+                              SELECT '{table}', id, {_owner(table, 't')}, 'upsert'
+                              FROM {table} t ORDER BY id''')
+        # Updates that leave every synced column as it was (ledger sums, shard
+        # buyer replication, rescoring timestamps) aren't logged
+        changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in columns)
+        events = [('INSERT', 'new', 'upsert', ''), ('UPDATE', 'new', 'upsert', f'WHEN {changed}')]
+        if table in _DELETE_TRIGGERS:
+            events.append(('DELETE', 'old', 'delete', ''))
+        for event, row, op, when in events:
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_change_log_{event.lower()} AFTER {event} ON {table} {when} BEGIN
+                    INSERT INTO change_log (table_name, row_id, user_id, op)
+                    VALUES ('{table}', {row}.id, {_owner(table, row)}, '{op}');
+                END
+            ''')
+    return created
+
+
+def _source(conn, table):
+    """The *_history view where the archive is attached, else the live table"""
+    source = SYNC_TABLES[table][0]
+    if source != table and not conn.execute("SELECT 1 FROM sqlite_temp_master WHERE name = ?",
+                                            (source,)).fetchone():
+        return table
+    return source
+
+
+def rebuild(conn):
+    """Replace the log with one upsert per current row inside the caller's transaction; returns the entries"""
+    conn.execute('DELETE FROM change_log')
+    entries = 0
+    for table in SYNC_TABLES:
+        entries += conn.execute(f'''INSERT INTO change_log (table_name, row_id, user_id, op)
+                                    SELECT '{table}', id, {_owner(table, 't')}, 'upsert'
+                                    FROM {_source(conn, table)} t ORDER BY id''').rowcount
+    return entries
+
+
+def compact(conn):
+    """Delete entries superseded by a later one for the same row; returns (deleted, kept)"""
+    deleted = conn.execute('''DELETE FROM change_log WHERE seq NOT IN
+                                (SELECT MAX(seq) FROM change_log GROUP BY table_name, row_id)''').rowcount
+    kept = conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0]
+    return deleted, kept
+
+
+def changes_since(storage, user_id, since=0, limit=SYNC_BATCH):
+    """
+    The user's next batch of changes after `since`
+
+    Returns {'seq', 'more', 'reset', 'changes': {table: {'columns', 'rows',
+    'deleted'}}}. `reset` means the client's seq is ahead of this log (the
+    database was restored or the user moved shard): the batch starts from
+    0 and the client should discard its copy first.
+    """
+    entries = storage.fetchall('''SELECT seq, table_name, row_id, op FROM change_log
+                                  WHERE user_id IN (0, ?) AND seq > ? ORDER BY seq LIMIT ?''',
+                               (user_id, since, limit + 1))
+    if not entries and since:
+        latest = storage.fetchone('SELECT MAX(seq) AS seq FROM change_log')['seq'] or 0
+        if since > latest:
+            return dict(changes_since(storage, user_id, 0, limit), reset=True)
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Only the last entry for a row in this batch counts
+    ops = {}
+    for entry in entries:
+        ops[entry['table_name'], entry['row_id']] = entry['op']
+    changes = {}
+    for table, (source, owner, columns) in SYNC_TABLES.items():
+        upserted = [row_id for (name, row_id), op in ops.items() if name == table and op == 'upsert']
+        deleted = [row_id for (name, row_id), op in ops.items() if name == table and op == 'delete']
+        rows = []
+        if upserted:
+            query = f"SELECT {', '.join(columns)} FROM {source} WHERE id IN ({', '.join('?' * len(upserted))})"
+            params = list(upserted)
+            if owner:
+                query += f' AND {owner} = ?'
+                params.append(user_id)
+            rows = [list(row) for row in storage.fetchall(query + ' ORDER BY id', params)]
+        if rows or deleted:
+            changes[table] = {'columns': list(columns), 'rows': rows, 'deleted': deleted}
+    return {
+        'seq': entries[-1]['seq'] if entries else since,
+        'more': more,
+        'reset': False,
+        'changes': changes,
+    }
+
+
+# ==================== CONSISTENT SCANS ====================
+
+def pinned_readers(conn, db_path, count):
+    """
+    `count` read-only connections (usable from any thread) that all see the
+    same committed state, and the last seq in it
+
+    conn's write lock is held while each reader starts its read transaction,
+    so nothing commits in between; writers wait only that long. The caller
+    closes the readers, before its own write transaction commits.
+    """
+    from retention import archive_path
+
+    archive = os.path.abspath(archive_path(db_path))
+    readers = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for _ in range(count):
+            reader = sqlite3.connect(f'file:{os.path.abspath(db_path)}?mode=ro', uri=True,
+                                     isolation_level=None, check_same_thread=False)
+            readers.append(reader)
+            if os.path.exists(archive):
+                reader.execute('ATTACH DATABASE ? AS archive', (f'file:{archive}?mode=ro',))
+            reader.execute('BEGIN')
+            # A WAL snapshot starts at a transaction's first read of each file
+            reader.execute('SELECT COUNT(*) FROM main.sqlite_master').fetchone()
+            if os.path.exists(archive):
+                reader.execute('SELECT COUNT(*) FROM archive.sqlite_master').fetchone()
+        seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    except Exception:
+        for reader in readers:
+            reader.close()
+        raise
+    finally:
+        conn.execute('ROLLBACK')
+    return readers, seq
+
+
+def rows_changed_after(conn, table, seq):
+    """Ids of the table's rows inserted, updated or deleted after seq"""
+    return [row[0] for row in conn.execute('''SELECT DISTINCT row_id FROM change_log
+                                              WHERE seq > ? AND table_name = ?''', (seq, table))]
+
+
+# ==================== BENCHMARK ====================
+
+def _sync(storage, user_id, since):
+    """Every batch from `since` to the end; returns (payloads, seconds)"""
+    payloads = []
+    started = time.perf_counter()
+    while True:
+        batch = changes_since(storage, user_id, since)
+        payloads.append(json.dumps(batch, separators=(',', ':')).encode())
+        since = batch['seq']
+        if not batch['more']:
+            return payloads, time.perf_counter() - started
+
+
+def _day_of_changes(storage, farmers, buyers, rng):
+    """
+    A day's writes by the active farmers: new crops, status changes, sales
+    that are completed and rated later, notifications that get read, the
+    odd deleted crop, and a few buyer listing edits; returns the writes made
+    """
+    writes = 0
+    for farmer in farmers:
+        crops = [row['id'] for row in storage.fetchall('SELECT id FROM crops WHERE farmer_id = ? LIMIT 20',
+                                                       (farmer,))]
+        crop_id = storage.add_crop(farmer, crop_name='tomato', variety='Local', area=1.5,
+                                   planting_date='2024-06-01', expected_harvest_date='2024-09-01',
+                                   soil_type='loamy', irrigation_type='drip', season='kharif',
+                                   expected_consumption=2.0, predicted_yield=30.0, predicted_surplus=28.0,
+                                   notes='', status='planted')
+        crops.append(crop_id)
+        storage.set_crop_status(crop_id, farmer, 'growing', '2024-06-02 08:00:00')
+        for _ in range(2):
+            storage.set_crop_status(int(rng.choice(crops)), farmer, 'harvested', '2024-06-02 09:00:00')
+        transaction_id = storage.record_transaction(farmer, int(rng.choice(crops)), int(rng.choice(buyers)),
+                                                    2.0, 18.5)
+        storage.set_transaction_status(transaction_id, farmer, 'completed')
+        storage.rate_transaction(transaction_id, farmer, int(rng.integers(3, 6)))
+        for i in range(3):
+            storage.create_notification(farmer, 'Sale recorded', f'Sale {transaction_id} update {i}', 'success')
+        storage.mark_all_notifications_read(farmer)
+        writes += 11
+        if rng.random() < 0.1:
+            storage.delete_crop(crops[0], farmer)
+            writes += 1
+    for buyer in rng.choice(buyers, min(10, len(buyers)), replace=False):
+        storage.execute('UPDATE buyers SET price_per_kg = price_per_kg + 0.5 WHERE id = ?', (int(buyer),))
+        writes += 1
+    return writes
+
+
+def benchmark(db_path, active=0.3, sample=50, seed=7):
+    """
+    On a scratch copy of db_path: a day of changes by `active` of the
+    farmers, then a delta sync from the start of the day against a full
+    sync from 0 for `sample` of them, before and after compaction
+    """
+    import numpy as np
+
+    from storage import SQLiteStorage
+
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, 'sync.db')
+        source, target = sqlite3.connect(db_path), sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        archive = os.path.splitext(db_path)[0] + '_archive.db'
+        if os.path.exists(archive):
+            shutil.copy(archive, os.path.join(scratch, 'sync_archive.db'))
+        if init_changelog(target.cursor()):
+            from retention import attach_archive
+            target.commit()
+            rebuild(attach_archive(target, path))
+        target.commit()
+        target.close()
+
+        storage = SQLiteStorage(path)
+        farmers = [row['id'] for row in storage.fetchall("SELECT id FROM users WHERE user_type = 'farmer'")]
+        buyers = [row['id'] for row in storage.fetchall('SELECT id FROM buyers WHERE is_verified = 1')]
+        day_start = storage.fetchone('SELECT MAX(seq) AS seq FROM change_log')['seq']
+        chosen = sorted(rng.choice(farmers, max(1, int(len(farmers) * active)), replace=False).tolist())
+
+        started = time.perf_counter()
+        writes = _day_of_changes(storage, chosen, buyers, rng)
+        logged = storage.fetchone('SELECT COUNT(*) AS n FROM change_log WHERE seq > ?', (day_start,))['n']
+        print(f"\n🌱 A day of changes: {len(chosen):,} of {len(farmers):,} farmers, {writes:,} writes, "
+              f"{logged:,} log entries in {time.perf_counter() - started:.1f}s")
+
+        probe = chosen[:sample]
+
+        def measure(label, since):
+            sizes, gzipped, seconds, batches = [], [], [], []
+            for farmer in probe:
+                payloads, elapsed = _sync(storage, farmer, since)
+                sizes.append(sum(len(p) for p in payloads))
+                gzipped.append(sum(len(gzip.compress(p)) for p in payloads))
+                seconds.append(elapsed)
+                batches.append(len(payloads))
+            print(f"  {label:<28}{statistics.median(sizes) / 1024:>10.1f}{statistics.median(gzipped) / 1024:>10.1f}"
+                  f"{statistics.median(batches):>9.0f}{statistics.median(seconds) * 1000:>10.2f}"
+                  f"{max(seconds) * 1000:>10.2f}")
+
+        print(f"\n  Per farmer, median of {len(probe)}")
+        print(f"  {'':<28}{'KB':>10}{'gzip KB':>10}{'batches':>9}{'p50 ms':>10}{'max ms':>10}")
+        measure('full sync (since=0)', 0)
+        measure('delta (since start of day)', day_start)
+        with storage.connection() as conn:
+            deleted, kept = compact(conn)
+        print(f"  compaction: {deleted:,} superseded entries dropped, {kept:,} kept")
+        measure('full sync, compacted', 0)
+        measure('delta, compacted', day_start)
+        storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the change log behind /api/sync')
+    parser.add_argument('--compact', action='store_true', help='drop superseded entries')
+    parser.add_argument('--rebuild', action='store_true', help='replace the log with one entry per current row')
+    parser.add_argument('--benchmark', action='store_true', help='sync payload size and latency after a day of changes')
+    args = parser.parse_args()
+
+    from app import DATABASE, init_db, storage
+    from retention import attach_archive
+
+    if args.benchmark:
+        benchmark(DATABASE)
+        return
+
+    init_db()
+    # Each shard keeps its own log
+    for path in storage.sqlite_paths():
+        conn = attach_archive(sqlite3.connect(path), path)
+        try:
+            started = time.perf_counter()
+            if args.rebuild:
+                entries = rebuild(conn)
+                conn.commit()
+                print(f"✓ Rebuilt the change log of {path}: {entries:,} entries "
+                      f"in {time.perf_counter() - started:.1f}s")
+            else:
+                deleted, kept = compact(conn)
+                conn.commit()
+                print(f"✓ Compacted the change log of {path}: {deleted:,} superseded entries dropped, "
+                      f"{kept:,} kept in {time.perf_counter() - started:.1f}s")
+        finally:
+            conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""
+Bulk Data Generator for Surplus-to-Sustain
+Fills a freshly initialised database with realistic farmers, crops,
+buyers, transactions, storage bookings, notifications and waste flows
+
+Used by `reset_database.py --generate`. Output is deterministic for a given
+seed, as-of date and row counts. Every table has its own random stream,
+so changing one count doesn't reshuffle the others.
+
+Loading is done the fast way: triggers and secondary indexes are dropped,
+journaling and fsync are switched off, rows go in with executemany in
+CHUNK_SIZE-row transactions, and afterwards the indexes and triggers are
+recreated and everything they would have maintained (unread counters,
+buyer ledgers, impact and price rollups, full-text indexes, the sync
+change log) is rebuilt in one pass.
+"""
+
+import json
+import sqlite3
+import time
+from datetime import date
+
+import numpy as np
+
+from changelog import rebuild as rebuild_changelog
+from impact import DISPOSITIONS, rebuild as rebuild_impact
+from ledger import recompute as recompute_ledger
+from prices import rebuild as rebuild_prices
+from prediction import predict_yield_batch, get_model_version
+from search import FTS_TABLES, rebuild_index
+
+CHUNK_SIZE = 100_000
+
+# Row counts at --scale 1 (about 100k rows); --scale 100 gives about 10M
+BASE_COUNTS = {
+    'farmers': 1_000,
+    'buyers': 200,
+    'crops': 20_000,
+    'transactions': 30_000,
+    'storage_bookings': 5_000,
+    'notifications': 45_000,
+    'waste_flows': 10_000,
+}
+
+CROPS = ['tomato', 'onion', 'potato', 'wheat', 'rice', 'cabbage', 'cauliflower', 'brinjal', 'chili']
+SOIL_TYPES = ['loamy', 'clay', 'sandy', 'black']
+SEASONS = ['kharif', 'rabi', 'zaid']
+IRRIGATION_TYPES = ['drip', 'sprinkler', 'flood', 'rainfed']
+GROWTH_DAYS = {'tomato': 75, 'onion': 120, 'potato': 90, 'wheat': 120, 'rice': 120,
+               'cabbage': 70, 'cauliflower': 75, 'brinjal': 60, 'chili': 80}
+BUYER_TYPES = ['Processor', 'Storage', 'Retailer', 'NGO', 'Compost', 'Animal Feed']
+
+# (city, state, pincode prefix, latitude, longitude)
+CITIES = [
+    ('Nashik', 'Maharashtra', '422', 19.9975, 73.7898),
+    ('Pune', 'Maharashtra', '411', 18.5204, 73.8567),
+    ('Mumbai', 'Maharashtra', '400', 19.0760, 72.8777),
+    ('Nagpur', 'Maharashtra', '440', 21.1458, 79.0882),
+    ('Aurangabad', 'Maharashtra', '431', 19.8762, 75.3433),
+    ('Indore', 'Madhya Pradesh', '452', 22.7196, 75.8577),
+    ('Bhopal', 'Madhya Pradesh', '462', 23.2599, 77.4126),
+    ('Ahmedabad', 'Gujarat', '380', 23.0225, 72.5714),
+    ('Rajkot', 'Gujarat', '360', 22.3039, 70.8022),
+    ('Belagavi', 'Karnataka', '590', 15.8497, 74.4977),
+    ('Bengaluru', 'Karnataka', '560', 12.9716, 77.5946),
+    ('Hyderabad', 'Telangana', '500', 17.3850, 78.4867),
+    ('Ludhiana', 'Punjab', '141', 30.9010, 75.8573),
+    ('Jaipur', 'Rajasthan', '302', 26.9124, 75.7873),
+    ('Lucknow', 'Uttar Pradesh', '226', 26.8467, 80.9462),
+]
+FIRST_NAMES = ['Ramesh', 'Suresh', 'Anita', 'Sunita', 'Vijay', 'Lakshmi', 'Prakash', 'Meena',
+               'Ganesh', 'Kavita', 'Mahesh', 'Savita', 'Arjun', 'Pooja', 'Sanjay', 'Rekha']
+LAST_NAMES = ['Patil', 'Pawar', 'Shinde', 'Jadhav', 'Kulkarni', 'Deshmukh', 'Yadav', 'Sharma',
+              'Reddy', 'Singh', 'Gowda', 'Chauhan', 'Patel', 'More', 'Kale', 'Gaikwad']
+NOTIFICATION_TEMPLATES = [
+    ('success', 'Crop Added Successfully', 'Your {crop} crop has been added. Predicted surplus: {tons} tons.'),
+    ('warning', 'High Surplus Alert', 'Your {crop} crop may have a surplus of {tons} tons. Contact buyers early.'),
+    ('info', 'Harvest Reminder', 'Your {crop} crop is due for harvest in 7 days.'),
+    ('info', 'Buyer Interest', 'A buyer is interested in {tons} tons of {crop}.'),
+]
+
+
+def _dates(as_of, days_ago):
+    """'YYYY-MM-DD' strings for as_of minus an array of day offsets"""
+    return (np.datetime64(as_of) - days_ago.astype('timedelta64[D]')).astype(str)
+
+
+def _timestamps(day_strings, rng):
+    seconds = rng.integers(6 * 3600, 20 * 3600, len(day_strings))
+    times = np.char.add(' ', np.char.zfill((seconds // 3600).astype(str), 2))
+    times = np.char.add(times, np.char.add(':', np.char.zfill((seconds // 60 % 60).astype(str), 2)))
+    return np.char.add(np.char.add(day_strings, times), ':00')
+
+
+def _insert(conn, sql, columns):
+    """executemany one chunk in its own transaction"""
+    conn.execute('BEGIN')
+    conn.executemany(sql, zip(*[c.tolist() if hasattr(c, 'tolist') else c for c in columns]))
+    conn.execute('COMMIT')
+
+
+def _chunks(total):
+    for start in range(0, total, CHUNK_SIZE):
+        yield start, min(CHUNK_SIZE, total - start)
+
+
+# ==================== TABLE GENERATORS ====================
+
+def generate_farmers(conn, rng, count, password_hash, as_of):
+    """Farmers spread over the cities; returns each farmer's state"""
+    farmer_state = np.empty(count, dtype=object)
+    for start, n in _chunks(count):
+        ids = np.arange(start + 1, start + n + 1)
+        city = rng.integers(0, len(CITIES), n)
+        names = np.char.add(np.char.add(rng.choice(FIRST_NAMES, n), ' '), rng.choice(LAST_NAMES, n))
+        _insert(conn, '''INSERT INTO users (username, email, password, phone, full_name, city, state,
+                                            pincode, user_type, is_verified, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'farmer', 1, ?)''', [
+            np.char.add('farmer', ids.astype(str)),
+            np.char.add(np.char.add('farmer', ids.astype(str)), '@example.com'),
+            [password_hash] * n,
+            (9_000_000_000 + rng.integers(0, 999_999_999, n)).astype(str),
+            names,
+            [CITIES[c][0] for c in city],
+            [CITIES[c][1] for c in city],
+            [CITIES[c][2] + f'{p:03d}' for c, p in zip(city, rng.integers(1, 999, n))],
+            _timestamps(_dates(as_of, rng.integers(365, 1095, n)), rng),
+        ])
+        farmer_state[start:start + n] = [CITIES[c][1] for c in city]
+    return farmer_state
+
+
+def generate_buyers(conn, rng, count, first_id):
+    """Buyers with coordinates scattered around the cities; returns storage hub ids"""
+    city = rng.integers(0, len(CITIES), count)
+    buyer_type = rng.choice(BUYER_TYPES, count, p=[0.3, 0.15, 0.25, 0.1, 0.1, 0.1])
+    specialties = [json.dumps(['all']) if rng.random() < 0.3 else
+                   json.dumps(sorted(rng.choice(CROPS, rng.integers(1, 4), replace=False).tolist()))
+                   for _ in range(count)]
+    prices = np.where(np.isin(buyer_type, ['NGO']), 0,
+                      np.where(np.isin(buyer_type, ['Storage', 'Compost', 'Animal Feed']),
+                               rng.uniform(1, 3, count), rng.uniform(10, 22, count)))
+    _insert(conn, '''INSERT INTO buyers (name, buyer_type, phone, email, address, city, state, pincode,
+                                         latitude, longitude, capacity_tons, price_per_kg,
+                                         specialty_crops, rating, total_transactions)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)''', [
+        [f'{CITIES[c][0]} {t} {i}' for i, (c, t) in enumerate(zip(city, buyer_type), first_id)],
+        buyer_type,
+        (8_000_000_000 + rng.integers(0, 999_999_999, count)).astype(str),
+        [f'buyer{i}@example.com' for i in range(first_id, first_id + count)],
+        [f'Plot {p}, Market Yard' for p in rng.integers(1, 500, count)],
+        [CITIES[c][0] for c in city],
+        [CITIES[c][1] for c in city],
+        [CITIES[c][2] + f'{p:03d}' for c, p in zip(city, rng.integers(1, 999, count))],
+        np.round([CITIES[c][3] for c in city] + rng.normal(0, 0.15, count), 4),
+        np.round([CITIES[c][4] for c in city] + rng.normal(0, 0.15, count), 4),
+        np.round(rng.uniform(10, 150, count)),
+        np.round(prices, 1),
+        specialties,
+        np.round(rng.uniform(3.5, 5.0, count), 1),
+    ])
+    ids = np.arange(first_id, first_id + count)
+    return ids[buyer_type == 'Storage']
+
+
+def generate_crops(conn, rng, count, farmers, as_of):
+    """Crops with batch-predicted yields; returns (farmer_id, crop, harvest day offset) per crop"""
+    crop_farmer = np.empty(count, dtype=np.int64)
+    crop_kind = np.empty(count, dtype=np.int8)
+    crop_harvest = np.empty(count, dtype=np.int64)
+    model_version = get_model_version()
+
+    for start, n in _chunks(count):
+        farmer_id = rng.integers(1, farmers + 1, n)
+        kind = rng.integers(0, len(CROPS), n)
+        crop = np.asarray(CROPS)[kind]
+        soil = rng.choice(SOIL_TYPES, n)
+        season = rng.choice(SEASONS, n)
+        irrigation = rng.choice(IRRIGATION_TYPES, n, p=[0.3, 0.2, 0.3, 0.2])
+        area = np.round(np.clip(rng.lognormal(1.0, 0.6, n), 0.5, 10), 2)
+
+        planted_ago = rng.integers(0, 730, n)
+        growth = np.array([GROWTH_DAYS[c] for c in crop.tolist()])
+        harvest_ago = planted_ago - growth  # negative: harvest still ahead
+
+        predicted = predict_yield_batch(crop, area, soil, season, irrigation,
+                                        rainfall=rng.uniform(300, 1200, n),
+                                        temperature=rng.uniform(20, 35, n),
+                                        humidity=rng.uniform(50, 90, n))
+        consumption = np.round(predicted * rng.uniform(0.3, 0.9, n), 2)
+        surplus = np.round(np.maximum(predicted - consumption, 0), 2)
+        status = np.where(harvest_ago < 0, 'growing', rng.choice(['harvested', 'sold'], n, p=[0.3, 0.7]))
+
+        planting_date = _dates(as_of, planted_ago)
+        _insert(conn, '''INSERT INTO crops (farmer_id, crop_name, area, planting_date, expected_harvest_date,
+                                            soil_type, irrigation_type, season, expected_consumption,
+                                            predicted_yield, predicted_surplus, model_version, status,
+                                            created_at, updated_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', [
+            farmer_id, crop, area, planting_date, _dates(as_of, harvest_ago),
+            soil, irrigation, season, consumption, predicted, surplus, [model_version] * n, status,
+            _timestamps(planting_date, rng), _timestamps(planting_date, rng),
+        ])
+        crop_farmer[start:start + n] = farmer_id
+        crop_kind[start:start + n] = kind
+        crop_harvest[start:start + n] = harvest_ago
+    return crop_farmer, crop_kind, crop_harvest
+
+
+def generate_transactions(conn, rng, count, crop_farmer, crop_harvest, buyers, as_of):
+    # Only crops that have been harvested can be sold
+    harvested = np.flatnonzero(crop_harvest >= 0)
+    if not len(harvested):
+        return
+    for start, n in _chunks(count):
+        crop_index = rng.choice(harvested, n)
+        days_ago = np.maximum(crop_harvest[crop_index] - rng.integers(0, 30, n), 0)
+        quantity = np.round(rng.uniform(0.2, 8, n), 2)
+        price = np.round(rng.uniform(8, 25, n), 1)
+        status = rng.choice(['completed', 'pending', 'cancelled'], n, p=[0.75, 0.2, 0.05])
+        completed = status == 'completed'
+        payment = np.where(completed, rng.choice(['paid', 'pending'], n, p=[0.9, 0.1]), 'pending')
+        rating = [int(r) if c else None for r, c in zip(rng.integers(3, 6, n), completed)]
+        transaction_date = _dates(as_of, days_ago)
+        _insert(conn, '''INSERT INTO transactions (crop_id, buyer_id, farmer_id, quantity_tons, price_per_kg,
+                                                   total_amount, transaction_date, delivery_date, status,
+                                                   payment_status, rating, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', [
+            crop_index + 1, rng.integers(1, buyers + 1, n), crop_farmer[crop_index],
+            quantity, price, np.round(quantity * price * 1000, 2), transaction_date,
+            _dates(as_of, np.maximum(days_ago - rng.integers(1, 7, n), 0)),
+            status, payment, rating, _timestamps(transaction_date, rng),
+        ])
+
+
+def generate_storage_bookings(conn, rng, count, crop_farmer, crop_harvest, storage_hubs, as_of):
+    harvested = np.flatnonzero(crop_harvest >= 0)
+    if not len(harvested) or not len(storage_hubs):
+        return
+    for start, n in _chunks(count):
+        crop_index = rng.choice(harvested, n)
+        start_ago = crop_harvest[crop_index]
+        months = rng.integers(1, 7, n)
+        end_ago = start_ago - months * 30
+        quantity = np.round(rng.uniform(0.5, 10, n), 2)
+        cost = np.round(rng.uniform(1, 3, n), 2)
+        _insert(conn, '''INSERT INTO storage_bookings (farmer_id, crop_id, storage_hub_id, quantity_tons,
+                                                       start_date, end_date, cost_per_kg_month, total_cost,
+                                                       status)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', [
+            crop_farmer[crop_index], crop_index + 1, rng.choice(storage_hubs, n), quantity,
+            _dates(as_of, start_ago), _dates(as_of, end_ago), cost,
+            np.round(quantity * 1000 * cost * months, 2),
+            np.where(end_ago > 0, 'completed', 'active'),
+        ])
+
+
+def generate_notifications(conn, rng, count, crop_farmer, crop_kind, as_of):
+    for start, n in _chunks(count):
+        crop_index = rng.integers(0, len(crop_farmer), n)
+        template = rng.integers(0, len(NOTIFICATION_TEMPLATES), n)
+        tons = np.round(rng.uniform(0.5, 10, n), 1)
+        days_ago = rng.integers(0, 365, n)
+        crop_names = np.asarray(CROPS)[crop_kind[crop_index]]
+        _insert(conn, '''INSERT INTO notifications (user_id, title, message, type, is_read, action_url,
+                                                    created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''', [
+            crop_farmer[crop_index],
+            [NOTIFICATION_TEMPLATES[t][1] for t in template],
+            [NOTIFICATION_TEMPLATES[t][2].format(crop=c, tons=x)
+             for t, c, x in zip(template, crop_names.tolist(), tons.tolist())],
+            [NOTIFICATION_TEMPLATES[t][0] for t in template],
+            # Older notifications are more likely to have been read
+            (rng.random(n) < np.clip(days_ago / 30, 0.2, 0.97)).astype(int),
+            [f'/crop/{i + 1}' for i in crop_index],
+            _timestamps(_dates(as_of, days_ago), rng),
+        ])
+
+
+def generate_waste_flows(conn, rng, count, crop_farmer, crop_harvest, farmer_state, buyers, as_of):
+    """Dispositions of harvested crops, with values from the impact factors"""
+    harvested = np.flatnonzero(crop_harvest >= 0)
+    if not len(harvested):
+        return
+    kinds = list(DISPOSITIONS)
+    factors = np.array([DISPOSITIONS[k] for k in kinds])
+    for start, n in _chunks(count):
+        crop_index = rng.choice(harvested, n)
+        farmer_id = crop_farmer[crop_index]
+        kind = rng.choice(len(kinds), n, p=[0.2, 0.2, 0.15, 0.15, 0.15, 0.05, 0.1])
+        quantity = np.round(rng.uniform(0.1, 5, n), 2)
+        values = np.round(quantity[:, None] * factors[kind], 3)
+        status = rng.choice(['completed', 'pending', 'cancelled'], n, p=[0.8, 0.15, 0.05])
+        days_ago = np.maximum(crop_harvest[crop_index] - rng.integers(0, 45, n), 0)
+        created = _dates(as_of, days_ago)
+        processed = _dates(as_of, np.maximum(days_ago - rng.integers(0, 10, n), 0))
+        _insert(conn, '''INSERT INTO waste_flows (crop_id, farmer_id, waste_type, quantity_tons, destination_id,
+                                                  processing_date, food_saved, co2_saved, compost_generated,
+                                                  status, region, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', [
+            crop_index + 1, farmer_id, np.asarray(kinds)[kind], quantity, rng.integers(1, buyers + 1, n),
+            [d if s == 'completed' else None for d, s in zip(processed.tolist(), status.tolist())],
+            values[:, 0], values[:, 1], values[:, 2], status, farmer_state[farmer_id - 1],
+            _timestamps(created, rng),
+        ])
+
+
+# ==================== LOAD ORCHESTRATION ====================
+
+def _drop_derived(conn):
+    """Drop triggers and secondary indexes; returns their SQL for later"""
+    saved = conn.execute("""SELECT type, name, sql FROM sqlite_master
+                            WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+                            ORDER BY type""").fetchall()
+    for kind, name, _ in saved:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    return saved
+
+
+def _rebuild_derived(conn, saved):
+    for _, _, sql in saved:
+        conn.execute(sql)
+    conn.execute('BEGIN')
+    conn.execute('''UPDATE users SET unread_count =
+                      (SELECT COUNT(*) FROM notifications n
+                       WHERE n.user_id = users.id AND n.is_read = 0)''')
+    recompute_ledger(conn)
+    rebuild_impact(conn)
+    rebuild_prices(conn)
+    for fts_table in FTS_TABLES:
+        rebuild_index(conn, fts_table)
+    rebuild_changelog(conn)
+    conn.execute('COMMIT')
+
+
+def generate(db_path, counts, seed=42, as_of=None, password_hash='', log=print):
+    """Load generated rows into an initialised, empty database; returns rows per table"""
+    as_of = as_of or date.today().isoformat()
+    streams = {name: np.random.default_rng([seed, i]) for i, name in enumerate(BASE_COUNTS)}
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA locking_mode=EXCLUSIVE')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-262144')  # 256 MB
+
+    timings = {}
+
+    def step(label, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[label] = time.perf_counter() - start
+        log(f"  {label:<18} {timings[label]:7.1f}s")
+        return result
+
+    try:
+        saved = _drop_derived(conn)
+        sample_buyers = conn.execute('SELECT COUNT(*) FROM buyers').fetchone()[0]
+
+        farmer_state = step('farmers', generate_farmers, conn, streams['farmers'], counts['farmers'], password_hash, as_of)
+        storage_hubs = step('buyers', generate_buyers, conn, streams['buyers'], counts['buyers'], sample_buyers + 1)
+        storage_hubs = np.concatenate([storage_hubs, [row[0] for row in conn.execute(
+            "SELECT id FROM buyers WHERE buyer_type = 'Storage' AND id <= ?", (sample_buyers,))]]).astype(int)
+        crop_farmer, crop_kind, crop_harvest = step('crops', generate_crops, conn, streams['crops'],
+                                         counts['crops'], counts['farmers'], as_of)
+        total_buyers = sample_buyers + counts['buyers']
+        step('transactions', generate_transactions, conn, streams['transactions'], counts['transactions'],
+             crop_farmer, crop_harvest, total_buyers, as_of)
+        step('storage_bookings', generate_storage_bookings, conn, streams['storage_bookings'],
+             counts['storage_bookings'], crop_farmer, crop_harvest, storage_hubs, as_of)
+        step('notifications', generate_notifications, conn, streams['notifications'],
+             counts['notifications'], crop_farmer, crop_kind, as_of)
+        step('waste_flows', generate_waste_flows, conn, streams['waste_flows'], counts['waste_flows'],
+             crop_farmer, crop_harvest, farmer_state, total_buyers, as_of)
+
+        step('indexes/triggers', _rebuild_derived, conn, saved)
+        step('analyze', conn.execute, 'ANALYZE')
+    finally:
+        conn.execute('PRAGMA locking_mode=NORMAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.close()
+    return timings
@@ -0,0 +1,336 @@
+"""
+Feature-drift Monitor for Surplus-to-Sustain
+
+train_model.py saves a reference profile (drift_profile.json) next to the
+model: for every numeric input and for the model's own predictions, decile
+bin edges over the training data plus one bin below its minimum and one
+above its maximum; for every categorical input, its vocabulary. Without a
+saved profile one is built from training_data.csv at startup.
+
+Each worker counts live predict_yield() inputs and outputs into those same
+bins, in DRIFT_WINDOW_SECONDS windows of which the last DRIFT_WINDOWS are
+kept. Every window is a fixed set of count arrays plus, per categorical
+input, a DRIFT_TOP_UNKNOWN-entry Misra-Gries sketch of values outside the
+vocabulary, so memory doesn't grow with traffic.
+
+Drift is scored per feature against the reference:
+
+    psi              population stability index (< 0.1 stable, < 0.25 moderate, else shifted)
+    ks               largest gap between the binned cumulative distributions (numeric)
+    out_of_range     share of values outside the training range (numeric)
+    oov_rate         share of categories the model never saw, which fall back (categorical)
+
+    python drift.py     # observe() overhead and scores on reference vs shifted traffic
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+DRIFT_PROFILE = os.environ.get('DRIFT_PROFILE', 'drift_profile.json')
+DRIFT_TRAINING_DATA = 'training_data.csv'
+DRIFT_WINDOW_SECONDS = int(os.environ.get('DRIFT_WINDOW_SECONDS', 3600))
+DRIFT_WINDOWS = int(os.environ.get('DRIFT_WINDOWS', 24))
+DRIFT_TOP_UNKNOWN = int(os.environ.get('DRIFT_TOP_UNKNOWN', 10))
+DRIFT_MIN_SAMPLES = int(os.environ.get('DRIFT_MIN_SAMPLES', 100))
+DRIFT_BINS = 10
+
+NUMERIC_FEATURES = ('area', 'rainfall', 'temperature', 'humidity', 'prediction')
+CATEGORICAL_FEATURES = ('crop_name', 'soil_type', 'season', 'irrigation_type')
+
+# PSI at or above each threshold, highest first
+PSI_LEVELS = ((0.25, 'shifted'), (0.1, 'moderate'), (0.0, 'stable'))
+
+
+# ==================== REFERENCE PROFILE ====================
+
+def build_profile(inputs, predictions, source):
+    """
+    Reference profile from training inputs (a DataFrame or dict of columns)
+    and the model's predictions on them
+    """
+    columns = {name: np.asarray(inputs[name]) for name in NUMERIC_FEATURES + CATEGORICAL_FEATURES
+               if name != 'prediction'}
+    columns['prediction'] = np.asarray(predictions, dtype=float)
+    profile = {'source': source, 'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+               'rows': len(columns['prediction']), 'numeric': {}, 'categorical': {}}
+
+    for name in NUMERIC_FEATURES:
+        values = columns[name].astype(float)
+        inner = np.quantile(values, np.linspace(0, 1, DRIFT_BINS + 1)[1:-1])
+        # Values equal to the maximum still fall inside the training range
+        edges = np.unique(np.concatenate([[values.min()], inner, [np.nextafter(values.max(), np.inf)]]))
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        profile['numeric'][name] = {'edges': edges.tolist(), 'expected': (counts / len(values)).tolist()}
+
+    for name in CATEGORICAL_FEATURES:
+        values = np.char.lower(columns[name].astype(str))
+        vocabulary, counts = np.unique(values, return_counts=True)
+        profile['categorical'][name] = {'vocabulary': vocabulary.tolist(),
+                                        'expected': (counts / len(values)).tolist() + [0.0]}
+    return profile
+
+
+def save_profile(profile, path=DRIFT_PROFILE):
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=1)
+
+
+def load_profile(path=DRIFT_PROFILE, training_data=DRIFT_TRAINING_DATA):
+    """The saved profile, else one built from the training data (targets standing in for predictions)"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    if not os.path.exists(training_data):
+        return None
+    import pandas as pd
+    df = pd.read_csv(training_data)
+    return build_profile(df, df['yield_tons'], training_data)
+
+
+# ==================== SCORES ====================
+
+def psi(expected, actual):
+    """Population stability index of two bin distributions"""
+    e = np.clip(np.asarray(expected, dtype=float), 1e-4, None)
+    a = np.clip(np.asarray(actual, dtype=float), 1e-4, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def binned_ks(expected, actual):
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+def level(score):
+    return next(label for threshold, label in PSI_LEVELS if score >= threshold)
+
+
+# ==================== MONITOR ====================
+
+class _Window:
+    """Counts for one time window; its size depends only on the profile"""
+
+    def __init__(self, start, profile):
+        self.start = start
+        self.count = 0
+        self.counts = {name: np.zeros(len(spec['edges']) + 1, dtype=np.int64)
+                       for name, spec in profile['numeric'].items()}
+        self.counts.update({name: np.zeros(len(spec['vocabulary']) + 1, dtype=np.int64)
+                            for name, spec in profile['categorical'].items()})
+        self.unknown = {name: {} for name in profile['categorical']}
+
+    def note_unknown(self, name, value, times=1):
+        """Misra-Gries: keeps every value seen more than count / (k + 1) times, in k entries"""
+        sketch = self.unknown[name]
+        if value in sketch or len(sketch) < DRIFT_TOP_UNKNOWN:
+            sketch[value] = sketch.get(value, 0) + times
+            return
+        drop = min(times, min(sketch.values()))
+        for key in list(sketch):
+            sketch[key] -= drop
+            if sketch[key] <= 0:
+                del sketch[key]
+        if times > drop:
+            sketch[value] = times - drop
+
+
+class DriftMonitor:
+    """Windowed histograms of live prediction inputs and outputs against a reference profile"""
+
+    def __init__(self, profile, window_seconds=DRIFT_WINDOW_SECONDS, windows=DRIFT_WINDOWS):
+        self.profile = profile
+        self.window_seconds = window_seconds
+        self.windows = deque(maxlen=windows)
+        self.lock = threading.Lock()
+        if profile:
+            self.edges = {name: spec['edges'] for name, spec in profile['numeric'].items()}
+            self.index = {name: {value: i for i, value in enumerate(spec['vocabulary'])}
+                          for name, spec in profile['categorical'].items()}
+
+    def _current(self, now):
+        if not self.windows or now >= self.windows[-1].start + self.window_seconds:
+            self.windows.append(_Window(now - now % self.window_seconds, self.profile))
+        return self.windows[-1]
+
+    def observe(self, crop_name, area, soil_type, season, irrigation_type,
+                rainfall, temperature, humidity, prediction):
+        """Count one prediction (scalars); a no-op without a profile"""
+        if not self.profile:
+            return
+        numeric = {'area': area, 'rainfall': rainfall, 'temperature': temperature,
+                   'humidity': humidity, 'prediction': prediction}
+        categorical = {'crop_name': crop_name, 'soil_type': soil_type, 'season': season,
+                       'irrigation_type': irrigation_type}
+        with self.lock:
+            window = self._current(time.time())
+            window.count += 1
+            for name, value in numeric.items():
+                window.counts[name][bisect.bisect_right(self.edges[name], float(value))] += 1
+            for name, value in categorical.items():
+                value = str(value).lower()
+                i = self.index[name].get(value)
+                if i is None:
+                    i = len(self.index[name])
+                    window.note_unknown(name, value)
+                window.counts[name][i] += 1
+
+    def observe_batch(self, crop_names, areas, soil_types, seasons, irrigation_types,
+                      rainfall, temperature, humidity, predictions):
+        """Count many predictions at once; weather arguments may be scalars, as in predict_batch"""
+        if not self.profile:
+            return
+        n = len(predictions)
+        numeric = {'area': areas, 'rainfall': rainfall, 'temperature': temperature,
+                   'humidity': humidity, 'prediction': predictions}
+        categorical = {'crop_name': crop_names, 'soil_type': soil_types, 'season': seasons,
+                       'irrigation_type': irrigation_types}
+        binned = {name: np.bincount(np.searchsorted(self.edges[name],
+                                                    np.broadcast_to(np.asarray(values, dtype=float), (n,)),
+                                                    side='right'), minlength=len(self.edges[name]) + 1)
+                  for name, values in numeric.items()}
+        unknown = {}
+        for name, values in categorical.items():
+            values, counts = np.unique(np.char.lower(np.asarray(values, dtype=str)), return_counts=True)
+            index = self.index[name]
+            column = np.zeros(len(index) + 1, dtype=np.int64)
+            for value, count in zip(values.tolist(), counts.tolist()):
+                if value in index:
+                    column[index[value]] += count
+                else:
+                    column[-1] += count
+                    unknown.setdefault(name, []).append((value, count))
+            binned[name] = column
+        with self.lock:
+            window = self._current(time.time())
+            window.count += n
+            for name, column in binned.items():
+                window.counts[name] += column
+            for name, values in unknown.items():
+                for value, count in values:
+                    window.note_unknown(name, value, count)
+
+    def report(self, last=None):
+        """Drift scores over the last `last` windows (default all kept), plus a per-window summary"""
+        if not self.profile:
+            return {'profile': None}
+        with self.lock:
+            windows = list(self.windows)[-last:] if last else list(self.windows)
+            counts = {name: sum((w.counts[name] for w in windows), np.zeros_like(column))
+                      for name, column in self._current(time.time()).counts.items()} if windows else {}
+            unknown = {}
+            for w in windows:
+                for name, sketch in w.unknown.items():
+                    for value, count in sketch.items():
+                        unknown.setdefault(name, {}).setdefault(value, 0)
+                        unknown[name][value] += count
+            summary = [(w.start, w.count, {name: column.copy() for name, column in w.counts.items()})
+                       for w in windows]
+        total = sum(count for _, count, _ in summary)
+
+        features = {}
+        for name, spec in list(self.profile['numeric'].items()) + list(self.profile['categorical'].items()):
+            column = counts.get(name)
+            if column is None or not column.sum():
+                features[name] = {'status': 'no data'}
+                continue
+            actual = column / column.sum()
+            score = psi(spec['expected'], actual)
+            feature = {'psi': round(score, 4)}
+            if name in self.profile['numeric']:
+                feature['ks'] = round(binned_ks(spec['expected'], actual), 4)
+                feature['out_of_range'] = round(float(actual[0] + actual[-1]), 4)
+            else:
+                feature['oov_rate'] = round(float(actual[-1]), 4)
+                top = sorted(unknown.get(name, {}).items(), key=lambda item: -item[1])
+                feature['unknown'] = dict(top[:DRIFT_TOP_UNKNOWN])
+            feature['status'] = level(score) if total >= DRIFT_MIN_SAMPLES else 'insufficient data'
+            features[name] = feature
+
+        def window_psi(window_counts):
+            scores = [psi(spec['expected'], window_counts[name] / window_counts[name].sum())
+                      for name, spec in list(self.profile['numeric'].items())
+                      + list(self.profile['categorical'].items()) if window_counts[name].sum()]
+            return round(max(scores), 4) if scores else None
+
+        return {
+            'profile': {key: self.profile[key] for key in ('source', 'created_at', 'rows')},
+            'window_seconds': self.window_seconds,
+            'count': total,
+            'features': features,
+            'windows': [{'start': datetime.fromtimestamp(start, timezone.utc).isoformat(timespec='seconds'),
+                         'count': count, 'max_psi': window_psi(window_counts)}
+                        for start, count, window_counts in summary],
+        }
+
+
+# ==================== BENCHMARK ====================
+
+def _sample(df, rng, n, shifted=False):
+    """Training rows resampled; shifted traffic plants larger areas and crops the model never saw"""
+    rows = df.iloc[rng.integers(0, len(df), n)]
+    crops = rows['crop_name'].to_numpy(dtype=str)
+    area = rows['area'].to_numpy(dtype=float)
+    yields = rows['yield_tons'].to_numpy(dtype=float)
+    if shifted:
+        area, yields = area * 4, yields * 4
+        crops = np.where(rng.random(n) < 0.3, rng.choice(['mango', 'banana'], n), crops)
+    return (crops, area, rows['soil_type'].to_numpy(dtype=str), rows['season'].to_numpy(dtype=str),
+            rows['irrigation_type'].to_numpy(dtype=str), rows['rainfall'].to_numpy(dtype=float),
+            rows['temperature'].to_numpy(dtype=float), rows['humidity'].to_numpy(dtype=float), yields)
+
+
+def benchmark():
+    """Per-call overhead, constant memory and the scores on matching and drifted traffic"""
+    import pandas as pd
+
+    profile = load_profile()
+    if not profile or not os.path.exists(DRIFT_TRAINING_DATA):
+        print(f"⚠ Needs {DRIFT_TRAINING_DATA} to replay traffic from.")
+        return
+    df = pd.read_csv(DRIFT_TRAINING_DATA)
+    rng = np.random.default_rng(7)
+    print(f"\n🌱 Reference: {profile['source']} ({profile['rows']:,} rows)")
+
+    monitor = DriftMonitor(profile, window_seconds=1, windows=3)
+    rows = list(zip(*_sample(df, rng, 20_000)))
+    start = time.perf_counter()
+    for row in rows:
+        monitor.observe(*row)
+    per_call = (time.perf_counter() - start) * 1e6 / len(rows)
+    batch = _sample(df, rng, 100_000)
+    start = time.perf_counter()
+    monitor.observe_batch(*batch)
+    per_row = (time.perf_counter() - start) * 1e6 / 100_000
+    print(f"  observe(): {per_call:.1f} µs per prediction, observe_batch(): {per_row:.2f} µs per row")
+
+    def size(m):
+        return sum(column.nbytes for w in m.windows for column in w.counts.values())
+    before = size(monitor)
+    for _ in range(5):
+        time.sleep(1)
+        monitor.observe_batch(*_sample(df, rng, 200_000))
+    print(f"  count arrays: {before:,} bytes after 120k observations, "
+          f"{size(monitor):,} after 1.1M over {len(monitor.windows)} kept windows")
+
+    for label, shifted in (('training-like traffic', False), ('drifted traffic', True)):
+        monitor = DriftMonitor(profile)
+        monitor.observe_batch(*_sample(df, rng, 5_000, shifted))
+        features = monitor.report()['features']
+        print(f"\n  {label}")
+        print(f"  {'feature':<18}{'psi':>8}{'ks':>8}{'oor/oov':>10}  status")
+        for name, feature in features.items():
+            rate = feature.get('out_of_range', feature.get('oov_rate'))
+            ks = f"{feature['ks']:.3f}" if 'ks' in feature else ''
+            print(f"  {name:<18}{feature['psi']:>8.3f}{ks:>8}{rate:>10.1%}  {feature['status']}")
+
+
+if __name__ == '__main__':
+    benchmark()
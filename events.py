@@ -0,0 +1,236 @@
+"""
+Live Event Channel for Surplus-to-Sustain
+Server-Sent Events for new notifications and crop status changes
+
+Every event is a row in the `events` table, written by triggers, so its id
+is a monotonic cursor that clients resume from with Last-Event-ID. Inside a
+process, writers call `broker.wake(user_id)` after committing and waiting
+streams react at once. Events committed by other workers or by scripts
+(e.g. the harvest scheduler) are picked up by one poller thread per process
+that follows the global cursor and wakes the affected streams.
+
+Old events are pruned by a trigger on the table itself, so the log stays
+bounded whether or not any process has a stream open.
+
+Idle streams only block on a threading.Event, so the gevent deployment
+that serves /events (see gunicorn.conf.py) holds thousands of open
+connections per worker.
+Under the ASGI server, asgi.py serves /events with async_event_stream
+instead: idle streams await an asyncio.Event and hold no thread at all.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+HEARTBEAT_SECONDS = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', 2))
+EVENT_RETENTION_HOURS = int(os.environ.get('SSE_EVENT_RETENTION_HOURS', 24))
+EVENT_PRUNE_EVERY = int(os.environ.get('SSE_EVENT_PRUNE_EVERY', 1000))
+REPLAY_LIMIT = 100
+
+
+def init_events(cursor):
+    """Event log table and the triggers that feed it"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id, id)')
+    # Every EVENT_PRUNE_EVERY-th event deletes those older than the retention window, in whichever
+    # process wrote it. Ids follow created_at, so the scan stops at the first event it keeps.
+    # Recreated on every start so a changed setting takes effect.
+    cursor.execute('DROP TRIGGER IF EXISTS events_prune')
+    cursor.execute(f'''
+        CREATE TRIGGER events_prune AFTER INSERT ON events
+        WHEN new.id % {EVENT_PRUNE_EVERY} = 0 BEGIN
+            DELETE FROM events WHERE id < (SELECT id FROM events
+                                           WHERE created_at >= datetime('now', '-{EVENT_RETENTION_HOURS} hours')
+                                           ORDER BY id LIMIT 1);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS notifications_event_ai AFTER INSERT ON notifications BEGIN
+            INSERT INTO events (user_id, event, data)
+            VALUES (new.user_id, 'notification',
+                    json_object('id', new.id, 'title', new.title, 'message', new.message,
+                                'type', new.type, 'action_url', new.action_url));
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS crops_event_au AFTER UPDATE OF status ON crops
+        WHEN old.status IS NOT new.status BEGIN
+            INSERT INTO events (user_id, event, data)
+            VALUES (new.farmer_id, 'crop',
+                    json_object('id', new.id, 'crop_name', new.crop_name,
+                                'status', new.status, 'previous_status', old.status));
+        END
+    ''')
+
+
+class EventBroker:
+    """In-process pub/sub: one threading.Event per open stream, grouped by user"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.subscribers = {}  # user_id -> set of threading.Event
+        self.lock = threading.Lock()
+        self.poller = None
+
+    def subscribe(self, user_id, signal=None):
+        """A threading.Event set on wake, or the given signal (anything with set(), e.g. LoopSignal)"""
+        signal = signal or threading.Event()
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(signal)
+            if self.poller is None and POLL_SECONDS > 0:
+                self.poller = threading.Thread(target=self._poll, name='sse-poller', daemon=True)
+                self.poller.start()
+        return signal
+
+    def unsubscribe(self, user_id, signal):
+        with self.lock:
+            signals = self.subscribers.get(user_id)
+            if signals:
+                signals.discard(signal)
+                if not signals:
+                    del self.subscribers[user_id]
+
+    def wake(self, user_id):
+        """Tell this process's streams for a user that new events were committed"""
+        with self.lock:
+            signals = list(self.subscribers.get(user_id, ()))
+        for signal in signals:
+            signal.set()
+
+    def _poll(self):
+        """Follow the global event cursor for writes made outside this process"""
+        conn = sqlite3.connect(self.db_path)
+        cursor_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        while True:
+            time.sleep(POLL_SECONDS)
+            try:
+                rows = conn.execute('SELECT id, user_id FROM events WHERE id > ? ORDER BY id',
+                                    (cursor_id,)).fetchall()
+                if rows:
+                    cursor_id = rows[-1][0]
+                    for user_id in {row[1] for row in rows}:
+                        self.wake(user_id)
+            except sqlite3.OperationalError:
+                # Database busy or locked: try again on the next tick
+                pass
+
+
+def fetch_events(db_path, user_id, after_id, limit=REPLAY_LIMIT):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute('''SELECT id, event, data FROM events
+                              WHERE user_id = ? AND id > ?
+                              ORDER BY id LIMIT ?''',
+                            (user_id, after_id, limit)).fetchall()
+        unread = conn.execute('SELECT unread_count FROM users WHERE id = ?', (user_id,)).fetchone()
+    finally:
+        conn.close()
+    return rows, unread[0] if unread else 0
+
+
+def latest_event_id(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM events WHERE user_id = ?',
+                            (user_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def format_sse(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'
+
+
+def _frames(rows, unread):
+    """(event id, SSE frame) per event row; notifications carry the current unread count"""
+    for event_id, event, data in rows:
+        if event == 'notification':
+            payload = json.loads(data)
+            payload['unread_count'] = unread
+            data = json.dumps(payload)
+        yield event_id, format_sse(event_id, event, data)
+
+
+def event_stream(broker, user_id, last_event_id=None):
+    """
+    Generator of SSE frames for one user
+
+    Replays anything after last_event_id (or starts from "now"), then blocks
+    until woken, sending a comment heartbeat when idle.
+    """
+    cursor_id = last_event_id if last_event_id is not None else latest_event_id(broker.db_path, user_id)
+    signal = broker.subscribe(user_id)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            rows, unread = fetch_events(broker.db_path, user_id, cursor_id)
+            for cursor_id, frame in _frames(rows, unread):
+                yield frame
+            if len(rows) == REPLAY_LIMIT:
+                continue
+
+            if not signal.wait(HEARTBEAT_SECONDS):
+                yield ': heartbeat\n\n'
+            signal.clear()
+    finally:
+        broker.unsubscribe(user_id, signal)
+
+
+class LoopSignal:
+    """The part of threading.Event the broker uses, waking an asyncio.Event from any thread"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def set(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def clear(self):
+        self.event.clear()
+
+
+async def async_event_stream(broker, user_id, last_event_id=None):
+    """
+    event_stream for an event loop: the same frames, but an idle stream is
+    a suspended coroutine rather than a blocked thread. The short event
+    queries run on the default executor.
+    """
+    if last_event_id is None:
+        last_event_id = await asyncio.to_thread(latest_event_id, broker.db_path, user_id)
+    cursor_id = last_event_id
+    signal = broker.subscribe(user_id, LoopSignal())
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            rows, unread = await asyncio.to_thread(fetch_events, broker.db_path, user_id, cursor_id)
+            for cursor_id, frame in _frames(rows, unread):
+                yield frame
+            if len(rows) == REPLAY_LIMIT:
+                continue
+
+            if not await signal.wait(HEARTBEAT_SECONDS):
+                yield ': heartbeat\n\n'
+            signal.clear()
+    finally:
+        broker.unsubscribe(user_id, signal)
@@ -0,0 +1,159 @@
+"""
+Streaming Exports for Surplus-to-Sustain
+Streams a farmer's crops and transactions as NDJSON, CSV or XLSX straight
+from the storage cursor (server-side on PostgreSQL), so memory stays flat
+however many rows there are
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+# FETCH_SIZE: rows pulled from the cursor per step, and the size of each streamed chunk
+from storage import FETCH_SIZE
+
+# dataset -> (SELECT ..., date column used for range filters, status column,
+#             table that retention.py archives, read as {table} in the SELECT)
+EXPORT_DATASETS = {
+    'crops': ('''SELECT c.id, c.crop_name, c.variety, c.area, c.planting_date,
+                        c.expected_harvest_date, c.actual_harvest_date, c.soil_type,
+                        c.irrigation_type, c.season, c.expected_consumption,
+                        c.predicted_yield, c.predicted_surplus, c.actual_yield,
+                        c.actual_surplus, c.status, c.notes, c.created_at
+                 FROM crops c
+                 WHERE c.farmer_id = ?''',
+              'c.planting_date', 'c.status', None),
+    'transactions': ('''SELECT t.id, t.transaction_date, c.crop_name, b.name AS buyer_name,
+                               t.quantity_tons, t.price_per_kg, t.total_amount,
+                               t.delivery_date, t.status, t.payment_status, t.rating,
+                               t.created_at
+                        FROM {table} t
+                        JOIN buyers b ON t.buyer_id = b.id
+                        JOIN crops c ON t.crop_id = c.id
+                        WHERE t.farmer_id = ?''',
+                     't.transaction_date', 't.status', 'transactions'),
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def create_export_indexes(cursor):
+    """Indexes behind the export filters (farmer + optional status + date range)"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crops_farmer_planting ON crops(farmer_id, planting_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crops_farmer_status ON crops(farmer_id, status, planting_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_farmer_date ON transactions(farmer_id, transaction_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_farmer_status ON transactions(farmer_id, status, transaction_date)')
+
+
+def export_query(dataset, user_id, date_from=None, date_to=None, status=None, archived=False):
+    """
+    Build the filtered, index-ordered query for a dataset
+
+    With archived=True (SQLite, where retention.py moves old rows into the
+    attached archive) an archived table is read as a UNION ALL of the live
+    and archive tables, each filtered and walked along its own date index;
+    the ORDER BY on the compound merges the two ordered halves rather than
+    sorting the whole history. Without an archive the live table is read.
+    """
+    base_query, date_col, status_col, table = EXPORT_DATASETS[dataset]
+    sources = [f'main.{table}', f'archive.{table}'] if table and archived else [table]
+
+    selects, params = [], []
+    for source in sources:
+        query = base_query.format(table=source) if table else base_query
+        params.append(user_id)
+        if status:
+            query += f' AND {status_col} = ?'
+            params.append(status)
+        if date_from:
+            query += f' AND {date_col} >= ?'
+            params.append(date_from)
+        if date_to:
+            query += f' AND {date_col} <= ?'
+            params.append(date_to)
+        selects.append(query)
+
+    # Ordering on the indexed date column lets the database walk the index instead of sorting;
+    # a compound SELECT can only be ordered by its result column names
+    if len(selects) > 1:
+        return ' UNION ALL '.join(selects) + f" ORDER BY {date_col.split('.')[-1]}", params
+    return selects[0] + f' ORDER BY {date_col}', params
+
+
+def stream_ndjson(rows):
+    """One JSON object per line"""
+    columns = next(rows)
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(dict(zip(columns, row)), default=str))
+        if len(buffer) >= FETCH_SIZE:
+            yield '\n'.join(buffer) + '\n'
+            buffer = []
+    if buffer:
+        yield '\n'.join(buffer) + '\n'
+
+
+def stream_csv(rows):
+    """Header row followed by data rows, flushed every FETCH_SIZE rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(next(rows))
+    count = 0
+    for row in rows:
+        writer.writerow(tuple(row))
+        count += 1
+        if count % FETCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_xlsx(rows, chunk_size=64 * 1024):
+    """
+    Write-only workbook spooled to a temp file, then streamed back
+
+    openpyxl's write-only mode serialises each appended row immediately,
+    so only the current row is held in memory. The xlsx zip container
+    can't be produced incrementally, hence the temp file.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Export')
+    sheet.append(next(rows))
+    for row in rows:
+        sheet.append(tuple(row))
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+STREAMERS = {
+    'ndjson': stream_ndjson,
+    'csv': stream_csv,
+    'xlsx': stream_xlsx,
+}
+
+
+def stream_export(storage, dataset, fmt, user_id, date_from=None, date_to=None, status=None):
+    """Generator of response chunks for one export"""
+    query, params = export_query(dataset, user_id, date_from, date_to, status,
+                                 archived=storage.sqlite_backed)
+    return STREAMERS[fmt](storage.iter_rows(query, params, FETCH_SIZE))
@@ -0,0 +1,320 @@
+"""
+Template Fragment Cache for Surplus-to-Sustain
+
+    {% cache ('crop-buyers', crop.crop_name), 600, ['buyers'] %}
+        ... expensive markup ...
+    {% endcache %}
+
+The block takes a key (any repr-able value, or none to bypass the cache), a
+TTL in seconds and an optional list of generation names. Rendered HTML is
+kept in a bounded in-process LRU and, if FRAGMENT_CACHE_DB is set, in a
+SQLite file shared by all workers.
+
+Invalidation is generation based: triggers bump a counter in
+`cache_generations` whenever crops change or a buyer is added, removed or
+changes in a way pages show (BUYER_VISIBLE_COLUMNS), the current counters
+are part of every cache key, so a write makes the old entries unreachable
+in every worker at once and they simply age out.
+
+The counters live in the same SQLite file as the rows they track. With
+the sharded backend that is the signed-in user's shard, so the cache is
+given a function returning the current request's file rather than a
+path; the file is part of every key too, since buyer rankings and cards
+differ between shards.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 1000))
+FRAGMENT_CACHE_DB = os.environ.get('FRAGMENT_CACHE_DB', '')
+DEFAULT_TTL = 300
+
+# Buyer columns that pages show or rank by. The ledger's running totals are
+# left out: every sale rewrites them, and bumping the generation per sale
+# would expire every user's buyer fragments and ETags. total_transactions
+# ("12 sales" on a card) can therefore lag by up to the fragment's TTL.
+BUYER_VISIBLE_COLUMNS = ('name', 'buyer_type', 'phone', 'email', 'address', 'city', 'state', 'pincode',
+                         'latitude', 'longitude', 'capacity_tons', 'price_per_kg', 'specialty_crops',
+                         'is_verified', 'rating', 'decayed_rating')
+
+
+def init_generations(cursor):
+    """Generation counters and the triggers that bump them"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    bump = '''INSERT INTO cache_generations (name, generation) VALUES ('buyers', 1)
+              ON CONFLICT(name) DO UPDATE SET generation = generation + 1;'''
+    for event in ('INSERT', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS buyers_generation_{event.lower()} AFTER {event} ON buyers BEGIN
+                {bump}
+            END
+        ''')
+    # Recreated on every start, so databases from before the column list pick it up
+    changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in BUYER_VISIBLE_COLUMNS)
+    cursor.execute('DROP TRIGGER IF EXISTS buyers_generation_update')
+    cursor.execute(f'''
+        CREATE TRIGGER buyers_generation_update AFTER UPDATE OF {', '.join(BUYER_VISIBLE_COLUMNS)} ON buyers
+        WHEN {changed} BEGIN
+            {bump}
+        END
+    ''')
+    for event in ('UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS crops_generation_{event.lower()} AFTER {event} ON crops BEGIN
+                INSERT INTO cache_generations (name, generation) VALUES ('crop:' || old.id, 1)
+                ON CONFLICT(name) DO UPDATE SET generation = generation + 1;
+            END
+        ''')
+
+
+class Deferred:
+    """
+    A sequence that runs its loader on first use
+
+    Views pass query results wrapped in this, so a cache hit in the
+    template never runs the query at all.
+    """
+
+    def __init__(self, loader, *args):
+        self.loader = loader
+        self.args = args
+        self._rows = None
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = self.loader(*self.args)
+        return self._rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+
+class FragmentCache:
+    """Bounded LRU of rendered HTML with an optional shared SQLite tier"""
+
+    def __init__(self, db_path, max_entries=FRAGMENT_CACHE_SIZE, shared_path=FRAGMENT_CACHE_DB):
+        # A path, or a function returning the current request's path
+        self.locate = db_path if callable(db_path) else lambda: db_path
+        self.max_entries = max_entries
+        self.shared_path = shared_path
+        self.entries = OrderedDict()  # key -> (html, expires_at, render_seconds)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {'hits': 0, 'shared_hits': 0, 'misses': 0,
+                      'render_seconds': 0.0, 'saved_seconds': 0.0}
+
+    # ---------- connections ----------
+
+    def _connection(self, path):
+        conns = getattr(self.local, 'conns', None)
+        if conns is None:
+            conns = self.local.conns = {}
+        conn = conns.get(path)
+        if conn is None:
+            conn = conns[path] = sqlite3.connect(path, timeout=1)
+        return conn
+
+    def _shared(self):
+        conn = getattr(self.local, 'shared', None)
+        if conn is None:
+            conn = self.local.shared = self._connection(self.shared_path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS fragments (
+                                key TEXT PRIMARY KEY,
+                                html TEXT NOT NULL,
+                                render_seconds REAL NOT NULL,
+                                expires_at REAL NOT NULL
+                            ) WITHOUT ROWID''')
+        return conn
+
+    def generations(self, names, db_path=None):
+        """Current generation of each name in db_path (default: the request's file), read once per request"""
+        if not names:
+            return ()
+        db_path = db_path or self.locate()
+        memo = g.setdefault('cache_generations', {}) if has_request_context() else {}
+        memo = memo.setdefault(db_path, {})
+        missing = [name for name in names if name not in memo]
+        if missing:
+            memo.update(dict.fromkeys(missing, 0))
+            try:
+                memo.update(self._connection(db_path).execute(
+                    f'''SELECT name, generation FROM cache_generations
+                        WHERE name IN ({','.join('?' * len(missing))})''', missing).fetchall())
+            except sqlite3.OperationalError:
+                # Schema not initialised yet: everything is at generation 0
+                pass
+        return tuple(memo[name] for name in names)
+
+    # ---------- lookup ----------
+
+    def _get(self, key, now):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self.entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    self.stats['saved_seconds'] += entry[2]
+                    return entry[0]
+                del self.entries[key]
+
+        if not self.shared_path:
+            return None
+        try:
+            row = self._shared().execute(
+                'SELECT html, render_seconds, expires_at FROM fragments WHERE key = ? AND expires_at > ?',
+                (key, now)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if row is None:
+            return None
+        self._put_local(key, row[0], row[2], row[1])
+        with self.lock:
+            self.stats['shared_hits'] += 1
+            self.stats['saved_seconds'] += row[1]
+        return row[0]
+
+    def _put_local(self, key, html, expires_at, render_seconds):
+        with self.lock:
+            self.entries[key] = (html, expires_at, render_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _put(self, key, html, ttl, render_seconds):
+        expires_at = time.time() + ttl
+        self._put_local(key, html, expires_at, render_seconds)
+        if not self.shared_path:
+            return
+        try:
+            conn = self._shared()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?)',
+                             (key, html, render_seconds, expires_at))
+                conn.execute('DELETE FROM fragments WHERE expires_at < ?', (time.time(),))
+        except sqlite3.OperationalError:
+            # Shared tier busy: the local copy is enough
+            pass
+
+    def fetch(self, key, ttl, depends, render):
+        """Cached HTML for key, or render() it and store the result"""
+        if key is None:
+            return render()
+        depends = tuple(depends or ())
+        db_path = self.locate()
+        full_key = f'{db_path}|{key!r}|{dict(zip(depends, self.generations(depends, db_path)))!r}'
+
+        html = self._get(full_key, time.time())
+        if html is not None:
+            return html
+
+        start = time.perf_counter()
+        html = render()
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.stats['misses'] += 1
+            self.stats['render_seconds'] += elapsed
+        self._put(full_key, html, ttl or DEFAULT_TTL, elapsed)
+        return html
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def report(self):
+        """Hit ratio and render time saved, for /api/metrics"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['shared_hits']) / lookups, 3) if lookups else None
+        stats['render_seconds'] = round(stats['render_seconds'], 4)
+        stats['saved_seconds'] = round(stats['saved_seconds'], 4)
+        return stats
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja `{% cache key, ttl, depends %}...{% endcache %}` block"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma') and len(args) < 3:
+            args.append(parser.parse_expression())
+        while len(args) < 3:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, depends, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return Markup(cache.fetch(key, ttl, depends, lambda: str(caller())))
+
+
+def init_fragment_cache(app, db_path):
+    """
+    Register the {% cache %} tag on app and return its FragmentCache
+
+    db_path is the file holding the generation counters, or a function
+    returning it for the current request.
+    """
+    cache = FragmentCache(db_path)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = cache
+    return cache
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from jinja2 import Environment
+
+    print("\n" + "="*60)
+    print(" FRAGMENT CACHE BENCHMARK ")
+    print("="*60)
+
+    env = Environment(extensions=[FragmentCacheExtension], autoescape=True)
+    env.fragment_cache = FragmentCache(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    body = '''{% for buyer in buyers %}<div class="card"><h5>{{ buyer.name | title }}</h5>
+              <p>{{ buyer.city }} - ₹{{ buyer.price }}/kg, {{ buyer.rating }}/5</p></div>{% endfor %}'''
+    plain = env.from_string(body)
+    cached = env.from_string('{% cache "bench", 600 %}' + body + '{% endcache %}')
+    buyers = [{'name': f'buyer {i}', 'city': 'Pune', 'price': 12.5, 'rating': 4.5} for i in range(200)]
+
+    for label, template in (('uncached', plain), ('cached', cached)):
+        start = time.perf_counter()
+        for _ in range(500):
+            template.render(buyers=buyers)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<10} {elapsed * 1000 / 500:8.3f} ms/render")
+    print(f"\n✓ {env.fragment_cache.report()}")
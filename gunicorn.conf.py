@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for Surplus-to-Sustain
+
+    gunicorn app:app                                        # everything
+    GUNICORN_WORKER_CLASS=gevent BIND=0.0.0.0:8001 \\
+        gunicorn app:app                                    # /events only, behind the proxy
+
+The general deployment uses threaded (gthread) workers. Logins hash on the
+KDF pool in auth.py, async views query on aiodb's reader threads, and the
+sharded and ledger fan-outs use thread pools too: all of it is C code that
+releases the GIL, so real threads keep the worker responsive. Under gevent
+those pools are monkey-patched into greenlets and a single password hash or
+slow query would stall every connection on the worker.
+
+Server-Sent Events are the opposite case: thousands of idle streams that
+mostly wait on a threading.Event, one thread each under gthread. Run a
+second deployment with GUNICORN_WORKER_CLASS=gevent and have the proxy send
+only /events to it, where a worker holds GUNICORN_WORKER_CONNECTIONS
+streams and the short event queries don't hurt. (Under the ASGI server,
+asgi.py serves /events without a thread per stream instead.)
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))  # gthread only
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))  # gevent only
+
+# SSE streams stay open indefinitely; heartbeats keep proxies from closing them
+timeout = 60
+keepalive = 75
@@ -0,0 +1,449 @@
+"""
+Waste-Flow Impact Ledger for Surplus-to-Sustain
+
+    python impact.py --backfill                    # rebuild the rollups from every waste flow, in chunks
+    python impact.py --benchmark --flows 1000000
+
+A waste flow records where part of a crop actually went: donated, sold on,
+processed, fed to animals, composted, digested or landfilled. Its food saved,
+CO₂ avoided and compost produced are fixed when it is recorded, from the
+DISPOSITIONS factors unless measured values are given, so revising a factor
+never rewrites history. Its region is the farmer's state at that time.
+
+Completed flows are summed into impact_rollups by triggers, in the same
+write transaction as the flow itself:
+
+    ('farmer', <farmer id>)   the personal impact page
+    ('region', <state>)       the public impact page's breakdown
+    ('platform', '')          the public impact page's totals
+
+so both pages read rows by primary key however many flows there are.
+Waste flows are never archived, so deletes are reversed too.
+"""
+
+import argparse
+import os
+import secrets
+import sqlite3
+import time
+from datetime import date, datetime
+
+from changelog import pinned_readers, rows_changed_after
+
+IMPACT_CHUNK_SIZE = int(os.environ.get('IMPACT_CHUNK_SIZE', 50_000))
+MAX_FLOWS_PER_REQUEST = 500
+MAX_LABELS = 240
+
+# Per ton disposed: (tons of food saved, tons of CO₂e avoided, tons of compost).
+# Food kept in the food chain avoids ~2.5 t CO₂e per ton, as the impact page has always assumed.
+DISPOSITIONS = {
+    'donation': (1.0, 2.5, 0.0),
+    'resale': (1.0, 2.5, 0.0),
+    'processing': (1.0, 2.2, 0.0),
+    'animal_feed': (0.0, 1.5, 0.0),
+    'compost': (0.0, 0.6, 0.4),
+    'biogas': (0.0, 0.9, 0.2),
+    'landfill': (0.0, 0.0, 0.0),
+}
+
+FLOW_STATUSES = ('pending', 'completed', 'cancelled')
+
+# Columns added to waste_flows by init_db
+WASTE_FLOW_COLUMNS = {
+    'food_saved': 'REAL',
+    'region': 'TEXT',
+}
+
+ROLLUP_VALUES = ('flows', 'quantity_tons', 'food_saved', 'co2_saved', 'compost_generated')
+
+_TRACKED = ('status', 'farmer_id', 'region', 'quantity_tons', 'food_saved', 'co2_saved', 'compost_generated')
+
+
+def disposition_values(waste_type, quantity_tons):
+    """(food_saved, co2_saved, compost_generated) for a quantity sent to a disposition"""
+    return tuple(round(quantity_tons * factor, 3) for factor in DISPOSITIONS[waste_type])
+
+
+def new_qr_code():
+    """Unguessable label code; the QR encodes the public trace URL for it"""
+    return 'WF' + secrets.token_hex(6).upper()
+
+
+def _optional_number(item, name):
+    value = item.get(name)
+    if value is None or value == '':
+        return None
+    value = float(value)
+    if value < 0:
+        raise ValueError(f'{name} cannot be negative')
+    return value
+
+
+def parse_flow(item):
+    """
+    Validate one waste flow from an API request; raises ValueError
+
+    Measured co2_saved / compost_generated override the factor estimates.
+    Every flow gets a new QR code.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('each flow must be an object')
+    try:
+        crop_id = int(item['crop_id'])
+        quantity = float(item['quantity_tons'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('crop_id and quantity_tons are required numbers')
+    waste_type = item.get('waste_type')
+    if waste_type not in DISPOSITIONS:
+        raise ValueError(f'waste_type must be one of {", ".join(DISPOSITIONS)}')
+    if quantity <= 0:
+        raise ValueError('quantity_tons must be positive')
+    status = item.get('status') or 'pending'
+    if status not in FLOW_STATUSES:
+        raise ValueError(f'status must be one of {", ".join(FLOW_STATUSES)}')
+    processing_date = item.get('processing_date') or None
+    if processing_date:
+        datetime.strptime(processing_date, '%Y-%m-%d')
+    elif status == 'completed':
+        processing_date = date.today().isoformat()
+    destination_id = item.get('destination_id')
+    destination_id = int(destination_id) if destination_id not in (None, '') else None
+
+    food_saved, co2_saved, compost = disposition_values(waste_type, quantity)
+    measured_co2 = _optional_number(item, 'co2_saved')
+    measured_compost = _optional_number(item, 'compost_generated')
+    return {
+        'crop_id': crop_id,
+        'waste_type': waste_type,
+        'quantity_tons': quantity,
+        'destination_id': destination_id,
+        'processing_date': processing_date,
+        'status': status,
+        'food_saved': food_saved,
+        'co2_saved': co2_saved if measured_co2 is None else measured_co2,
+        'compost_generated': compost if measured_compost is None else measured_compost,
+        'qr_code': new_qr_code(),
+    }
+
+
+# ==================== ROLLUP TRIGGERS ====================
+
+def _upsert(row, sign):
+    """One upsert adding (sign '+') or removing ('-') a completed flow from its three rollups"""
+    values = [f'{sign}1', f'{sign}{row}.quantity_tons'] + \
+             [f'{sign}COALESCE({row}.{col}, 0)' for col in ROLLUP_VALUES[2:]]
+    keys = [("'farmer'", f'{row}.farmer_id'), ("'region'", f"COALESCE({row}.region, '')"), ("'platform'", "''")]
+    rows = ',\n'.join(f"({scope}, {key}, {', '.join(values)}, CURRENT_TIMESTAMP)" for scope, key in keys)
+    updates = ', '.join(f'{col} = {col} + excluded.{col}' for col in ROLLUP_VALUES)
+    return f'''INSERT INTO impact_rollups (scope, scope_key, {', '.join(ROLLUP_VALUES)}, updated_at)
+               VALUES {rows}
+               ON CONFLICT(scope, scope_key) DO UPDATE SET {updates}, updated_at = excluded.updated_at;'''
+
+
+def init_impact(cursor):
+    """Rollup table, its triggers and the waste_flows indexes (columns are added by init_db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS impact_rollups (
+            scope TEXT NOT NULL,
+            scope_key TEXT NOT NULL,
+            flows INTEGER NOT NULL DEFAULT 0,
+            quantity_tons REAL NOT NULL DEFAULT 0,
+            food_saved REAL NOT NULL DEFAULT 0,
+            co2_saved REAL NOT NULL DEFAULT 0,
+            compost_generated REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (scope, scope_key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS waste_flows_impact_insert AFTER INSERT ON waste_flows
+        WHEN new.status = 'completed' BEGIN
+            {_upsert('new', '+')}
+        END
+    ''')
+    # Old and new halves of an update are separate triggers; the sums don't care about order
+    changed = ' OR '.join(f'old.{col} IS NOT new.{col}' for col in _TRACKED)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS waste_flows_impact_update_old AFTER UPDATE OF {', '.join(_TRACKED)}
+        ON waste_flows WHEN old.status = 'completed' AND ({changed}) BEGIN
+            {_upsert('old', '-')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS waste_flows_impact_update_new AFTER UPDATE OF {', '.join(_TRACKED)}
+        ON waste_flows WHEN new.status = 'completed' AND ({changed}) BEGIN
+            {_upsert('new', '+')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS waste_flows_impact_delete AFTER DELETE ON waste_flows
+        WHEN old.status = 'completed' BEGIN
+            {_upsert('old', '-')}
+        END
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_waste_flows_farmer ON waste_flows(farmer_id, created_at)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_waste_flows_qr ON waste_flows(qr_code)')
+
+
+# ==================== BACKFILL ====================
+
+def _factor(index):
+    cases = ' '.join(f"WHEN '{name}' THEN {factors[index]}" for name, factors in DISPOSITIONS.items())
+    return f'(CASE waste_type {cases} ELSE 0 END)'
+
+
+def fill_missing(conn, low, high):
+    """Derive values and regions for flows in (low, high] recorded before they were stored"""
+    return conn.execute(f'''UPDATE waste_flows SET
+                               food_saved = COALESCE(food_saved, ROUND(quantity_tons * {_factor(0)}, 3)),
+                               co2_saved = COALESCE(co2_saved, ROUND(quantity_tons * {_factor(1)}, 3)),
+                               compost_generated = COALESCE(compost_generated,
+                                                            ROUND(quantity_tons * {_factor(2)}, 3)),
+                               region = COALESCE(region, (SELECT COALESCE(TRIM(state), '') FROM users
+                                                          WHERE users.id = waste_flows.farmer_id), '')
+                           WHERE id > ? AND id <= ?
+                           AND (food_saved IS NULL OR co2_saved IS NULL OR compost_generated IS NULL
+                                OR region IS NULL)''', (low, high)).rowcount
+
+
+def _sums(conn, where, params):
+    """{(scope, key): [flows, tons, food, co2, compost]} over the matching completed flows"""
+    totals = {}
+    rows = conn.execute(f'''SELECT farmer_id, COALESCE(region, ''), COUNT(*), TOTAL(quantity_tons),
+                                  TOTAL(food_saved), TOTAL(co2_saved), TOTAL(compost_generated)
+                           FROM waste_flows
+                           WHERE {where} AND status = 'completed'
+                           GROUP BY farmer_id, COALESCE(region, '')''', params)
+    for farmer_id, region, *values in rows:
+        for key in (('farmer', str(farmer_id)), ('region', region), ('platform', '')):
+            if key in totals:
+                totals[key] = [a + b for a, b in zip(totals[key], values)]
+            else:
+                totals[key] = list(values)
+    return totals
+
+
+def _aggregate(conn, low, high):
+    """Sums over completed flows with ids in (low, high]"""
+    return _sums(conn, 'id > ? AND id <= ?', (low, high))
+
+
+def _aggregate_rows(conn, ids, batch=500):
+    """Sums over the completed flows among the given ids"""
+    totals = {}
+    for i in range(0, len(ids), batch):
+        chunk = ids[i:i + batch]
+        _merge(totals, _sums(conn, f"id IN ({', '.join('?' * len(chunk))})", chunk))
+    return totals
+
+
+def _merge(totals, partial):
+    for key, values in partial.items():
+        totals[key] = [a + b for a, b in zip(totals[key], values)] if key in totals else values
+    return totals
+
+
+def replace_rollups(conn, totals):
+    """Swap in freshly computed rollups; run inside the caller's transaction"""
+    conn.execute('DELETE FROM impact_rollups')
+    conn.executemany(f'''INSERT INTO impact_rollups (scope, scope_key, {', '.join(ROLLUP_VALUES)}, updated_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)''',
+                     [(*key, *values) for key, values in totals.items()])
+
+
+def rebuild(conn):
+    """Serial rebuild on one connection, inside the caller's transaction (used by datagen)"""
+    fill_missing(conn, 0, 2 ** 63 - 1)
+    totals = _aggregate(conn, 0, 2 ** 63 - 1)
+    replace_rollups(conn, totals)
+    return len(totals)
+
+
+def backfill(db_path, chunk_size=IMPACT_CHUNK_SIZE, log=print):
+    """
+    Rebuild every rollup from waste_flows; returns (rollups, seconds)
+
+    First stores any values older flows are missing, one id chunk per short
+    write transaction, so the web app keeps writing in between. Then sums
+    the flows chunk by chunk on a reader pinned to one committed state
+    (changelog.pinned_readers), holding no lock. The final transaction
+    takes the flows logged in change_log since that state, swaps the share
+    the scan saw for their current one, and swaps in the rollups.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    reader = None
+    try:
+        top = conn.execute('SELECT COALESCE(MAX(id), 0) FROM waste_flows').fetchone()[0]
+        filled = 0
+        for low in range(0, top, chunk_size):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                filled += fill_missing(conn, low, min(low + chunk_size, top))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+        (reader,), seq = pinned_readers(conn, db_path, 1)
+        top = reader.execute('SELECT COALESCE(MAX(id), 0) FROM waste_flows').fetchone()[0]
+        totals = {}
+        for low in range(0, top, chunk_size):
+            high = min(low + chunk_size, top)
+            _merge(totals, _aggregate(reader, low, high))
+            log(f"  flows {low + 1:,}–{high:,} of {top:,}")
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            filled += fill_missing(conn, top, 2 ** 63 - 1)
+            changed = rows_changed_after(conn, 'waste_flows', seq)
+            seen = _aggregate_rows(reader, changed)
+            _merge(totals, {key: [-value for value in values] for key, values in seen.items()})
+            _merge(totals, _aggregate_rows(conn, changed))
+            reader.close()
+            reader = None
+            replace_rollups(conn, totals)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        if reader is not None:
+            reader.close()
+        conn.close()
+    if filled:
+        log(f"  derived values for {filled:,} older flows")
+    return len(totals), time.perf_counter() - start
+
+
+# ==================== QR LABELS ====================
+
+def render_labels(flows, trace_url):
+    """
+    A4 PDF sheet of QR labels (3 x 7 per page), one per flow row
+
+    trace_url(code) gives the URL each QR code encodes.
+    """
+    from io import BytesIO
+    from reportlab.graphics import renderPDF
+    from reportlab.graphics.barcode.qr import QrCodeWidget
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+
+    columns, rows = 3, 7
+    width, height = A4
+    cell_w, cell_h = (width - 20 * mm) / columns, (height - 20 * mm) / rows
+    size = cell_h - 12 * mm
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    for i, flow in enumerate(flows):
+        if i and i % (columns * rows) == 0:
+            pdf.showPage()
+        col, row = i % columns, i // columns % rows
+        x = 10 * mm + col * cell_w
+        y = height - 10 * mm - (row + 1) * cell_h
+
+        widget = QrCodeWidget(trace_url(flow['qr_code']), barLevel='M')
+        x0, y0, x1, y1 = widget.getBounds()
+        drawing = Drawing(size, size, transform=[size / (x1 - x0), 0, 0, size / (y1 - y0), 0, 0])
+        drawing.add(widget)
+        renderPDF.draw(drawing, pdf, x + (cell_w - size) / 2, y + 10 * mm)
+
+        pdf.setFont('Helvetica-Bold', 8)
+        pdf.drawCentredString(x + cell_w / 2, y + 6 * mm, flow['qr_code'])
+        pdf.setFont('Helvetica', 7)
+        pdf.drawCentredString(x + cell_w / 2, y + 2.5 * mm,
+                              f"#{flow['id']} {flow['crop_name'] or ''} · "
+                              f"{flow['waste_type'].replace('_', ' ')} · {flow['quantity_tons']:g} t")
+    pdf.save()
+    return buffer.getvalue()
+
+
+# ==================== BENCHMARK ====================
+
+def _rollup_snapshot(conn):
+    return conn.execute(f'''SELECT scope, scope_key, {', '.join(ROLLUP_VALUES)} FROM impact_rollups
+                            WHERE flows != 0 ORDER BY scope, scope_key''').fetchall()
+
+
+def benchmark(n_flows, chunk_size=IMPACT_CHUNK_SIZE):
+    """Rollup reads vs aggregating waste_flows, trigger cost, and a chunked backfill"""
+    from benchmarks import scratch_database, timed_ms, trigger_cost
+
+    with scratch_database('impact', 'waste_flows', n_flows) as (db_path, storage):
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        farmer_id = conn.execute('SELECT farmer_id FROM waste_flows LIMIT 1').fetchone()[0]
+        farmer_sum = '''SELECT COUNT(*), TOTAL(food_saved), TOTAL(co2_saved), TOTAL(compost_generated)
+                        FROM waste_flows WHERE farmer_id = ? AND status = 'completed' '''
+        platform_sum = '''SELECT COUNT(*), TOTAL(food_saved), TOTAL(co2_saved), TOTAL(compost_generated)
+                          FROM waste_flows WHERE status = 'completed' '''
+        print(f"\n  {'impact read':<40} {'ms':>10}")
+        print(f"  {'farmer rollup (impact_rollups)':<40} "
+              f"{timed_ms(lambda: storage.impact_rollup('farmer', farmer_id), 500):>10.3f}")
+        print(f"  {'farmer SUM over waste_flows':<40} "
+              f"{timed_ms(lambda: conn.execute(farmer_sum, (farmer_id,)).fetchall(), 50):>10.3f}")
+        print(f"  {'platform + regions (impact_rollups)':<40} "
+              f"{timed_ms(lambda: (storage.impact_rollup('platform', ''), storage.impact_regions()), 500):>10.3f}")
+        print(f"  {'platform SUM over waste_flows':<40} "
+              f"{timed_ms(lambda: conn.execute(platform_sum).fetchall(), 3):>10.1f}")
+
+        # Write cost: the same inserts with and without the rollup trigger, rolled back
+        rows = conn.execute('''SELECT crop_id, farmer_id, region FROM waste_flows
+                               ORDER BY id DESC LIMIT 5000''').fetchall()
+
+        def insert_batch():
+            conn.execute('BEGIN')
+            conn.executemany('''INSERT INTO waste_flows (crop_id, farmer_id, region, waste_type, quantity_tons,
+                                                         food_saved, co2_saved, compost_generated, status)
+                                VALUES (?, ?, ?, 'compost', 1, 0, 0.6, 0.4, 'completed')''', rows)
+            conn.execute('ROLLBACK')
+
+        with_triggers, without_triggers = trigger_cost(conn, 'waste_flows_impact_insert', insert_batch)
+        print(f"\n  insert, per flow: {without_triggers * 1000 / len(rows):.1f} µs bare, "
+              f"{with_triggers * 1000 / len(rows):.1f} µs with rollups")
+
+        # Incremental upkeep must agree with a from-scratch backfill
+        step = max(1, n_flows // 5000)
+        conn.execute('BEGIN')
+        conn.execute("UPDATE waste_flows SET status = 'completed' WHERE id % ? = 0 AND status = 'pending'", (step,))
+        conn.execute("UPDATE waste_flows SET status = 'cancelled' WHERE id % ? = 3", (step * 2,))
+        conn.execute("UPDATE waste_flows SET quantity_tons = quantity_tons + 1 WHERE id % ? = 5", (step,))
+        conn.execute('DELETE FROM waste_flows WHERE id % ? = 7', (step * 3,))
+        conn.execute('COMMIT')
+        incremental = _rollup_snapshot(conn)
+
+        rollups, elapsed = backfill(db_path, chunk_size, log=lambda line: None)
+        print(f"  chunked backfill ({chunk_size:,} flows/chunk): {rollups:,} rollups in {elapsed:.1f}s")
+        rebuilt = _rollup_snapshot(conn)
+        assert len(incremental) == len(rebuilt), (len(incremental), len(rebuilt))
+        for before, after in zip(incremental, rebuilt):
+            assert before[:3] == after[:3], (before, after)
+            assert all(abs(a - b) < 1e-6 * max(1, abs(b)) for a, b in zip(before[3:], after[3:])), (before, after)
+        print("  ✓ incremental rollups match the backfill")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild or benchmark the waste-flow impact rollups')
+    parser.add_argument('--backfill', action='store_true', help='rebuild every rollup from waste_flows')
+    parser.add_argument('--benchmark', action='store_true', help='rollup benchmark on a scratch database')
+    parser.add_argument('--flows', type=int, default=1_000_000)
+    parser.add_argument('--chunk-size', type=int, default=IMPACT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.flows, args.chunk_size)
+    if args.backfill:
+        from app import storage
+        for path in storage.sqlite_paths():
+            rollups, elapsed = backfill(path, args.chunk_size)
+            print(f"✓ Rebuilt {rollups:,} impact rollups in {path} in {elapsed:.1f}s")
+    if not (args.benchmark or args.backfill):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
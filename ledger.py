@@ -0,0 +1,316 @@
+"""
+Buyer Ledger for Surplus-to-Sustain
+
+    python ledger.py --repair                          # parallel full recompute of every buyer
+    python ledger.py --benchmark --transactions 10000000
+
+Each buyer row carries running totals of its transactions, kept current by
+triggers in the same write transaction as every transaction insert and
+every change of rating, status, buyer or date:
+
+    total_transactions    transactions that weren't cancelled
+    rating_count/_sum     ratings on those transactions; rating = their mean
+    decayed_weight/_sum   the same ratings weighted 2^(age steps), so a rating
+                          counts half as much per RATING_HALF_LIFE_DAYS of age;
+                          decayed_rating = decayed_sum / decayed_weight
+
+Weights grow with the transaction date from LEDGER_EPOCH instead of shrinking
+with age, so the ratio never needs refreshing as time passes. They grow in
+whole half-life steps (an integer shift) so the triggers need no SQLite math
+functions and the recompute reproduces them exactly.
+
+While a buyer has no ratings, rating keeps its last (initially listed) value
+and decayed_rating is NULL; rankings order by COALESCE(decayed_rating, rating).
+
+There is deliberately no DELETE trigger: archiving (retention.py) moves
+transactions out of the live table without changing what a buyer has done,
+and the recompute reads transactions_history, live and archived rows alike.
+"""
+
+import argparse
+import os
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from changelog import pinned_readers, rows_changed_after
+from retention import attach_archive
+
+RATING_HALF_LIFE_DAYS = int(os.environ.get('RATING_HALF_LIFE_DAYS', 180))
+LEDGER_EPOCH = '2020-01-01'
+LEDGER_WORKERS = int(os.environ.get('LEDGER_WORKERS', os.cpu_count() or 4))
+
+LEDGER_COLUMNS = {
+    'rating_count': 'INTEGER NOT NULL DEFAULT 0',
+    'rating_sum': 'REAL NOT NULL DEFAULT 0',
+    'decayed_weight': 'REAL NOT NULL DEFAULT 0',
+    'decayed_sum': 'REAL NOT NULL DEFAULT 0',
+    'decayed_rating': 'REAL',
+}
+
+RANKING = 'COALESCE(decayed_rating, rating) DESC, total_transactions DESC'
+
+_TRACKED = ('rating', 'status', 'buyer_id', 'transaction_date')
+
+
+def _counted(row):
+    return f"(CASE WHEN COALESCE({row}.status, '') != 'cancelled' THEN 1 ELSE 0 END)"
+
+
+def _rated(row):
+    return f"(CASE WHEN {row}.rating IS NOT NULL AND COALESCE({row}.status, '') != 'cancelled' THEN 1 ELSE 0 END)"
+
+
+def _weight(row):
+    days = (f"COALESCE(julianday(COALESCE({row}.transaction_date, {row}.created_at)), julianday('{LEDGER_EPOCH}'))"
+            f" - julianday('{LEDGER_EPOCH}')")
+    return f'((1 << MIN(MAX(CAST(({days}) / {RATING_HALF_LIFE_DAYS} AS INTEGER), 0), 62)) * 1.0)'
+
+
+def _apply(row, sign):
+    """UPDATE adding (sign '+') or removing ('-') one transaction row's share of its buyer's totals"""
+    rated, weight = _rated(row), _weight(row)
+    return f'''UPDATE buyers SET
+                   total_transactions = total_transactions {sign} {_counted(row)},
+                   rating_count = rating_count {sign} {rated},
+                   rating_sum = rating_sum {sign} {rated} * COALESCE({row}.rating, 0),
+                   decayed_weight = decayed_weight {sign} {rated} * {weight},
+                   decayed_sum = decayed_sum {sign} {rated} * {weight} * COALESCE({row}.rating, 0)
+               WHERE id = {row}.buyer_id;'''
+
+
+_DERIVED = '''UPDATE buyers SET
+                  rating = CASE WHEN rating_count > 0 THEN ROUND(rating_sum / rating_count, 2) ELSE rating END,
+                  decayed_rating = CASE WHEN decayed_weight > 0 THEN ROUND(decayed_sum / decayed_weight, 2)
+                                        ELSE NULL END'''
+
+
+def init_ledger(cursor):
+    """Ledger triggers on transactions and the ranking index (columns are added by init_db)"""
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_ledger_insert AFTER INSERT ON transactions BEGIN
+            {_apply('new', '+')}
+            {_DERIVED} WHERE id = new.buyer_id;
+        END
+    ''')
+    changed = ' OR '.join(f'old.{col} IS NOT new.{col}' for col in _TRACKED)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_ledger_update AFTER UPDATE OF {', '.join(_TRACKED)}
+        ON transactions WHEN {changed} BEGIN
+            {_apply('old', '-')}
+            {_apply('new', '+')}
+            {_DERIVED} WHERE id IN (old.buyer_id, new.buyer_id);
+        END
+    ''')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_buyers_ranking ON buyers(is_verified, {RANKING})')
+
+
+# ==================== FULL RECOMPUTE ====================
+
+def _sources(conn):
+    """Tables holding transactions on this connection: live, plus the archive if attached"""
+    tables = ['main.transactions']
+    if conn.execute("SELECT 1 FROM pragma_database_list WHERE name = 'archive'").fetchone() and \
+            conn.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'transactions'").fetchone():
+        tables.append('archive.transactions')
+    return tables
+
+
+def _sums(conn, table, where, params):
+    """{buyer_id: [counted, rating_count, rating_sum, decayed_weight, decayed_sum]} over the matching rows"""
+    rated, weight = _rated('t'), _weight('t')
+    rows = conn.execute(f'''SELECT buyer_id, SUM({_counted('t')}), SUM({rated}),
+                                   SUM({rated} * COALESCE(rating, 0)),
+                                   SUM({rated} * {weight}),
+                                   SUM({rated} * {weight} * COALESCE(rating, 0))
+                            FROM {table} t WHERE {where}
+                            GROUP BY buyer_id''', params)
+    return {row[0]: list(row[1:]) for row in rows}
+
+
+def _aggregate(conn, table, low, high):
+    """Sums for ids in (low, high]"""
+    return _sums(conn, table, 'id > ? AND id <= ?', (low, high))
+
+
+def _aggregate_rows(conn, table, ids, batch=500):
+    """Sums for the given ids"""
+    return _merge(_sums(conn, table, f"id IN ({', '.join('?' * len(chunk))})", chunk)
+                  for chunk in (ids[i:i + batch] for i in range(0, len(ids), batch)))
+
+
+def _merge(partials):
+    totals = {}
+    for partial in partials:
+        for buyer_id, values in partial.items():
+            if buyer_id in totals:
+                totals[buyer_id] = [a + b for a, b in zip(totals[buyer_id], values)]
+            else:
+                totals[buyer_id] = values
+    return totals
+
+
+def apply_totals(conn, totals):
+    """Replace every buyer's ledger with totals; run inside the caller's transaction"""
+    conn.execute('''UPDATE buyers SET total_transactions = 0, rating_count = 0, rating_sum = 0,
+                                      decayed_weight = 0, decayed_sum = 0, decayed_rating = NULL''')
+    conn.executemany('''UPDATE buyers SET total_transactions = ?, rating_count = ?, rating_sum = ?,
+                                          decayed_weight = ?, decayed_sum = ?
+                        WHERE id = ?''',
+                     [(*values, buyer_id) for buyer_id, values in totals.items()])
+    conn.execute(_DERIVED)
+
+
+def recompute(conn):
+    """Serial full recompute on one connection, inside the caller's transaction"""
+    totals = _merge(_aggregate(conn, table, 0, 2 ** 63 - 1) for table in _sources(conn))
+    apply_totals(conn, totals)
+    return len(totals)
+
+
+def _split(top, parts):
+    step = max(1, -(-top // parts))
+    return [(low, min(low + step, top)) for low in range(0, top, step)]
+
+
+def recompute_parallel(db_path, workers=LEDGER_WORKERS):
+    """
+    Rebuild every buyer's ledger from transactions_history; returns (buyers, seconds)
+
+    The id ranges of the live and archived tables are aggregated on
+    `workers` threads (sqlite3 releases the GIL while a query runs), each
+    with a read-only connection pinned to the same committed state
+    (changelog.pinned_readers), so writes carry on during the scan without
+    being half-seen. The final write transaction takes the transactions
+    logged in change_log since that state, swaps the share the scan saw
+    for their current one, and writes the merged totals.
+    """
+    start = time.perf_counter()
+    conn = attach_archive(sqlite3.connect(db_path, isolation_level=None, timeout=30), db_path)
+    readers = []
+    try:
+        tables = _sources(conn)
+        readers, seq = pinned_readers(conn, db_path, workers)
+        tops = {table: readers[0].execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+                for table in tables}
+        idle = queue.SimpleQueue()
+        for reader in readers:
+            idle.put(reader)
+
+        def work(job):
+            reader = idle.get()
+            try:
+                return _aggregate(reader, *job)
+            finally:
+                idle.put(reader)
+
+        # A few ranges per worker so one dense range doesn't hold up the rest
+        jobs = [(table, low, high) for table, top in tops.items() for low, high in _split(top, workers * 4)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ledger') as pool:
+            partials = list(pool.map(work, jobs))
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            changed = rows_changed_after(conn, 'transactions', seq)
+            for table in tables:
+                seen = _aggregate_rows(readers[0], table, changed)
+                partials.append({buyer_id: [-value for value in values] for buyer_id, values in seen.items()})
+                partials.append(_aggregate_rows(conn, table, changed))
+            for reader in readers:
+                reader.close()
+            readers = []
+            totals = _merge(partials)
+            apply_totals(conn, totals)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        for reader in readers:
+            reader.close()
+        conn.close()
+    return len(totals), time.perf_counter() - start
+
+
+# ==================== BENCHMARK ====================
+
+def _ledger_snapshot(conn):
+    return conn.execute('''SELECT id, total_transactions, rating_count, rating_sum, rating,
+                                  decayed_rating FROM buyers ORDER BY id''').fetchall()
+
+
+def benchmark(n_transactions):
+    """Ranking from the ledger vs aggregating transactions, trigger cost, and a full recompute"""
+    from benchmarks import scratch_database, timed_ms, trigger_cost
+
+    with scratch_database('ledger', 'transactions', n_transactions) as (db_path, storage):
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        live = '''SELECT b.id, b.name, AVG(t.rating) AS live_rating, COUNT(t.id) AS live_total
+                   FROM buyers b LEFT JOIN transactions t ON t.buyer_id = b.id AND t.status != 'cancelled'
+                   WHERE (b.specialty_crops LIKE '%"tomato"%' OR b.specialty_crops LIKE '%"all"%')
+                   AND b.is_verified = 1
+                   GROUP BY b.id ORDER BY live_rating DESC, live_total DESC LIMIT 8'''
+        print(f"\n  {'ranking query':<40} {'ms':>10}")
+        print(f"  {'matching_buyers (ledger columns)':<40} "
+              f"{timed_ms(lambda: storage.matching_buyers('tomato'), 200):>10.3f}")
+        print(f"  {'verified_buyers (ledger columns)':<40} {timed_ms(storage.verified_buyers, 50):>10.3f}")
+        print(f"  {'AVG/COUNT over transactions':<40} {timed_ms(lambda: conn.execute(live).fetchall(), 3):>10.1f}")
+
+        # Write cost: the same inserts with and without the ledger triggers, rolled back
+        rows = conn.execute('''SELECT crop_id, buyer_id, farmer_id FROM transactions
+                               ORDER BY id DESC LIMIT 5000''').fetchall()
+
+        def insert_batch():
+            conn.execute('BEGIN')
+            conn.executemany('''INSERT INTO transactions (crop_id, buyer_id, farmer_id, quantity_tons,
+                                                          price_per_kg, total_amount, status, rating)
+                                VALUES (?, ?, ?, 1, 10, 10000, 'completed', 4)''', rows)
+            conn.execute('ROLLBACK')
+
+        with_triggers, without_triggers = trigger_cost(conn, 'transactions_ledger_insert', insert_batch)
+        print(f"\n  insert, per transaction: {without_triggers * 1000 / len(rows):.1f} µs bare, "
+              f"{with_triggers * 1000 / len(rows):.1f} µs with ledger")
+
+        # Incremental upkeep must agree with a from-scratch recompute
+        conn.execute('BEGIN')
+        conn.executemany("UPDATE transactions SET rating = 5, status = 'completed' WHERE id = ?",
+                         [(i,) for i in range(1, n_transactions, max(1, n_transactions // 5000))])
+        conn.executemany("UPDATE transactions SET status = 'cancelled' WHERE id = ?",
+                         [(i,) for i in range(7, n_transactions, max(1, n_transactions // 2000))])
+        conn.execute('COMMIT')
+        incremental = _ledger_snapshot(conn)
+
+        buyers, elapsed = recompute_parallel(db_path)
+        print(f"  full recompute ({LEDGER_WORKERS} workers):  {buyers:,} buyers in {elapsed:.1f}s")
+        for before, after in zip(incremental, _ledger_snapshot(conn)):
+            assert before[:3] == after[:3] and before[4] == after[4], (before, after)
+            assert abs(before[3] - after[3]) < 1e-6, (before, after)
+            # Sums of large weights may differ in the last bits depending on the order they were added
+            assert (before[5] is None) == (after[5] is None), (before, after)
+            assert before[5] is None or abs(before[5] - after[5]) <= 0.01, (before, after)
+        print("  ✓ incremental ledger matches the recompute")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repair or benchmark the buyer ledger')
+    parser.add_argument('--repair', action='store_true', help='recompute every buyer from transactions_history')
+    parser.add_argument('--benchmark', action='store_true', help='ranking benchmark on a scratch database')
+    parser.add_argument('--transactions', type=int, default=10_000_000)
+    parser.add_argument('--workers', type=int, default=LEDGER_WORKERS)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.transactions)
+    if args.repair:
+        from app import storage
+        for path in storage.sqlite_paths():
+            buyers, elapsed = recompute_parallel(path, args.workers)
+            print(f"✓ Recomputed the ledger of {buyers:,} buyers in {path} in {elapsed:.1f}s")
+    if not (args.benchmark or args.repair):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
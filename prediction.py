@@ -7,16 +7,36 @@ import joblib
 import os
 import numpy as np
 
+from drift import DriftMonitor, load_profile
+from yield_table import YieldTable, YIELD_TABLE, model_digest
+
+# 'forest' walks the trained model per prediction; 'table' looks yields up
+# in its precomputed table (yield_table.py), falling back to the forest
+# when the table is missing or was built from a different model
+PREDICTOR_MODE = os.environ.get('PREDICTOR_MODE', 'forest')
+
+# Average yields per hectare (tons) and irrigation impact, for the fallback
+FALLBACK_YIELDS = {
+    'tomato': 5.5, 'onion': 4.5, 'potato': 6.5, 'wheat': 3.5, 'rice': 5.0,
+    'cabbage': 4.0, 'cauliflower': 3.8, 'brinjal': 4.2, 'chili': 2.5
+}
+IRRIGATION_MULTIPLIERS = {
+    'drip': 1.2, 'sprinkler': 1.1, 'flood': 1.0, 'rainfed': 0.85
+}
+
 class YieldPredictor:
     """
     Smart yield predictor that uses trained ML model when available,
     falls back to rule-based prediction otherwise
     """
     
-    def __init__(self):
+    def __init__(self, mode=PREDICTOR_MODE):
+        self.mode = mode
         self.model = None
         self.encoders = None
         self.feature_cols = None
+        self.table = None
+        self.version = 'fallback'
         self.load_model()
     
     def load_model(self):
@@ -26,9 +46,17 @@ class YieldPredictor:
                 self.model = joblib.load('model.pkl')
                 self.encoders = joblib.load('encoders.pkl')
                 self.feature_cols = joblib.load('feature_cols.pkl')
+                self.version = model_digest('model.pkl')
+                if self.mode == 'table':
+                    self.load_table()
+                # Pays the one-off cost of the batch path (pandas import, model threads) at startup
+                self.predict_batch(['tomato'], [1.0], ['loamy'], ['kharif'], ['drip'])
                 print("✓ ML Model loaded successfully!")
                 print(f"✓ Model type: {type(self.model).__name__}")
                 print(f"✓ Features: {self.feature_cols}")
+                print(f"✓ Version: {self.version}")
+                if self.table:
+                    print(f"✓ Serving from {YIELD_TABLE}")
                 return True
             else:
                 print("⚠ No trained model found. Using fallback prediction.")
@@ -38,6 +66,18 @@ class YieldPredictor:
             print("⚠ Using fallback prediction.")
             return False
     
+    def load_table(self):
+        """Use the precomputed yield table if it was built from the loaded model"""
+        table = YieldTable.load()
+        if table is None:
+            print(f"⚠ No {YIELD_TABLE} found (python yield_table.py builds it). Using the forest.")
+        elif table.version != self.version:
+            print(f"⚠ {YIELD_TABLE} was built from model {table.version}, not {self.version}. Using the forest.")
+        else:
+            self.table = table
+            # Table predictions differ slightly from the forest's, so they get their own version
+            self.version = f"{self.version}-table"
+    
     def predict_yield_ml(self, crop_name, area, soil_type, season, irrigation_type,
                         rainfall=750, temperature=27, humidity=70):
         """
@@ -61,6 +101,16 @@ class YieldPredictor:
             print("  Using fallback prediction (no ML model)")
             return self.predict_yield_fallback(crop_name, area, irrigation_type)
         
+        if self.table:
+            prediction = self.table.predict_one(crop_name, area, soil_type, season, irrigation_type,
+                                                rainfall, temperature, humidity)
+            if prediction is None:
+                print("  Unknown category for the yield table")
+                print("  Falling back to rule-based prediction")
+                return self.predict_yield_fallback(crop_name, area, irrigation_type)
+            print(f"  Table Prediction: {prediction:.2f} tons")
+            return round(prediction, 2)
+        
         try:
             # Encode categorical features
             crop_encoded = self.encoders['crop_name'].transform([crop_name.lower()])[0]
@@ -98,30 +148,83 @@ class YieldPredictor:
         Fallback prediction using hardcoded averages
         (Used when ML model is not available)
         """
-        # Average yields per hectare (tons)
-        avg_yields = {
-            'tomato': 5.5, 'onion': 4.5, 'potato': 6.5, 'wheat': 3.5, 'rice': 5.0,
-            'cabbage': 4.0, 'cauliflower': 3.8, 'brinjal': 4.2, 'chili': 2.5
-        }
-        
-        # Irrigation impact
-        irrigation_multipliers = {
-            'drip': 1.2, 'sprinkler': 1.1, 'flood': 1.0, 'rainfed': 0.85
-        }
-        
-        base_yield = avg_yields.get(crop_name.lower(), 4.0)
-        multiplier = irrigation_multipliers.get(irrigation_type.lower(), 1.0)
+        base_yield = FALLBACK_YIELDS.get(crop_name.lower(), 4.0)
+        multiplier = IRRIGATION_MULTIPLIERS.get(irrigation_type.lower(), 1.0)
         
         prediction = area * base_yield * multiplier
         
         print(f"  Fallback Prediction: {prediction:.2f} tons")
         return round(prediction, 2)
     
+    def predict_batch(self, crop_names, areas, soil_types, seasons, irrigation_types,
+                      rainfall=750, temperature=27, humidity=70):
+        """
+        Predict many rows with a single model call
+        
+        Each argument is a sequence with one entry per row; the weather
+        arguments may also be scalars. Rows with a category the encoders
+        don't know get the fallback estimate, as in predict_yield_ml.
+        Nothing is printed per row.
+        
+        Returns:
+        - NumPy array of predicted yields (tons), rounded to 2 decimals
+        """
+        crops = np.char.lower(np.asarray(crop_names, dtype=str))
+        irrigation = np.char.lower(np.asarray(irrigation_types, dtype=str))
+        areas = np.asarray(areas, dtype=float)
+        n = len(areas)
+        
+        base = np.array([FALLBACK_YIELDS.get(c, 4.0) for c in crops.tolist()])
+        multiplier = np.array([IRRIGATION_MULTIPLIERS.get(i, 1.0) for i in irrigation.tolist()])
+        predictions = areas * base * multiplier
+        
+        if self.table and n:
+            codes = [self.table.codes(column, values) for column, values in
+                     (('crop_name', crops), ('soil_type', soil_types),
+                      ('season', seasons), ('irrigation_type', irrigation))]
+            known = np.all([code >= 0 for code in codes], axis=0)
+            if known.any():
+                weather = [np.broadcast_to(np.asarray(value, dtype=float), (n,))[known]
+                           for value in (rainfall, temperature, humidity)]
+                predictions[known] = self.table.lookup([code[known] for code in codes], areas[known], *weather)
+        elif self.model and n:
+            categorical = {
+                'crop_name': crops,
+                'soil_type': np.char.lower(np.asarray(soil_types, dtype=str)),
+                'season': np.char.lower(np.asarray(seasons, dtype=str)),
+                'irrigation_type': irrigation,
+            }
+            known = np.ones(n, dtype=bool)
+            for column, values in categorical.items():
+                known &= np.isin(values, self.encoders[column].classes_)
+            
+            if known.any():
+                encoded = {column: self.encoders[column].transform(values[known])
+                           for column, values in categorical.items()}
+                weather = [np.broadcast_to(np.asarray(value, dtype=float), (n,))[known]
+                           for value in (rainfall, temperature, humidity)]
+                features = np.column_stack([
+                    encoded['crop_name'], areas[known], encoded['soil_type'],
+                    encoded['season'], encoded['irrigation_type'], *weather
+                ])
+                if hasattr(self.model, 'feature_names_in_'):
+                    import pandas as pd
+                    features = pd.DataFrame(features, columns=self.model.feature_names_in_)
+                predictions[known] = self.model.predict(features)
+        
+        return np.round(predictions, 2)
+    
     def get_prediction_confidence(self):
         """
         Return confidence level based on prediction method
         """
-        if self.model:
+        if self.table:
+            return {
+                'level': 'HIGH',
+                'method': 'Machine Learning (Random Forest, tabulated)',
+                'description': 'Precomputed from the trained model over weather, soil and season'
+            }
+        elif self.model:
             return {
                 'level': 'HIGH',
                 'method': 'Machine Learning (Random Forest)',
@@ -137,6 +240,9 @@ class YieldPredictor:
 # Global predictor instance
 predictor = YieldPredictor()
 
+# Live inputs and predictions from predict_yield(), compared with the training profile
+drift_monitor = DriftMonitor(load_profile())
+
 def predict_yield(crop_name, area, soil_type='loamy', season='kharif', 
                  irrigation_type='drip', rainfall=750, temperature=27, humidity=70):
     """
@@ -153,10 +259,42 @@ def predict_yield(crop_name, area, soil_type='loamy', season='kharif',
             irrigation_type='drip'
         )
     """
-    return predictor.predict_yield_ml(
+    prediction = predictor.predict_yield_ml(
         crop_name, area, soil_type, season, irrigation_type,
         rainfall, temperature, humidity
     )
+    drift_monitor.observe(crop_name, area, soil_type, season, irrigation_type,
+                          rainfall, temperature, humidity, prediction)
+    return prediction
+
+def predict_yield_batch(crop_names, areas, soil_types, seasons, irrigation_types,
+                        rainfall=750, temperature=27, humidity=70):
+    """
+    Vectorized predict_yield for bulk jobs (data generation, re-scoring)
+    
+    Usage:
+        yields = predict_yield_batch(['tomato', 'onion'], [2.5, 1.0],
+                                     ['loamy', 'clay'], ['kharif', 'rabi'],
+                                     ['drip', 'flood'])
+    """
+    return predictor.predict_batch(crop_names, areas, soil_types, seasons, irrigation_types,
+                                   rainfall, temperature, humidity)
+
+def get_model_version():
+    """
+    Version of the model behind predictions ('fallback' without one)
+    
+    Changes whenever model.pkl is retrained, so it can key caches of
+    predictions and be stored next to them.
+    """
+    return predictor.version
+
+def get_drift_report(windows=None):
+    """
+    Drift scores of recent predict_yield() traffic in this process
+    against the training profile (see drift.py)
+    """
+    return drift_monitor.report(windows)
 
 def get_confidence():
     """
@@ -0,0 +1,360 @@
+"""
+Crop Price Time Series for Surplus-to-Sustain
+
+    python prices.py --rebuild                      # recompute every rollup from transactions_history
+    python prices.py --benchmark --transactions 2000000
+
+Completed sales with a price are summarised per (crop, city of the buyer)
+into day, week (starting Monday) and month buckets, each holding open, high,
+low, close, trade count, tons and value (so VWAP = value / tons):
+
+    a sale inserted as completed, or completed later    three upserts (O(1))
+    a counted sale cancelled, re-priced or re-dated      its buckets recomputed:
+                                                         the day from that day's
+                                                         sales, week and month
+                                                         from the day rows
+
+Open and close are the first and last sales by (date, id); the *_seq columns
+hold that ordering key, so a back-dated sale slots in correctly.
+
+There is no DELETE trigger, as for buyer ledgers: archived sales stay in
+the rollups, so a two-year chart reads a few hundred rows however much of
+the history retention.py has moved out. Recomputing a bucket only sees live
+sales; rebuild() reads transactions_history.
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from retention import attach_archive
+
+PRICE_RESOLUTIONS = ('day', 'week', 'month')
+DEFAULT_POINTS = 120
+MAX_POINTS = 2000
+
+# Bucket start for a date expression, and the length of a bucket
+_BUCKETS = {
+    'day': 'date({})',
+    'week': "date({}, 'weekday 0', '-6 days')",
+    'month': "date({}, 'start of month')",
+}
+_SPANS = {'week': '+7 days', 'month': '+1 months'}
+
+_COLUMNS = ('resolution, crop, city, bucket, open, high, low, close, open_seq, close_seq, '
+            'trades, volume_tons, value')
+_TRACKED = ('status', 'price_per_kg', 'quantity_tons', 'transaction_date', 'crop_id', 'buyer_id')
+
+
+def _counted(row):
+    return f"({row}.status = 'completed' AND {row}.price_per_kg > 0 AND {row}.transaction_date IS NOT NULL)"
+
+
+def _seq(row):
+    return f"(date({row}.transaction_date) || printf('%012d', {row}.id))"
+
+
+def _crop(row):
+    return f'(SELECT LOWER(TRIM(crop_name)) FROM crops WHERE id = {row}.crop_id)'
+
+
+def _city(row):
+    return f"(SELECT COALESCE(TRIM(city), '') FROM buyers WHERE id = {row}.buyer_id)"
+
+
+# Open/close of a group: the price carried behind the smallest/largest sequence key
+# (keys are 22 characters: the date and a zero-padded id)
+_OHLC = {
+    'raw': ("CAST(substr(MIN({seq} || t.price_per_kg), 23) AS REAL), MAX(t.price_per_kg), MIN(t.price_per_kg), "
+            "CAST(substr(MAX({seq} || t.price_per_kg), 23) AS REAL), MIN({seq}), MAX({seq}), COUNT(*), "
+            "TOTAL(t.quantity_tons), TOTAL(t.price_per_kg * t.quantity_tons)"),
+    'days': ("CAST(substr(MIN(open_seq || open), 23) AS REAL), MAX(high), MIN(low), "
+             "CAST(substr(MAX(close_seq || close), 23) AS REAL), MIN(open_seq), MAX(close_seq), SUM(trades), "
+             "SUM(volume_tons), SUM(value)"),
+}
+
+
+def _add(row):
+    """Upsert one newly counted sale into its day, week and month buckets"""
+    seq, price = _seq(row), f'{row}.price_per_kg'
+    buckets = ' UNION ALL '.join(f"SELECT '{resolution}' AS resolution, {expr.format(row + '.transaction_date')} AS bucket"
+                                 for resolution, expr in _BUCKETS.items())
+    return f'''INSERT INTO price_rollups ({_COLUMNS})
+               SELECT b.resolution, k.crop, k.city, b.bucket, {price}, {price}, {price}, {price}, {seq}, {seq},
+                      1, {row}.quantity_tons, {price} * {row}.quantity_tons
+               FROM (SELECT {_crop(row)} AS crop, {_city(row)} AS city) k, ({buckets}) b
+               WHERE k.crop IS NOT NULL
+               ON CONFLICT(resolution, crop, city, bucket) DO UPDATE SET
+                   open = CASE WHEN excluded.open_seq < open_seq THEN excluded.open ELSE open END,
+                   close = CASE WHEN excluded.close_seq > close_seq THEN excluded.close ELSE close END,
+                   open_seq = MIN(open_seq, excluded.open_seq),
+                   close_seq = MAX(close_seq, excluded.close_seq),
+                   high = MAX(high, excluded.high),
+                   low = MIN(low, excluded.low),
+                   trades = trades + 1,
+                   volume_tons = volume_tons + excluded.volume_tons,
+                   value = value + excluded.value;'''
+
+
+def _recompute(row):
+    """Statements recomputing the day, week and month buckets of a sale's (crop, city, date)"""
+    crop, city, day = _crop(row), _city(row), f'date({row}.transaction_date)'
+    bucket = {resolution: expr.format(day) for resolution, expr in _BUCKETS.items()}
+    matches = ' OR '.join(f"(resolution = '{resolution}' AND bucket = {expr})" for resolution, expr in bucket.items())
+    statements = [
+        f'DELETE FROM price_rollups WHERE crop = {crop} AND city = {city} AND ({matches});',
+        f'''INSERT INTO price_rollups ({_COLUMNS})
+            SELECT 'day', {crop}, {city}, {day}, {_OHLC['raw'].format(seq=_seq('t'))}
+            FROM transactions t
+            JOIN crops c ON c.id = t.crop_id
+            JOIN buyers b ON b.id = t.buyer_id
+            WHERE t.transaction_date = {row}.transaction_date AND {_counted('t')}
+            AND LOWER(TRIM(c.crop_name)) = {crop} AND COALESCE(TRIM(b.city), '') = {city}
+            GROUP BY t.transaction_date;''',
+    ]
+    for resolution, span in _SPANS.items():
+        statements.append(f'''INSERT INTO price_rollups ({_COLUMNS})
+            SELECT '{resolution}', {crop}, {city}, {bucket[resolution]}, {_OHLC['days']}
+            FROM price_rollups
+            WHERE resolution = 'day' AND crop = {crop} AND city = {city}
+            AND bucket >= {bucket[resolution]} AND bucket < date({bucket[resolution]}, '{span}')
+            GROUP BY resolution;''')
+    return '\n'.join(statements)
+
+
+def init_prices(cursor):
+    """Rollup table, its triggers and the date index; returns True if the table is new"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_rollups'")
+    created = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_rollups (
+            resolution TEXT NOT NULL,
+            crop TEXT NOT NULL,
+            city TEXT NOT NULL,
+            bucket DATE NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            open_seq TEXT NOT NULL,
+            close_seq TEXT NOT NULL,
+            trades INTEGER NOT NULL,
+            volume_tons REAL NOT NULL,
+            value REAL NOT NULL,
+            PRIMARY KEY (resolution, crop, city, bucket)
+        ) WITHOUT ROWID
+    ''')
+    # Recomputing a day finds its sales through this index
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_date)')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_prices_insert AFTER INSERT ON transactions
+        WHEN {_counted('new')} BEGIN
+            {_add('new')}
+        END
+    ''')
+    changed = ' OR '.join(f'old.{col} IS NOT new.{col}' for col in _TRACKED)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_prices_complete AFTER UPDATE OF {', '.join(_TRACKED)}
+        ON transactions WHEN NOT {_counted('old')} AND {_counted('new')} BEGIN
+            {_add('new')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_prices_revise AFTER UPDATE OF {', '.join(_TRACKED)}
+        ON transactions WHEN {_counted('old')} AND ({changed}) BEGIN
+            {_recompute('old')}
+            {_recompute('new')}
+        END
+    ''')
+    return created
+
+
+def _source(conn):
+    """transactions_history where the archive is attached, else the live table"""
+    if conn.execute("SELECT 1 FROM sqlite_temp_master WHERE name = 'transactions_history'").fetchone():
+        return 'transactions_history'
+    return 'transactions'
+
+
+def rebuild(conn):
+    """Recompute every rollup inside the caller's transaction; returns the number of day buckets"""
+    conn.execute('DELETE FROM price_rollups')
+    days = conn.execute(f'''INSERT INTO price_rollups ({_COLUMNS})
+                            SELECT 'day', LOWER(TRIM(c.crop_name)), COALESCE(TRIM(b.city), ''),
+                                   date(t.transaction_date), {_OHLC['raw'].format(seq=_seq('t'))}
+                            FROM {_source(conn)} t
+                            JOIN crops c ON c.id = t.crop_id
+                            JOIN buyers b ON b.id = t.buyer_id
+                            WHERE {_counted('t')}
+                            GROUP BY 2, 3, 4''').rowcount
+    for resolution in _SPANS:
+        conn.execute(f'''INSERT INTO price_rollups ({_COLUMNS})
+                         SELECT '{resolution}', crop, city, {_BUCKETS[resolution].format('bucket')}, {_OHLC['days']}
+                         FROM price_rollups WHERE resolution = 'day'
+                         GROUP BY crop, city, 4''')
+    return days
+
+
+# ==================== RANGE QUERIES ====================
+
+def bucket_start(day, resolution):
+    """The start of the bucket holding a date"""
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    if resolution == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_count(start, end, resolution):
+    """How many buckets of a resolution the range [start, end] touches"""
+    if resolution == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    first, last = bucket_start(start, resolution), bucket_start(end, resolution)
+    return (last - first).days // (7 if resolution == 'week' else 1) + 1
+
+
+def choose_resolution(start, end, points):
+    """The coarsest resolution still giving at least `points` buckets over the range; else daily"""
+    for resolution in reversed(PRICE_RESOLUTIONS):
+        if bucket_count(start, end, resolution) >= points:
+            return resolution
+    return 'day'
+
+
+def merge_buckets(rows):
+    """Combine per-city rollup rows (ordered by bucket) into one series"""
+    series = []
+    for row in rows:
+        if series and series[-1]['bucket'] == row['bucket']:
+            point = series[-1]
+            if row['open_seq'] < point['open_seq']:
+                point['open'], point['open_seq'] = row['open'], row['open_seq']
+            if row['close_seq'] > point['close_seq']:
+                point['close'], point['close_seq'] = row['close'], row['close_seq']
+            point['high'] = max(point['high'], row['high'])
+            point['low'] = min(point['low'], row['low'])
+            point['trades'] += row['trades']
+            point['volume_tons'] += row['volume_tons']
+            point['value'] += row['value']
+        else:
+            series.append({name: row[name] for name in ('bucket', 'open', 'high', 'low', 'close', 'open_seq',
+                                                         'close_seq', 'trades', 'volume_tons', 'value')})
+    for point in series:
+        value = point.pop('value')
+        del point['open_seq'], point['close_seq']
+        point['vwap'] = round(value / point['volume_tons'], 2) if point['volume_tons'] else None
+        point['volume_tons'] = round(point['volume_tons'], 2)
+    return series
+
+
+# ==================== BENCHMARK ====================
+
+def _snapshot(conn):
+    return conn.execute(f'SELECT {_COLUMNS} FROM price_rollups ORDER BY 1, 2, 3, 4').fetchall()
+
+
+def benchmark(n_transactions):
+    """Two-year charts from the rollups vs raw transactions, trigger cost, and consistency"""
+    from benchmarks import scratch_database, timed_ms, trigger_cost
+
+    with scratch_database('prices', 'transactions', n_transactions) as (db_path, storage):
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        end = date.fromisoformat(conn.execute('SELECT MAX(transaction_date) FROM transactions').fetchone()[0])
+        begin = end - timedelta(days=730)
+        raw = f'''SELECT {_BUCKETS['week'].format('t.transaction_date')} AS week, MIN(t.price_per_kg),
+                         MAX(t.price_per_kg), SUM(t.quantity_tons), SUM(t.price_per_kg * t.quantity_tons)
+                  FROM transactions t JOIN crops c ON c.id = t.crop_id JOIN buyers b ON b.id = t.buyer_id
+                  WHERE c.crop_name = 'tomato' AND b.city = 'Pune' AND t.status = 'completed'
+                  AND t.transaction_date BETWEEN ? AND ? GROUP BY week'''
+
+        def chart(resolution, city):
+            first = bucket_start(begin, resolution).isoformat()
+            return merge_buckets(storage.price_rollups('tomato', resolution, first, end.isoformat(), city))
+
+        print(f"\n  {'2-year tomato chart':<44} {'points':>7} {'ms':>10}")
+        for resolution, city in (('week', 'Pune'), ('day', 'Pune'), ('week', None), ('month', None)):
+            label = f"{resolution}ly rollups, {city or 'all cities'}".replace('dayly', 'daily')
+            print(f"  {label:<44} {len(chart(resolution, city)):>7} "
+                  f"{timed_ms(lambda: chart(resolution, city), 50):>10.3f}")
+        print(f"  {'weekly GROUP BY over transactions, Pune':<44} "
+              f"{len(conn.execute(raw, (begin.isoformat(), end.isoformat())).fetchall()):>7} "
+              f"{timed_ms(lambda: conn.execute(raw, (begin.isoformat(), end.isoformat())).fetchall(), 3):>10.1f}")
+
+        # Write cost: the same completed sales with and without the price triggers, rolled back
+        rows = conn.execute('''SELECT crop_id, buyer_id, farmer_id FROM transactions
+                               ORDER BY id DESC LIMIT 5000''').fetchall()
+
+        def insert_batch():
+            conn.execute('BEGIN')
+            conn.executemany('''INSERT INTO transactions (crop_id, buyer_id, farmer_id, quantity_tons,
+                                                          price_per_kg, total_amount, status)
+                                VALUES (?, ?, ?, 1, 14, 14000, 'completed')''', rows)
+            conn.execute('ROLLBACK')
+
+        with_triggers, without_triggers = trigger_cost(conn, 'transactions_prices_insert', insert_batch)
+        print(f"\n  insert, per sale: {without_triggers * 1000 / len(rows):.1f} µs without, "
+              f"{with_triggers * 1000 / len(rows):.1f} µs with price rollups")
+
+        # Incremental upkeep must agree with a from-scratch rebuild
+        step = max(1, n_transactions // 2000)
+        revisions = [
+            ("UPDATE transactions SET status = 'completed' WHERE id % ? = 0 AND status = 'pending'", step),
+            ("UPDATE transactions SET status = 'cancelled' WHERE id % ? = 1", step),
+            ("UPDATE transactions SET price_per_kg = price_per_kg + 3 WHERE id % ? = 2", step),
+            ("UPDATE transactions SET transaction_date = date(transaction_date, '-9 days') WHERE id % ? = 3", step),
+        ]
+        start = time.perf_counter()
+        conn.execute('BEGIN')
+        revised = sum(conn.execute(sql, (modulus,)).rowcount for sql, modulus in revisions)
+        conn.execute('COMMIT')
+        print(f"  {revised:,} completions and revisions: "
+              f"{(time.perf_counter() - start) * 1000 / revised:.2f} ms each")
+        incremental = _snapshot(conn)
+
+        start = time.perf_counter()
+        conn.execute('BEGIN')
+        rebuild(conn)
+        conn.execute('COMMIT')
+        print(f"  full rebuild: {time.perf_counter() - start:.1f}s")
+        rebuilt = _snapshot(conn)
+        assert len(incremental) == len(rebuilt), (len(incremental), len(rebuilt))
+        for before, after in zip(incremental, rebuilt):
+            assert before[:4] == after[:4] and before[8:11] == after[8:11], (before, after)
+            assert all(abs(a - b) < 1e-6 * max(1, abs(b)) for a, b in zip(before[4:8] + before[11:],
+                                                                          after[4:8] + after[11:])), (before, after)
+        print("  ✓ incremental rollups match the rebuild")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild or benchmark the crop price rollups')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every rollup from transactions_history')
+    parser.add_argument('--benchmark', action='store_true', help='chart benchmark on a scratch database')
+    parser.add_argument('--transactions', type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.transactions)
+    if args.rebuild:
+        from app import storage
+        for path in storage.sqlite_paths():
+            conn = attach_archive(sqlite3.connect(path, isolation_level=None, timeout=30), path)
+            start = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                days = rebuild(conn)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            finally:
+                conn.close()
+            print(f"✓ Rebuilt {days:,} daily price buckets in {path} in {time.perf_counter() - start:.1f}s")
+    if not (args.benchmark or args.rebuild):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+PDF Report Jobs for Surplus-to-Sustain
+Renders impact and transaction statements in a background process pool
+and caches the PDFs on disk, keyed by user and a data watermark
+
+A job in progress is a `.pending` marker holding its start time, so any
+worker can report it as running. A marker older than REPORT_PENDING_TIMEOUT
+belongs to a worker that died mid-render and counts as failed, so the user
+can ask again.
+"""
+
+import glob
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from retention import attach_archive
+
+REPORT_KINDS = ('impact', 'transactions')
+REPORT_DIR = os.environ.get('REPORT_DIR', 'report_cache')
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+MAX_JOBS_PER_USER = int(os.environ.get('REPORT_MAX_JOBS_PER_USER', 2))
+MAX_PENDING_JOBS = int(os.environ.get('REPORT_MAX_PENDING_JOBS', REPORT_WORKERS * 8))
+REPORT_PENDING_TIMEOUT = int(os.environ.get('REPORT_PENDING_TIMEOUT', 600))
+
+
+class ReportLimitError(Exception):
+    """Raised when a job would exceed the per-user or pool-wide limit"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def data_watermark(conn, user_id):
+    """
+    Fingerprint of everything a user's reports are built from: the user's
+    data revision (bumped by trigger on every crop or transaction write, see
+    revisions.py), their name, the buyers generation (buyer names appear on
+    statements) and their impact rollup row (waste flows don't bump the
+    revision). One primary-key read each.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''SELECT u.data_revision, u.username, u.full_name,
+                            COALESCE((SELECT generation FROM cache_generations WHERE name = 'buyers'), 0),
+                            r.flows, r.quantity_tons, r.food_saved, r.co2_saved, r.compost_generated, r.updated_at
+                     FROM users u
+                     LEFT JOIN impact_rollups r ON r.scope = 'farmer' AND r.scope_key = CAST(u.id AS TEXT)
+                     WHERE u.id = ?''', (user_id,))
+    return hashlib.sha1(repr(tuple(cursor.fetchone() or ())).encode()).hexdigest()[:16]
+
+
+def report_job_id(user_id, kind, watermark):
+    """Job ids double as cache keys, so any worker can find a finished report"""
+    return f'{user_id}-{kind}-{watermark}'
+
+
+def report_path(job_id, suffix='.pdf'):
+    return os.path.join(REPORT_DIR, job_id + suffix)
+
+
+# ==================== RENDERING (runs in worker processes) ====================
+
+def render_report(kind, user_id, db_path, out_path):
+    """Query the database and write a PDF; executed inside the process pool"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    conn = attach_archive(sqlite3.connect(db_path), db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('SELECT username, full_name FROM users WHERE id = ?', (user_id,))
+    user = cursor.fetchone()
+
+    styles = getSampleStyleSheet()
+    name = (user['full_name'] or user['username']) if user else f'User {user_id}'
+    story = [
+        Paragraph(f'Surplus-to-Sustain — {kind.title()} Statement', styles['Title']),
+        Paragraph(f'{name} · generated {datetime.now().strftime("%Y-%m-%d %H:%M")}', styles['Normal']),
+        Spacer(1, 18),
+    ]
+
+    if kind == 'impact':
+        cursor.execute('''SELECT SUM(predicted_surplus) as total_surplus, COUNT(*) as total_crops
+                         FROM crops WHERE farmer_id = ?''', (user_id,))
+        stats = cursor.fetchone()
+        cursor.execute('''SELECT * FROM impact_rollups WHERE scope = 'farmer' AND scope_key = ?''',
+                       (str(user_id),))
+        impact = cursor.fetchone()
+        data = [
+            ['Metric', 'Value'],
+            ['Crops tracked', stats['total_crops']],
+            ['Predicted surplus', f"{stats['total_surplus'] or 0:.2f} tons"],
+            ['Completed waste flows', impact['flows'] if impact else 0],
+            ['Food saved from waste', f"{impact['food_saved'] if impact else 0:.2f} tons"],
+            ['CO₂ emissions prevented', f"{impact['co2_saved'] if impact else 0:.2f} tons"],
+            ['Compost generated', f"{impact['compost_generated'] if impact else 0:.2f} tons"],
+        ]
+    else:
+        cursor.execute('''SELECT t.transaction_date, c.crop_name, b.name as buyer_name,
+                                t.quantity_tons, t.price_per_kg, t.total_amount, t.status
+                         FROM transactions_history t
+                         JOIN buyers b ON t.buyer_id = b.id
+                         JOIN crops c ON t.crop_id = c.id
+                         WHERE t.farmer_id = ?
+                         ORDER BY t.transaction_date''', (user_id,))
+        data = [['Date', 'Crop', 'Buyer', 'Qty (t)', '₹/kg', 'Amount (₹)', 'Status']]
+        total = 0
+        for row in cursor:
+            data.append([row['transaction_date'], row['crop_name'], row['buyer_name'],
+                         f"{row['quantity_tons']:.2f}", f"{row['price_per_kg']:.2f}",
+                         f"{row['total_amount']:,.0f}", row['status']])
+            total += row['total_amount'] or 0
+        data.append(['', '', '', '', 'Total', f'{total:,.0f}', ''])
+    conn.close()
+
+    table = Table(data, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#198754')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ]))
+    story.append(table)
+
+    # Write next to the target and rename, so readers never see a half-written PDF
+    tmp_path = out_path + '.tmp'
+    SimpleDocTemplate(tmp_path, pagesize=A4).build(story)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+# ==================== JOB MANAGEMENT (runs in the web process) ====================
+
+_executor = None
+_jobs = {}  # job_id -> (user_id, future), for jobs submitted by this process
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn: never fork a web worker that may hold threads and open DB handles
+        _executor = ProcessPoolExecutor(max_workers=REPORT_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _on_done(job_id, future):
+    with _lock:
+        _jobs.pop(job_id, None)
+    error = future.exception()
+    if error is not None:
+        with open(report_path(job_id, '.error'), 'w') as f:
+            f.write(str(error))
+    else:
+        # Older watermarks for the same user and kind can never be requested again
+        prefix = job_id.rsplit('-', 1)[0]
+        for stale in glob.glob(os.path.join(REPORT_DIR, f'{prefix}-*.pdf')):
+            if stale != report_path(job_id):
+                os.remove(stale)
+    try:
+        os.remove(report_path(job_id, '.pending'))
+    except FileNotFoundError:
+        pass
+
+
+def submit_report(conn, kind, user_id, db_path):
+    """
+    Queue a report, or return straight away if an up-to-date one is cached
+
+    Returns (job_id, status) where status is 'done' or 'running'.
+    Raises ReportLimitError when a limit is hit.
+    """
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    job_id = report_job_id(user_id, kind, data_watermark(conn, user_id))
+    if os.path.exists(report_path(job_id)):
+        return job_id, 'done'
+
+    with _lock:
+        if job_id in _jobs:
+            return job_id, 'running'
+        if sum(1 for owner, _ in _jobs.values() if owner == user_id) >= MAX_JOBS_PER_USER:
+            raise ReportLimitError('Too many reports in progress. Please wait.', 429)
+        if len(_jobs) >= MAX_PENDING_JOBS:
+            raise ReportLimitError('Report service is busy. Please try again shortly.', 503)
+
+        with open(report_path(job_id, '.pending'), 'w') as f:
+            f.write(str(time.time()))
+        if os.path.exists(report_path(job_id, '.error')):
+            os.remove(report_path(job_id, '.error'))
+        future = _get_executor().submit(render_report, kind, user_id,
+                                        os.path.abspath(db_path), os.path.abspath(report_path(job_id)))
+        _jobs[job_id] = (user_id, future)
+
+    future.add_done_callback(lambda f: _on_done(job_id, f))
+    return job_id, 'running'
+
+
+def _pending_since(job_id):
+    """When the job's .pending marker was written, or None if there isn't one"""
+    path = report_path(job_id, '.pending')
+    try:
+        with open(path) as f:
+            return float(f.read() or os.path.getmtime(path))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def report_status(job_id):
+    """'done', 'running', 'failed' or None, judged from the shared cache dir"""
+    if os.path.exists(report_path(job_id)):
+        return 'done'
+    started = _pending_since(job_id)
+    if started is not None:
+        with _lock:
+            mine = job_id in _jobs
+        if mine or time.time() - started < REPORT_PENDING_TIMEOUT:
+            return 'running'
+        return 'failed'  # the worker rendering it is gone
+    if os.path.exists(report_path(job_id, '.error')):
+        return 'failed'
+    return None
@@ -0,0 +1,305 @@
+"""
+Prediction Re-scoring for Surplus-to-Sustain
+
+    python rescore.py                       # re-score every crop stored under another model version
+    python rescore.py --status              # progress of the job for the current model
+    python rescore.py --benchmark --crops 2000000
+
+crops.predicted_yield and predicted_surplus are computed once when a crop is
+added, and the model version that computed them is stored next to them.
+After train_model.py writes a new model.pkl, this job walks crops in primary
+key order, RESCORE_CHUNK_SIZE at a time, scores each chunk with one
+predict_batch call and writes it back with executemany in its own short
+transaction.
+
+Each chunk commits together with the job's cursor in rescore_jobs, so a job
+killed at any point resumes after the last committed chunk; rows already
+stored under the current version are never re-scored. Running it again
+after it finished sweeps up crops that workers still on the old model added
+meanwhile (restart the web workers after retraining).
+
+The job keeps to RESCORE_DUTY_CYCLE of wall time, sleeping after every chunk
+in proportion to how long it took, so requests waiting on the write lock
+never queue behind more than one chunk.
+
+Stored crops have no weather, so they are scored with predict_batch's
+default weather, as add_crop() does. A crop whose inputs are edited between
+the read and the write of its chunk is left alone.
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from prediction import predictor, get_model_version
+
+RESCORE_CHUNK_SIZE = int(os.environ.get('RESCORE_CHUNK_SIZE', 500))
+RESCORE_DUTY_CYCLE = float(os.environ.get('RESCORE_DUTY_CYCLE', 0.5))
+
+CROP_SCORE_COLUMNS = {
+    'model_version': 'TEXT',
+    'scored_at': 'TIMESTAMP',
+}
+
+PROGRESS_COLUMNS = ('model_version', 'last_id', 'total', 'scored', 'changed', 'skipped',
+                    'busy_seconds', 'started_at', 'updated_at', 'finished_at')
+
+# ?1-?3 are the new values; the crop's inputs (?5-?10) must still be the ones that were scored
+_WRITE = '''UPDATE crops SET predicted_yield = ?1, predicted_surplus = ?2, model_version = ?3,
+                             scored_at = CURRENT_TIMESTAMP,
+                             updated_at = CASE WHEN predicted_yield IS ?1 AND predicted_surplus IS ?2
+                                               THEN updated_at ELSE CURRENT_TIMESTAMP END
+            WHERE id = ?4 AND crop_name = ?5 AND area = ?6 AND soil_type IS ?7 AND season IS ?8
+            AND irrigation_type IS ?9 AND expected_consumption IS ?10'''
+
+
+def init_rescore(cursor):
+    """Progress table of re-scoring jobs, one row per model version"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rescore_jobs (
+            model_version TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            scored INTEGER NOT NULL DEFAULT 0,
+            changed INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            busy_seconds REAL NOT NULL DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+
+def progress(conn, version=None):
+    """The job row for a model version (default: the loaded one) as a dict, or None"""
+    row = conn.execute(f'SELECT {", ".join(PROGRESS_COLUMNS)} FROM rescore_jobs WHERE model_version = ?',
+                       (version or get_model_version(),)).fetchone()
+    return dict(zip(PROGRESS_COLUMNS, row)) if row else None
+
+
+def _start(conn, version):
+    """Resume the version's job, or start a pass over every crop stored under another version"""
+    job = progress(conn, version)
+    if job and not job['finished_at']:
+        return job
+    total = conn.execute('SELECT COUNT(*) FROM crops WHERE model_version IS NOT ?', (version,)).fetchone()[0]
+    if job and not total:
+        return job  # nothing new to sweep up; keep the finished pass's figures
+    conn.execute('''INSERT INTO rescore_jobs (model_version, total) VALUES (?, ?)
+                    ON CONFLICT(model_version) DO UPDATE SET
+                        last_id = 0, total = excluded.total, scored = 0, changed = 0, skipped = 0,
+                        busy_seconds = 0, started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP,
+                        finished_at = NULL''', (version, total))
+    return progress(conn, version)
+
+
+def score_chunk(rows, version):
+    """
+    Parameters for _WRITE from (id, crop_name, area, soil, season, irrigation,
+    consumption, predicted_yield, predicted_surplus) rows; also returns how
+    many predictions moved by more than rounding
+    """
+    _, crops, areas, soils, seasons, irrigations, consumptions, old_yields, _ = zip(*rows)
+    yields = predictor.predict_batch(crops, areas, [s or '' for s in soils], [s or '' for s in seasons],
+                                     [i or '' for i in irrigations])
+    need = np.array([c or 0 for c in consumptions], dtype=float)
+    surplus = np.round(np.maximum(0, yields - need), 2)
+
+    old = np.array([np.nan if y is None else y for y in old_yields], dtype=float)
+    changed = int(np.count_nonzero(~(np.abs(old - yields) < 0.005)))
+    params = [(y, s, version) + row[:7] for y, s, row in zip(yields.tolist(), surplus.tolist(), rows)]
+    return params, changed
+
+
+def run(db_path, version=None, chunk_size=RESCORE_CHUNK_SIZE, duty_cycle=RESCORE_DUTY_CYCLE,
+        log=print, stop_after=None):
+    """
+    Re-score crops stored under any other model version; returns the job row
+
+    stop_after=n returns after n chunks, as if interrupted.
+    """
+    version = version or get_model_version()
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        init_rescore(conn)
+        job = _start(conn, version)
+        if (job['scored'] or job['skipped']) and not job['finished_at']:
+            log(f"  resuming after crop #{job['last_id']:,} ({job['scored']:,} of {job['total']:,} done)")
+        last_id, chunks, started = job['last_id'], 0, time.perf_counter()
+        done_before = job['scored'] + job['skipped']
+
+        while stop_after is None or chunks < stop_after:
+            busy = time.perf_counter()
+            rows = conn.execute('''SELECT id, crop_name, area, soil_type, season, irrigation_type,
+                                          expected_consumption, predicted_yield, predicted_surplus
+                                   FROM crops WHERE id > ? AND model_version IS NOT ?
+                                   ORDER BY id LIMIT ?''', (last_id, version, chunk_size)).fetchall()
+            if not rows:
+                conn.execute('''UPDATE rescore_jobs SET finished_at = CURRENT_TIMESTAMP,
+                                updated_at = CURRENT_TIMESTAMP WHERE model_version = ?''', (version,))
+                break
+            params, changed = score_chunk(rows, version)
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                written = conn.executemany(_WRITE, params).rowcount
+                last_id = rows[-1][0]
+                seconds = time.perf_counter() - busy
+                conn.execute('''UPDATE rescore_jobs SET last_id = ?, scored = scored + ?, changed = changed + ?,
+                                       skipped = skipped + ?, busy_seconds = busy_seconds + ?,
+                                       updated_at = CURRENT_TIMESTAMP
+                                WHERE model_version = ?''',
+                             (last_id, written, changed, len(rows) - written, seconds, version))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            chunks += 1
+
+            job = progress(conn, version)
+            done = job['scored'] + job['skipped']
+            rate = (done - done_before) / (time.perf_counter() - started)
+            remaining = max(job['total'] - done, 0)
+            log(f"  crops ≤ #{last_id:,}: {done:,}/{job['total']:,} "
+                f"({job['changed']:,} changed, {job['skipped']:,} edited meanwhile), "
+                f"{rate:,.0f}/s, ETA {remaining / rate if rate else 0:,.0f}s")
+
+            # Hold the database for at most duty_cycle of the time
+            seconds = time.perf_counter() - busy
+            if duty_cycle < 1:
+                time.sleep(seconds * (1 - duty_cycle) / duty_cycle)
+
+        return progress(conn, version)
+    finally:
+        conn.close()
+
+
+# ==================== BENCHMARK ====================
+
+def benchmark(n_crops, chunk_size=RESCORE_CHUNK_SIZE):
+    """Throughput, write latency seen by a concurrent writer, and resume after interruption"""
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ['DATABASE'] = db_path = os.path.join(scratch, 'rescore.db')
+        os.environ['ARCHIVE_DATABASE'] = os.path.join(scratch, 'rescore_archive.db')
+        from app import init_db, storage
+        from datagen import generate
+
+        init_db()
+        storage.close()
+        counts = {'farmers': max(n_crops // 20, 1), 'buyers': 100, 'crops': n_crops, 'transactions': 0,
+                  'storage_bookings': 0, 'notifications': 0, 'waste_flows': 0}
+        print(f"\n🌱 Loading {n_crops:,} crops ...")
+        start = time.perf_counter()
+        generate(db_path, counts, log=lambda line: None)
+        print(f"  loaded in {time.perf_counter() - start:.1f}s ({os.path.getsize(db_path) / 1e6:,.0f} MB)")
+
+        def write_latencies(stop):
+            """What add_crop() waits for: one single-row write every 20 ms"""
+            conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+            latencies = []
+            while not stop.is_set():
+                begin = time.perf_counter()
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = 1")
+                conn.execute('COMMIT')
+                latencies.append((time.perf_counter() - begin) * 1000)
+                time.sleep(0.02)
+            conn.close()
+            return latencies
+
+        def measured(work):
+            stop = threading.Event()
+            result = {}
+            writer = threading.Thread(target=lambda: result.setdefault('ms', write_latencies(stop)))
+            writer.start()
+            begin = time.perf_counter()
+            job = work()
+            seconds = time.perf_counter() - begin
+            stop.set()
+            writer.join()
+            ms = sorted(result['ms'])
+            return job, seconds, statistics.median(ms), ms[int(len(ms) * 0.99)]
+
+        idle = measured(lambda: time.sleep(2))
+        print(f"\n  {'':<34}{'crops/s':>10}{'write p50 ms':>14}{'write p99 ms':>14}")
+        print(f"  {'no job':<34}{'':>10}{idle[2]:>14.2f}{idle[3]:>14.2f}")
+
+        for label, version, duty in (('re-score, duty cycle 1.0', 'bench-a', 1.0),
+                                     (f're-score, duty cycle {RESCORE_DUTY_CYCLE}', 'bench-b', RESCORE_DUTY_CYCLE)):
+            job, seconds, p50, p99 = measured(lambda: run(db_path, version, chunk_size, duty, log=lambda line: None))
+            print(f"  {label:<34}{job['scored'] / seconds:>10,.0f}{p50:>14.2f}{p99:>14.2f}")
+
+        # Interrupt a job halfway, resume it, and check every crop was scored exactly once
+        chunks = max(1, n_crops // chunk_size // 2)
+        half = run(db_path, 'bench-c', chunk_size, 1.0, log=lambda line: None, stop_after=chunks)
+        job = run(db_path, 'bench-c', chunk_size, 1.0, log=lambda line: None)
+        conn = sqlite3.connect(db_path)
+        stale = conn.execute("SELECT COUNT(*) FROM crops WHERE model_version IS NOT 'bench-c'").fetchone()[0]
+        sample = conn.execute('''SELECT crop_name, area, soil_type, season, irrigation_type, predicted_yield
+                                 FROM crops WHERE id % 997 = 0''').fetchall()
+        conn.close()
+        names, areas, soils, seasons, irrigations, stored = zip(*sample)
+        expected = predictor.predict_batch(names, areas, soils, seasons, irrigations)
+        ok = (not stale and half['scored'] == chunks * chunk_size and job['scored'] == n_crops
+              and job['skipped'] == 0 and np.allclose(expected, stored))
+        print(f"\n  {'✓' if ok else '✗'} interrupted after {half['scored']:,} crops, resumed to "
+              f"{job['scored']:,}/{n_crops:,}; stored predictions match predict_batch")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-score stored crop predictions with the current model')
+    parser.add_argument('--status', action='store_true', help='show progress of the current model\'s job')
+    parser.add_argument('--chunk-size', type=int, default=RESCORE_CHUNK_SIZE, help='crops per transaction')
+    parser.add_argument('--duty-cycle', type=float, default=RESCORE_DUTY_CYCLE,
+                        help='share of wall time the job may be busy (0-1]')
+    parser.add_argument('--benchmark', action='store_true', help='time a job on a generated database')
+    parser.add_argument('--crops', type=int, default=1_000_000, help='crops to generate for --benchmark')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.crops, args.chunk_size)
+        return
+    if not 0 < args.duty_cycle <= 1:
+        parser.error('--duty-cycle must be in (0, 1]')
+
+    from app import storage
+
+    version = get_model_version()
+    paths = storage.sqlite_paths()
+    if args.status:
+        for path in paths:
+            conn = sqlite3.connect(path)
+            try:
+                init_rescore(conn)
+                job = progress(conn, version)
+            finally:
+                conn.close()
+            if not job:
+                print(f"No re-scoring job for model {version} in {path} yet.")
+                continue
+            print(path)
+            for column in PROGRESS_COLUMNS:
+                print(f"  {column:<14} {job[column]}")
+        return
+
+    # One resumable job per SQLite file (each shard when sharded)
+    for path in paths:
+        print(f"🔄 Re-scoring crops in {path} with model {version} ...")
+        start = time.perf_counter()
+        try:
+            job = run(path, version, args.chunk_size, args.duty_cycle)
+        except KeyboardInterrupt:
+            print("\nStopped; run again to resume.")
+            return
+        print(f"✓ {job['scored']:,} crops re-scored ({job['changed']:,} changed, "
+              f"{job['skipped']:,} edited meanwhile) in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -2,65 +2,115 @@
 """
 Database Reset Script for Surplus-to-Sustain
 This script safely deletes and recreates the database
+
+    python reset_database.py                               # interactive, empty schema
+    python reset_database.py --yes --generate --scale 100  # ~10M rows of sample data
 """
 
+import argparse
 import os
 import sys
 
-def reset_database():
+DATABASE = os.environ.get('DATABASE', 'database.db')
+
+def remove_database(path):
+    """Delete the database file and its WAL/shared-memory side files"""
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def reset_database(assume_yes=False):
     print("\n" + "="*60)
     print(" DATABASE RESET SCRIPT")
     print("="*60)
-    
+
     # Check if database exists
-    if os.path.exists('database.db'):
-        print("\n⚠️  Found existing database.db")
-        response = input("Delete and recreate? (yes/no): ").lower()
-        
+    if os.path.exists(DATABASE):
+        print(f"\n⚠️  Found existing {DATABASE}")
+        response = 'yes' if assume_yes else input("Delete and recreate? (yes/no): ").lower()
+
         if response != 'yes':
             print("❌ Cancelled. Database not modified.")
-            return
-        
+            return False
+
         try:
-            os.remove('database.db')
+            remove_database(DATABASE)
             print("✓ Old database deleted")
         except Exception as e:
             print(f"❌ Error deleting database: {e}")
-            return
+            return False
     else:
         print("\n📝 No existing database found. Creating new one...")
-    
+
     # Create new database
     try:
         print("\n🔨 Creating new database...")
-        from app import init_db
+        from app import init_db, storage
         init_db()
+        # Pooled connections would keep the generator from taking the database exclusively
+        storage.close()
         print("✓ Database created successfully!")
-        
+
         # Verify tables
         import sqlite3
-        conn = sqlite3.connect('database.db')
+        conn = sqlite3.connect(DATABASE)
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         tables = cursor.fetchall()
         conn.close()
-        
+
         print(f"\n✓ Created {len(tables)} tables:")
         for table in tables:
             print(f"  - {table[0]}")
-        
-        print("\n" + "="*60)
-        print(" DATABASE READY!")
-        print("="*60)
-        print("\nYou can now run: python app.py")
-        print("Or visit: http://localhost:8000\n")
-        
+
     except Exception as e:
         print(f"\n❌ Error creating database: {e}")
         print("\nTroubleshooting:")
         print("1. Make sure app.py is in the current directory")
         print("2. Make sure all dependencies are installed")
         print("3. Try running: pip install -r requirements-minimal.txt")
+        return False
+    return True
+
+def generate_data(scale, seed, as_of, password):
+    """Fill the new database with generated sample data"""
+    import time
+    from datagen import BASE_COUNTS, generate
+    from auth import hash_password
+
+    counts = {table: max(1, int(count * scale)) for table, count in BASE_COUNTS.items()}
+    total = sum(counts.values())
+    print(f"\n🌱 Generating {total:,} rows (scale {scale}, seed {seed}):")
+    for table, count in counts.items():
+        print(f"  {table:<18} {count:>12,}")
+
+    print("\n⏱  Load timings:")
+    start = time.perf_counter()
+    generate(DATABASE, counts, seed=seed, as_of=as_of, password_hash=hash_password(password))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n✓ Loaded {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    print(f"✓ Database size: {os.path.getsize(DATABASE) / 1e6:,.1f} MB")
+    print(f"✓ Log in as farmer1 … farmer{counts['farmers']} with password '{password}'")
 
 if __name__ == "__main__":
-    reset_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Recreate the database, optionally with generated data')
+    parser.add_argument('--yes', action='store_true', help="don't ask before deleting the database")
+    parser.add_argument('--generate', action='store_true', help='load generated sample data')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='row count multiplier (1 = ~100k rows, 100 = ~10M rows)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--as-of', help='date the generated history ends on, YYYY-MM-DD (default: today)')
+    parser.add_argument('--password', default='farmer123', help='password for every generated farmer')
+    args = parser.parse_args()
+
+    if not reset_database(args.yes):
+        sys.exit(1)
+    if args.generate:
+        generate_data(args.scale, args.seed, args.as_of, args.password)
+
+    print("\n" + "="*60)
+    print(" DATABASE READY!")
+    print("="*60)
+    print("\nYou can now run: python app.py")
+    print("Or visit: http://localhost:8000\n")
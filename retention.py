@@ -0,0 +1,203 @@
+"""
+Retention and Archiving for Surplus-to-Sustain
+
+    python retention.py            # one pass: archive, then reclaim space
+    python retention.py --convert  # one-off: switch an existing database to incremental vacuum
+
+Read notifications older than NOTIFICATION_RETENTION_DAYS and completed
+transactions older than TRANSACTION_RETENTION_MONTHS are moved to the same
+tables in an attached archive database, RETENTION_BATCH_SIZE rows per short
+write transaction with a pause in between, so the web app's writers only
+ever wait for one small batch.
+
+Both databases use WAL and auto_vacuum=INCREMENTAL; after archiving, freed pages
+are handed back to the filesystem a few hundred at a time.
+
+History paths (the transactions page, exports and statements) read the
+`transactions_history` / `notifications_history` views that attach_archive()
+creates, which UNION ALL the live and archived rows.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+TRANSACTION_RETENTION_MONTHS = int(os.environ.get('TRANSACTION_RETENTION_MONTHS', 24))
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 500))
+RETENTION_PAUSE_SECONDS = float(os.environ.get('RETENTION_PAUSE_SECONDS', 0.05))
+VACUUM_PAGES_PER_STEP = int(os.environ.get('VACUUM_PAGES_PER_STEP', 256))
+
+# table -> (rows eligible for archiving, cutoff modifier, archive index columns)
+ARCHIVED_TABLES = {
+    'notifications': ("is_read = 1 AND created_at < datetime('now', ?)",
+                      f'-{NOTIFICATION_RETENTION_DAYS} days', 'user_id, created_at'),
+    'transactions': ("status = 'completed' AND transaction_date < date('now', ?)",
+                     f'-{TRANSACTION_RETENTION_MONTHS} months', 'farmer_id, transaction_date'),
+}
+
+
+def archive_path(db_path):
+    """ARCHIVE_DATABASE, or database_archive.db next to the live database"""
+    return os.environ.get('ARCHIVE_DATABASE') or os.path.splitext(db_path)[0] + '_archive.db'
+
+
+def _columns(conn, schema, table):
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def attach_archive(conn, db_path):
+    """
+    Attach the archive as `archive`, bring its tables up to the live schema
+    and create the temp *_history views on this connection
+    """
+    if not any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list')):
+        conn.execute('ATTACH DATABASE ? AS archive', (archive_path(db_path),))
+
+    for table, (_, _, index_columns) in ARCHIVED_TABLES.items():
+        live = _columns(conn, 'main', table)
+        archived = {name for name, _ in _columns(conn, 'archive', table)}
+        if not archived:
+            if not conn.execute('PRAGMA archive.page_count').fetchone()[0]:
+                conn.execute('PRAGMA archive.auto_vacuum = INCREMENTAL')
+                # Like the live database, so a backup's long read never holds up archiving
+                conn.execute('PRAGMA archive.journal_mode = WAL').fetchall()
+            definition = ', '.join(f'{name} {decl}' + (' PRIMARY KEY' if name == 'id' else '')
+                                   for name, decl in live)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} ({definition}, '
+                         f'archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS archive.idx_{table}_archive ON {table}({index_columns})')
+        else:
+            # Columns added to the live table since the archive was created
+            for name, decl in live:
+                if name not in archived:
+                    try:
+                        conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {decl}')
+                    except sqlite3.OperationalError:
+                        # Another connection added it first
+                        pass
+
+        column_list = ', '.join(name for name, _ in live)
+        conn.execute(f'DROP VIEW IF EXISTS temp.{table}_history')
+        conn.execute(f'''CREATE TEMP VIEW {table}_history AS
+                         SELECT {column_list} FROM main.{table}
+                         UNION ALL
+                         SELECT {column_list} FROM archive.{table}''')
+    return conn
+
+
+def archive_batch(conn, table, after_id, batch_size=RETENTION_BATCH_SIZE):
+    """
+    Move one batch of eligible rows (id > after_id); returns the ids moved
+
+    The insert and delete share one transaction. In WAL mode a crash can
+    still commit the archive side alone; the rows stay eligible and the
+    next pass replaces them, so nothing is lost or kept twice for long.
+    """
+    where, cutoff, _ = ARCHIVED_TABLES[table]
+    columns = ', '.join(name for name, _ in _columns(conn, 'main', table))
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        ids = [row[0] for row in conn.execute(
+            f'SELECT id FROM main.{table} WHERE id > ? AND {where} ORDER BY id LIMIT ?',
+            (after_id, cutoff, batch_size))]
+        if ids:
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(f'''INSERT OR REPLACE INTO archive.{table} ({columns})
+                             SELECT {columns} FROM main.{table} WHERE id IN ({placeholders})''', ids)
+            conn.execute(f'DELETE FROM main.{table} WHERE id IN ({placeholders})', ids)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return ids
+
+
+def archive_table(conn, table, dry_run=False):
+    """Archive every eligible row of a table in batches; returns rows moved"""
+    if dry_run:
+        where, cutoff, _ = ARCHIVED_TABLES[table]
+        return conn.execute(f'SELECT COUNT(*) FROM main.{table} WHERE {where}', (cutoff,)).fetchone()[0]
+
+    moved = 0
+    after_id = 0
+    while True:
+        ids = archive_batch(conn, table, after_id)
+        if not ids:
+            return moved
+        moved += len(ids)
+        after_id = ids[-1]
+        time.sleep(RETENTION_PAUSE_SECONDS)
+
+
+def reclaim_space(conn, schema='main'):
+    """Release free pages in small incremental_vacuum steps; returns pages freed"""
+    if conn.execute(f'PRAGMA {schema}.auto_vacuum').fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while True:
+        free = conn.execute(f'PRAGMA {schema}.freelist_count').fetchone()[0]
+        if not free:
+            # In WAL mode the file is only truncated when the log is checkpointed
+            conn.execute(f'PRAGMA {schema}.wal_checkpoint(PASSIVE)').fetchall()
+            return freed
+        # executescript steps the pragma to completion; execute() frees a single page
+        conn.executescript(f'PRAGMA {schema}.incremental_vacuum({VACUUM_PAGES_PER_STEP})')
+        freed += free - conn.execute(f'PRAGMA {schema}.freelist_count').fetchone()[0]
+        time.sleep(RETENTION_PAUSE_SECONDS)
+
+
+def convert_to_incremental(conn):
+    """One-off VACUUM so an existing database starts using incremental auto_vacuum"""
+    conn.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+
+def run_once(conn, db_path, dry_run=False, vacuum=True):
+    """Archive all tables, then reclaim space; returns {table: rows}"""
+    attach_archive(conn, db_path)
+    moved = {table: archive_table(conn, table, dry_run) for table in ARCHIVED_TABLES}
+    if vacuum and not dry_run:
+        moved['pages_freed'] = reclaim_space(conn, 'main')
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old notifications and transactions')
+    parser.add_argument('--dry-run', action='store_true', help='only count eligible rows')
+    parser.add_argument('--no-vacuum', action='store_true', help='skip incremental vacuum')
+    parser.add_argument('--convert', action='store_true',
+                        help='VACUUM once to enable incremental auto_vacuum (locks the database)')
+    args = parser.parse_args()
+
+    from app import storage
+
+    for path in storage.sqlite_paths():
+        # Autocommit mode: archive_batch manages its own transactions
+        conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        try:
+            if args.convert:
+                start = time.perf_counter()
+                convert_to_incremental(conn)
+                print(f"✓ {path} converted to incremental auto_vacuum in {time.perf_counter() - start:.1f}s")
+
+            size_before = os.path.getsize(path)
+            start = time.perf_counter()
+            result = run_once(conn, path, dry_run=args.dry_run, vacuum=not args.no_vacuum)
+            elapsed = time.perf_counter() - start
+
+            verb = 'eligible' if args.dry_run else 'archived'
+            for table in ARCHIVED_TABLES:
+                print(f"  {table:<15} {result[table]:>10,} rows {verb}")
+            if 'pages_freed' in result:
+                print(f"  {'pages freed':<15} {result['pages_freed']:>10,}")
+            print(f"✓ Done in {elapsed:.2f}s, {path}: "
+                  f"{size_before / 1e6:.1f} MB -> {os.path.getsize(path) / 1e6:.1f} MB")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Per-User Data Revisions and Conditional GET for Surplus-to-Sustain
+
+Triggers bump `users.data_revision` (and stamp `data_modified_at`) on every
+write to a farmer's crops, transactions or notifications. Views decorated
+with @conditional read that counter with one primary-key lookup, derive a
+weak ETag from it and answer 304 Not Modified before running any of their
+own queries or rendering a template.
+
+The ETag also covers the session's display name, a hash of the app's
+modules, templates and static manifest (so a deploy that changes any of
+them never revalidates an old page) and, on pages showing buyer names or
+cards, the buyers generation. ETags are the only validator: Last-Modified
+is sent for information, but If-Modified-Since is not honoured since
+revisions only have one-second timestamps.
+"""
+
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import g, make_response, request, session
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+_REVISED_TABLES = {'crops': 'farmer_id', 'transactions': 'farmer_id', 'notifications': 'user_id'}
+
+
+def init_revisions(cursor):
+    """Triggers that bump the owning user's revision on each write"""
+    for table, owner in _REVISED_TABLES.items():
+        for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_revision_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE users SET data_revision = data_revision + 1, data_modified_at = CURRENT_TIMESTAMP
+                    WHERE id = {row}.{owner};
+                END
+            ''')
+
+
+def _build_fingerprint():
+    """Hash of everything besides data that shapes a page, plus its newest mtime"""
+    digest = hashlib.sha1()
+    newest = 0
+    # Contents rather than mtimes, so every replica of one deploy agrees on the tag
+    paths = [os.path.join(_ROOT, 'static', 'dist', 'manifest.json')]
+    paths.extend(os.path.join(_ROOT, name) for name in os.listdir(_ROOT) if name.endswith('.py'))
+    for root, _, files in os.walk(os.path.join(_ROOT, 'templates')):
+        paths.extend(os.path.join(root, name) for name in files)
+    for path in sorted(paths):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+            newest = max(newest, os.path.getmtime(path))
+    return digest.hexdigest()[:12], datetime.fromtimestamp(int(newest), timezone.utc)
+
+
+BUILD_TAG, BUILD_TIME = _build_fingerprint()
+
+
+def _validators(storage, buyers=True):
+    """(etag, last_modified) for the current user, from one primary-key read"""
+    row = storage.revision_validators(session['user_id'])
+    if row is None:
+        return None, None
+
+    # The navbar badge needs this too; saves the context processor a query
+    g.unread_count = row['unread_count']
+
+    tag = f"{BUILD_TAG}:{session['user_id']}:{row['data_revision']}:" \
+          f"{row['buyers_generation'] if buyers else '-'}:{session.get('full_name', '')}"
+    etag = hashlib.sha1(tag.encode()).hexdigest()[:20]
+
+    last_modified = BUILD_TIME
+    if row['data_modified_at']:
+        modified = datetime.strptime(row['data_modified_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        last_modified = max(last_modified, modified)
+    return etag, last_modified
+
+
+def conditional(storage, cache_control='private, no-cache', buyers=True):
+    """
+    Decorator: answer 304 from the user's data revision, else tag the response
+
+    Must sit below @login_required. Pages with pending flash messages are
+    never tagged, since the message is rendered into that one response.
+    buyers=False leaves the buyers generation out of the tag, for views
+    that show no buyer data.
+    """
+    def decorator(f):
+        def tag(response, etag, last_modified):
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control
+            response.vary.add('Cookie')
+            return response
+
+        def check():
+            """(etag, last_modified, 304 response or None)"""
+            if session.get('_flashes'):
+                return None, None, None
+            etag, last_modified = _validators(storage, buyers)
+            if etag and request.if_none_match.contains_weak(etag):
+                return etag, last_modified, tag(make_response('', 304), etag, last_modified)
+            return etag, last_modified, None
+
+        def finish(rv, etag, last_modified):
+            response = make_response(rv)
+            if etag is None:
+                response.headers['Cache-Control'] = 'no-store'
+            elif response.status_code == 200:
+                tag(response, etag, last_modified)
+            return response
+
+        if asyncio.iscoroutinefunction(f):
+            @wraps(f)
+            async def decorated_coroutine(*args, **kwargs):
+                etag, last_modified, not_modified = check()
+                if not_modified is not None:
+                    return not_modified
+                return finish(await f(*args, **kwargs), etag, last_modified)
+            return decorated_coroutine
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag, last_modified, not_modified = check()
+            if not_modified is not None:
+                return not_modified
+            return finish(f(*args, **kwargs), etag, last_modified)
+        return decorated_function
+    return decorator
@@ -0,0 +1,271 @@
+"""
+What-if Scenario Explorer for Surplus-to-Sustain
+
+For one crop, builds the cross-product of alternative soils, seasons,
+irrigation types, planted areas and weather outlooks around the crop as it
+was planned, scores every row in a single YieldPredictor.predict_batch call
+and ranks the predicted surplus outcomes.
+
+Scored grids are kept in a bounded in-process LRU keyed by the crop, every
+input that shapes the grid and the model version, so editing the crop or
+retraining the model simply makes the old entry unreachable.
+
+    python scenarios.py --benchmark     # batch vs per-row scoring, cache hits
+"""
+
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from prediction import predictor, get_model_version
+
+SCENARIO_CACHE_SIZE = int(os.environ.get('SCENARIO_CACHE_SIZE', 500))
+SCENARIO_BUDGET_MS = float(os.environ.get('SCENARIO_BUDGET_MS', 150))
+DEFAULT_LIMIT = 25
+
+SOIL_TYPES = ('loamy', 'clay', 'sandy', 'black')
+SEASONS = ('kharif', 'rabi', 'zaid')
+IRRIGATION_TYPES = ('drip', 'sprinkler', 'flood', 'rainfed')
+AREA_FACTORS = (1.2, 1.1, 1.0, 0.9, 0.8, 0.7)
+
+# Outlook -> (rainfall factor, temperature change °C, humidity change %), applied to the forecast
+WEATHER_OUTLOOKS = {
+    'forecast': (1.0, 0, 0),
+    'dry': (0.6, 2, -10),
+    'wet': (1.4, -1, 10),
+    'heatwave': (0.8, 5, -15),
+}
+
+# How ranked tables are ordered; 'fit' puts the yield closest to expected consumption first
+RANKINGS = ('fit', 'surplus', 'yield')
+
+
+def _choices(current, alternatives):
+    """The crop's own value first, then the other alternatives"""
+    current = (current or alternatives[0]).lower()
+    return (current,) + tuple(value for value in alternatives if value != current)
+
+
+def build_grid(crop, weather):
+    """
+    Every combination of the alternatives as parallel NumPy arrays
+
+    Row 0 is the crop as planned under the forecast, the baseline the
+    other rows are compared with.
+    """
+    dimensions = {
+        'soil_type': np.array(_choices(crop['soil_type'], SOIL_TYPES)),
+        'season': np.array(_choices(crop['season'], SEASONS)),
+        'irrigation_type': np.array(_choices(crop['irrigation_type'], IRRIGATION_TYPES)),
+        'area_factor': np.array((1.0,) + tuple(factor for factor in AREA_FACTORS if factor != 1.0)),
+        'weather': np.array(tuple(WEATHER_OUTLOOKS)),
+    }
+    index = np.meshgrid(*(np.arange(len(values)) for values in dimensions.values()), indexing='ij')
+    grid = {name: values[i.ravel()] for (name, values), i in zip(dimensions.items(), index)}
+
+    outlook = np.array([WEATHER_OUTLOOKS[name] for name in grid['weather']])
+    grid['area'] = np.round(float(crop['area'] or 0) * grid.pop('area_factor'), 2)
+    grid['rainfall'] = weather['rainfall'] * outlook[:, 0]
+    grid['temperature'] = weather['temperature'] + outlook[:, 1]
+    grid['humidity'] = np.clip(weather['humidity'] + outlook[:, 2], 0, 100)
+    return grid
+
+
+def score_grid(crop, grid):
+    """Predicted yield and surplus for every row, with one model call"""
+    n = len(grid['area'])
+    yields = predictor.predict_batch(np.full(n, crop['crop_name']), grid['area'], grid['soil_type'],
+                                     grid['season'], grid['irrigation_type'],
+                                     grid['rainfall'], grid['temperature'], grid['humidity'])
+    surplus = np.maximum(0, yields - float(crop['expected_consumption'] or 0))
+    return yields, np.round(surplus, 2)
+
+
+def rank(yields, consumption, ranking='fit'):
+    """Row order for a ranking; ties go to the higher yield"""
+    if ranking == 'yield':
+        return np.argsort(-yields, kind='stable')
+    key = np.maximum(0, yields - consumption) if ranking == 'surplus' else np.abs(yields - consumption)
+    return np.lexsort((-yields, key))
+
+
+class ScenarioCache:
+    """Thread-safe LRU of scored grids, with hit/miss counters"""
+
+    def __init__(self, size=SCENARIO_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'score_seconds': 0.0, 'over_budget': 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, entry, seconds):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            self.stats['score_seconds'] += seconds
+            if seconds * 1000 > SCENARIO_BUDGET_MS:
+                self.stats['over_budget'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def report(self):
+        """Hit ratio and scoring time, for /api/metrics"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+        stats['score_seconds'] = round(stats['score_seconds'], 4)
+        stats['budget_ms'] = SCENARIO_BUDGET_MS
+        return stats
+
+
+cache = ScenarioCache()
+
+
+def cache_key(crop, weather):
+    """Everything the scored grid depends on, including the model version"""
+    return (crop['id'], get_model_version(), crop['crop_name'].lower(), crop['area'], crop['soil_type'],
+            crop['season'], crop['irrigation_type'], crop['expected_consumption'],
+            weather['rainfall'], weather['temperature'], weather['humidity'])
+
+
+def explore(crop, weather, ranking='fit', limit=DEFAULT_LIMIT):
+    """
+    Ranked what-if table for a crop
+
+    Scores the whole grid on a cache miss (one batched prediction) and
+    returns the baseline, the top `limit` scenarios with their change
+    against it, the grid size and whether the cache answered.
+    """
+    started = time.perf_counter()
+    key = cache_key(crop, weather)
+    entry = cache.get(key)
+    cached = entry is not None
+    if not cached:
+        grid = build_grid(crop, weather)
+        yields, surplus = score_grid(crop, grid)
+        entry = (grid, yields, surplus)
+        # Grids over SCENARIO_BUDGET_MS are counted in over_budget (see /api/metrics)
+        cache.put(key, entry, time.perf_counter() - started)
+
+    grid, yields, surplus = entry
+    consumption = float(crop['expected_consumption'] or 0)
+    order = rank(yields, consumption, ranking)[:limit]
+
+    def row(i):
+        return {
+            'soil_type': str(grid['soil_type'][i]),
+            'season': str(grid['season'][i]),
+            'irrigation_type': str(grid['irrigation_type'][i]),
+            'area': float(grid['area'][i]),
+            'weather': str(grid['weather'][i]),
+            'predicted_yield': float(yields[i]),
+            'predicted_surplus': float(surplus[i]),
+        }
+
+    baseline = row(0)
+    results = []
+    for i in order.tolist():
+        result = row(i)
+        result['yield_change'] = round(result['predicted_yield'] - baseline['predicted_yield'], 2)
+        result['surplus_change'] = round(result['predicted_surplus'] - baseline['predicted_surplus'], 2)
+        results.append(result)
+
+    return {
+        'crop_id': crop['id'],
+        'model_version': get_model_version(),
+        'ranking': ranking,
+        'scenarios': len(yields),
+        'baseline': baseline,
+        'results': results,
+        'cached': cached,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+# ==================== BENCHMARK ====================
+
+def benchmark(crop_name='tomato', runs=50):
+    """Cold and cached explore() latency against scoring the grid row by row"""
+    import contextlib
+    import io
+
+    weather = {'temperature': 28.5, 'rainfall': 450, 'humidity': 65}
+    crops = [{'id': i, 'crop_name': crop_name, 'area': 1.0 + i % 17 * 0.5, 'soil_type': 'loamy',
+              'season': 'kharif', 'irrigation_type': 'flood', 'expected_consumption': 4.0}
+             for i in range(runs)]
+
+    print(f"\n🌱 {crop_name} scenario grid, model version {get_model_version()}")
+    cache.clear()
+    cold = []
+    for crop in crops:
+        started = time.perf_counter()
+        explore(crop, weather)
+        cold.append((time.perf_counter() - started) * 1000)
+    warm = []
+    for crop in crops:
+        started = time.perf_counter()
+        result = explore(crop, weather)
+        warm.append((time.perf_counter() - started) * 1000)
+    assert result['cached']
+
+    grid = build_grid(crops[0], weather)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(len(grid['area'])):
+            predictor.predict_yield_ml(crop_name, grid['area'][i], grid['soil_type'][i], grid['season'][i],
+                                       grid['irrigation_type'][i], grid['rainfall'][i],
+                                       grid['temperature'][i], grid['humidity'][i])
+    per_row = (time.perf_counter() - started) * 1000
+
+    batched, _ = score_grid(crops[0], grid)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sample = [predictor.predict_yield_ml(crop_name, grid['area'][i], grid['soil_type'][i], grid['season'][i],
+                                             grid['irrigation_type'][i], grid['rainfall'][i],
+                                             grid['temperature'][i], grid['humidity'][i])
+                  for i in range(0, len(batched), 97)]
+    assert np.allclose(sample, batched[::97]), 'batched scores differ from per-row predictions'
+
+    print(f"  {len(grid['area'])} scenarios per crop, {runs} crops, budget {SCENARIO_BUDGET_MS:.0f} ms\n")
+    print(f"  {'':<28}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"  {'explore(), cold':<28}{np.percentile(cold, 50):>10.2f}{np.percentile(cold, 95):>10.2f}")
+    print(f"  {'explore(), cached':<28}{np.percentile(warm, 50):>10.3f}{np.percentile(warm, 95):>10.3f}")
+    print(f"  {'per-row predict, one grid':<28}{per_row:>10.1f}")
+    print(f"\n  {'✓' if np.percentile(cold, 95) <= SCENARIO_BUDGET_MS else '✗'} cold p95 within budget, "
+          f"batched scores match per-row predictions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='What-if scenario explorer')
+    parser.add_argument('--benchmark', action='store_true', help='time batched scoring and cache hits')
+    parser.add_argument('--crop', default='tomato', help='crop to benchmark (default tomato)')
+    parser.add_argument('--runs', type=int, default=50, help='crops to score (default 50)')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.crop, args.runs)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
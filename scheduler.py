@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Harvest Reminder Scheduler for Surplus-to-Sustain
+Sends "harvest coming up", "harvest today" and "harvest overdue" notifications
+
+Instead of scanning every crop, each reminder kind keeps a persisted
+(expected_harvest_date, crop id) watermark and only reads the crops that
+became due since the last run, walking idx_crops_harvest_date. Reminders
+are recorded in harvest_reminders, so re-running a batch never sends a
+notification twice.
+
+Crops entered late (e.g. planted weeks before they were added) can be
+behind a kind's watermark already. A second watermark on crop id walks the
+crops added since the last pass and sends such a crop the reminders the
+date walk skipped, as long as they are still relevant: "coming up" until
+the harvest date, "harvest today" until it would be overdue, and "overdue"
+for LATE_OVERDUE_DAYS.
+
+Usage:
+    python scheduler.py            # run every 60 seconds
+    python scheduler.py --once     # run a single pass (e.g. from cron)
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+
+REMINDER_DAYS_BEFORE = int(os.environ.get('HARVEST_REMINDER_DAYS', 7))
+OVERDUE_GRACE_DAYS = int(os.environ.get('HARVEST_OVERDUE_DAYS', 3))
+INITIAL_LOOKBACK_DAYS = 30
+LATE_OVERDUE_DAYS = int(os.environ.get('HARVEST_LATE_OVERDUE_DAYS', 30))
+BATCH_SIZE = 500
+
+# kind -> (days after expected harvest when it fires, statuses it applies to, notification)
+REMINDER_KINDS = {
+    'upcoming': (-REMINDER_DAYS_BEFORE, ('planned', 'growing'),
+                 ('Harvest Coming Up 🌾',
+                  'Your {crop} is expected to be ready on {date}. Line up buyers or storage now.',
+                  'info')),
+    'harvest': (0, ('planned', 'growing'),
+                ('Harvest Day! 🚜',
+                 'Your {crop} is expected to be ready for harvest today ({date}).',
+                 'success')),
+    'overdue': (OVERDUE_GRACE_DAYS, ('growing',),
+                ('Harvest Overdue ⏰',
+                 'Your {crop} was due for harvest on {date} and is still marked as growing. Update its status or act on the surplus.',
+                 'warning')),
+}
+
+# kind -> days after it fires that a late-entered crop still gets it (see the module docstring)
+LATE_ENTRY_DAYS = {
+    'upcoming': REMINDER_DAYS_BEFORE,
+    'harvest': OVERDUE_GRACE_DAYS,
+    'overdue': LATE_OVERDUE_DAYS,
+}
+NEW_CROPS_STATE = 'harvest_new_crops'
+
+
+def init_scheduler(cursor):
+    """Index and bookkeeping tables used by the scheduler"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crops_harvest_date ON crops(expected_harvest_date, id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS harvest_reminders (
+            crop_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (crop_id, kind)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_state (
+            name TEXT PRIMARY KEY,
+            watermark_date DATE NOT NULL,
+            watermark_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def get_watermark(cursor, kind, cutoff):
+    cursor.execute('SELECT watermark_date, watermark_id FROM scheduler_state WHERE name = ?',
+                   (f'harvest_{kind}',))
+    row = cursor.fetchone()
+    if row:
+        return row[0], row[1]
+    start = date.fromisoformat(cutoff) - timedelta(days=INITIAL_LOOKBACK_DAYS)
+    return start.isoformat(), 0
+
+
+def set_watermark(cursor, name, watermark_date, watermark_id):
+    cursor.execute('''INSERT INTO scheduler_state (name, watermark_date, watermark_id, updated_at)
+                     VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                     ON CONFLICT(name) DO UPDATE SET
+                         watermark_date = excluded.watermark_date,
+                         watermark_id = excluded.watermark_id,
+                         updated_at = excluded.updated_at''',
+                   (name, watermark_date, watermark_id))
+
+
+def send_reminders(cursor, kind, crops):
+    """Notify for (id, farmer_id, crop_name, harvest_date, status) rows not yet reminded; returns those sent"""
+    title, message, notification_type = REMINDER_KINDS[kind][2]
+    if crops:
+        placeholders = ','.join('?' * len(crops))
+        cursor.execute(f'''SELECT crop_id FROM harvest_reminders
+                          WHERE kind = ? AND crop_id IN ({placeholders})''',
+                       [kind] + [crop[0] for crop in crops])
+        already_sent = {row[0] for row in cursor.fetchall()}
+        crops = [crop for crop in crops if crop[0] not in already_sent]
+
+    cursor.executemany('INSERT INTO harvest_reminders (crop_id, kind) VALUES (?, ?)',
+                       [(crop[0], kind) for crop in crops])
+    cursor.executemany('''INSERT INTO notifications (user_id, title, message, type, action_url)
+                         VALUES (?, ?, ?, ?, ?)''',
+                       [(farmer_id, title,
+                         message.format(crop=crop_name.title(), date=harvest_date),
+                         notification_type, f'/crop/{crop_id}')
+                        for crop_id, farmer_id, crop_name, harvest_date, _ in crops])
+    return crops
+
+
+def process_batch(conn, kind, today):
+    """
+    Deliver one batch of due reminders of one kind in a single transaction
+
+    Returns the number of crops examined (0 when the kind is caught up).
+    """
+    offset, statuses, _ = REMINDER_KINDS[kind]
+    # A reminder firing `offset` days after harvest is due once harvest_date <= today - offset
+    cutoff = (today - timedelta(days=offset)).isoformat()
+
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        wm_date, wm_id = get_watermark(cursor, kind, cutoff)
+        cursor.execute('''SELECT id, farmer_id, crop_name, expected_harvest_date, status
+                         FROM crops
+                         WHERE (expected_harvest_date, id) > (?, ?)
+                         AND expected_harvest_date <= ?
+                         ORDER BY expected_harvest_date, id
+                         LIMIT ?''',
+                       (wm_date, wm_id, cutoff, BATCH_SIZE))
+        crops = cursor.fetchall()
+        if not crops:
+            cursor.execute('ROLLBACK')
+            return 0
+
+        due = send_reminders(cursor, kind, [crop for crop in crops if crop[4] in statuses])
+
+        last_date, last_id = crops[-1][3], crops[-1][0]
+        set_watermark(cursor, f'harvest_{kind}', last_date, last_id)
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+
+    print(f"  {kind}: examined {len(crops)}, notified {len(due)} (watermark {last_date} #{last_id})")
+    return len(crops)
+
+
+def process_new_crops(conn, today):
+    """
+    Send one batch of crops added since the last pass the reminders their
+    kinds' watermarks have already passed, in a single transaction
+
+    Returns the number of crops examined (0 when caught up). The first pass
+    only records the newest id: the date walk's initial look-back covers the
+    crops that existed before.
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT watermark_id FROM scheduler_state WHERE name = ?', (NEW_CROPS_STATE,))
+        row = cursor.fetchone()
+        if row is None:
+            newest = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM crops').fetchone()[0]
+            set_watermark(cursor, NEW_CROPS_STATE, today.isoformat(), newest)
+            cursor.execute('COMMIT')
+            return 0
+        cursor.execute('''SELECT id, farmer_id, crop_name, expected_harvest_date, status
+                         FROM crops WHERE id > ? ORDER BY id LIMIT ?''', (row[0], BATCH_SIZE))
+        crops = cursor.fetchall()
+        if not crops:
+            cursor.execute('ROLLBACK')
+            return 0
+
+        sent = 0
+        for kind, (offset, statuses, _) in REMINDER_KINDS.items():
+            cutoff = today - timedelta(days=offset)
+            wm_date, wm_id = get_watermark(cursor, kind, cutoff.isoformat())
+            oldest = (cutoff - timedelta(days=LATE_ENTRY_DAYS[kind])).isoformat()
+            # Crops still ahead of the watermark are left to the date walk
+            late = [crop for crop in crops
+                    if crop[3] and crop[4] in statuses and (crop[3], crop[0]) <= (wm_date, wm_id)
+                    and oldest < crop[3] <= cutoff.isoformat()]
+            sent += len(send_reminders(cursor, kind, late))
+
+        set_watermark(cursor, NEW_CROPS_STATE, today.isoformat(), crops[-1][0])
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+
+    print(f"  new crops: examined {len(crops)}, notified {sent} (watermark #{crops[-1][0]})")
+    return len(crops)
+
+
+def run_once(conn, today=None):
+    """Drain every reminder kind up to today, then the late-entered crops; returns crops examined"""
+    today = today or date.today()
+    examined = 0
+    passes = [(process_batch, (conn, kind, today)) for kind in REMINDER_KINDS]
+    passes.append((process_new_crops, (conn, today)))
+    for process, args in passes:
+        while True:
+            count = process(*args)
+            examined += count
+            if count < BATCH_SIZE:
+                break
+    return examined
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Harvest reminder scheduler')
+    parser.add_argument('--once', action='store_true', help='run a single pass and exit')
+    parser.add_argument('--interval', type=int, default=60, help='seconds between passes')
+    args = parser.parse_args()
+
+    from app import storage
+
+    # One pass per SQLite file (each shard when sharded), each with its own watermarks
+    conns = {}
+    print("🌾 Harvest reminder scheduler started")
+    try:
+        while True:
+            start = time.perf_counter()
+            examined = 0
+            for path in storage.sqlite_paths():
+                if path not in conns:
+                    # Autocommit mode: process_batch manages its own transactions
+                    conns[path] = sqlite3.connect(path, isolation_level=None)
+                    init_scheduler(conns[path].cursor())
+                examined += run_once(conns[path])
+            print(f"✓ Pass complete: {examined} crops examined in {len(conns)} database(s) "
+                  f"in {time.perf_counter() - start:.2f}s")
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\nScheduler stopped.")
+    finally:
+        for conn in conns.values():
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
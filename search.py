@@ -0,0 +1,198 @@
+"""
+Full-text Search for Surplus-to-Sustain
+Keeps SQLite FTS5 indexes over buyers, crops and notifications in sync
+with triggers and answers ranked, paginated prefix queries
+"""
+
+import re
+import sqlite3
+import time
+
+# FTS5 index definitions: virtual table -> (content table, indexed columns)
+FTS_TABLES = {
+    'buyers_fts': ('buyers', ['name', 'city', 'buyer_type', 'specialty_crops']),
+    'crops_fts': ('crops', ['crop_name', 'variety', 'notes']),
+    'notifications_fts': ('notifications', ['title', 'message']),
+}
+
+SEARCH_SCOPES = ('buyers', 'crops', 'notifications')
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+
+def init_search(cursor, fts_tables=None):
+    """Create FTS5 tables and sync triggers, rebuilding any new index"""
+    for fts_table in fts_tables or FTS_TABLES:
+        content_table, columns = FTS_TABLES[fts_table]
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (fts_table,))
+        is_new = cursor.fetchone() is None
+
+        column_list = ', '.join(columns)
+        new_values = ', '.join(f'new.{col}' for col in columns)
+        old_values = ', '.join(f'old.{col}' for col in columns)
+
+        # External-content table: the index stores tokens only, rows stay in the base table.
+        # prefix='2 3' keeps short prefix queries (e.g. "tom*") off the full-scan path.
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                {column_list},
+                content='{content_table}',
+                content_rowid='id',
+                tokenize='unicode61',
+                prefix='2 3'
+            )
+        ''')
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {content_table} BEGIN
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {content_table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list})
+                VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {content_table} BEGIN
+                INSERT INTO {fts_table}({fts_table}, rowid, {column_list})
+                VALUES ('delete', old.id, {old_values});
+                INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        ''')
+
+        if is_new:
+            rebuild_index(cursor, fts_table)
+
+
+def rebuild_index(cursor, fts_table):
+    """Re-read every row of the content table into an FTS index"""
+    cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def build_match_query(text):
+    """
+    Turn free text into a safe FTS5 MATCH expression
+
+    Every word becomes a quoted prefix term, so "tom pune" matches
+    "Tomato" buyers in "Pune". Returns None if nothing searchable remains.
+    """
+    terms = re.findall(r'\w+', text.lower())
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms[:10])
+
+
+def search(conn, user_id, text, scope='buyers', page=1, per_page=DEFAULT_PER_PAGE):
+    """
+    Ranked, paginated search in one scope
+
+    Crops and notifications are limited to the given user's rows.
+    Returns (rows, has_more).
+    """
+    match = build_match_query(text)
+    if match is None or scope not in SEARCH_SCOPES:
+        return [], False
+
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    offset = (max(page, 1) - 1) * per_page
+    cursor = conn.cursor()
+
+    # Fetch one extra row to know whether a next page exists without a COUNT(*)
+    if scope == 'buyers':
+        cursor.execute('''SELECT b.*, bm25(buyers_fts, 10.0, 2.0, 2.0, 5.0) AS score
+                         FROM buyers_fts
+                         JOIN buyers b ON b.id = buyers_fts.rowid
+                         WHERE buyers_fts MATCH ? AND b.is_verified = 1
+                         ORDER BY score, b.rating DESC
+                         LIMIT ? OFFSET ?''',
+                       (match, per_page + 1, offset))
+    elif scope == 'crops':
+        cursor.execute('''SELECT c.*, bm25(crops_fts, 10.0, 5.0, 1.0) AS score
+                         FROM crops_fts
+                         JOIN crops c ON c.id = crops_fts.rowid
+                         WHERE crops_fts MATCH ? AND c.farmer_id = ?
+                         ORDER BY score, c.created_at DESC
+                         LIMIT ? OFFSET ?''',
+                       (match, user_id, per_page + 1, offset))
+    else:
+        cursor.execute('''SELECT n.*, bm25(notifications_fts, 5.0, 1.0) AS score
+                         FROM notifications_fts
+                         JOIN notifications n ON n.id = notifications_fts.rowid
+                         WHERE notifications_fts MATCH ? AND n.user_id = ?
+                         ORDER BY score, n.created_at DESC
+                         LIMIT ? OFFSET ?''',
+                       (match, user_id, per_page + 1, offset))
+
+    rows = cursor.fetchall()
+    return rows[:per_page], len(rows) > per_page
+
+
+def search_like(conn, text, per_page=DEFAULT_PER_PAGE):
+    """LIKE-based buyer search, kept only as the benchmark baseline"""
+    pattern = f'%{text}%'
+    cursor = conn.cursor()
+    cursor.execute('''SELECT * FROM buyers
+                     WHERE (name LIKE ? OR city LIKE ? OR buyer_type LIKE ? OR specialty_crops LIKE ?)
+                     AND is_verified = 1
+                     ORDER BY rating DESC
+                     LIMIT ?''',
+                   (pattern, pattern, pattern, pattern, per_page))
+    return cursor.fetchall()
+
+
+def benchmark(n_rows=1_000_000, queries=('tomato', 'pune', 'storage', 'chi', 'green valley', '424242')):
+    """Compare FTS5 and LIKE latency on an in-memory buyers table"""
+    import random
+
+    random.seed(42)
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute('''CREATE TABLE buyers (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, buyer_type TEXT,
+                        city TEXT, specialty_crops TEXT, rating REAL, is_verified INTEGER)''')
+
+    words = ['green', 'valley', 'fresh', 'metro', 'organic', 'premium', 'city', 'farm', 'agro', 'hub']
+    types = ['Processor', 'Storage', 'NGO', 'Retailer', 'Compost', 'Animal Feed']
+    cities = ['Nashik', 'Pune', 'Mumbai', 'Nagpur', 'Aurangabad', 'Kolhapur', 'Solapur']
+    crops = ['tomato', 'onion', 'potato', 'cabbage', 'chili', 'wheat', 'rice', 'brinjal']
+
+    print(f"Loading {n_rows:,} buyers...")
+    rows = ((f'{random.choice(words).title()} {random.choice(words).title()} {i}',
+             random.choice(types), random.choice(cities),
+             '["' + '", "'.join(random.sample(crops, 3)) + '"]',
+             round(random.uniform(3, 5), 1), 1) for i in range(n_rows))
+    cursor.executemany('''INSERT INTO buyers (name, buyer_type, city, specialty_crops, rating, is_verified)
+                         VALUES (?, ?, ?, ?, ?, ?)''', rows)
+
+    start = time.perf_counter()
+    init_search(cursor, ['buyers_fts'])
+    conn.commit()
+    print(f"✓ FTS index built in {time.perf_counter() - start:.1f}s")
+
+    print(f"\n{'query':<15}{'LIKE (ms)':>12}{'FTS5 (ms)':>12}")
+    print("-" * 39)
+    for query in queries:
+        start = time.perf_counter()
+        search_like(conn, query)
+        like_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        search(conn, None, query, scope='buyers')
+        fts_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{query:<15}{like_ms:>12.1f}{fts_ms:>12.1f}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    print("\n" + "="*60)
+    print(" SEARCH BENCHMARK: FTS5 vs LIKE ")
+    print("="*60)
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,571 @@
+"""
+Regional Sharding for Surplus-to-Sustain
+
+    STORAGE_BACKEND=sharded DATABASE=database.db SHARD_DIR=shards SHARD_BY=state
+
+    python sharding.py --split          # split DATABASE into shards (DATABASE itself is left as it was)
+    python sharding.py --status         # users and rows per shard
+    python sharding.py --benchmark      # write throughput and scatter-gather latency, 1 to 8 shards
+
+Every user's rows (profile, crops, transactions, notifications, waste flows,
+storage bookings) live in one shard file in SHARD_DIR, so writes for farmers
+in different shards never queue on the same SQLite lock. SHARD_BY=state
+gives each users.state its own shard, created on its first registration;
+SHARD_BY=hash spreads users over SHARD_COUNT shards by id instead.
+
+DATABASE becomes the directory. shard_directory maps each user id, username
+and email to a shard: new user ids are handed out there and usernames and
+emails stay unique across shards. buyers stays there too and is replicated
+to every shard as reference data. Only the listing columns are copied, so
+each shard's buyer ledger, price rollups and impact rollups count that
+shard's own sales and buyer rankings are regional.
+
+The router looks a user's shard up once and remembers it in the Flask
+session, and in a per-process map for calls made off the request thread.
+Assignments are sticky: a farmer who changes state keeps their shard until
+the next --split. Platform-wide reads (home page totals, platform and region
+impact, price charts, QR traces) scatter-gather on SHARD_WORKERS threads and
+merge the results.
+
+Each shard numbers new rows from its own range (shard number <<
+SHARD_ID_BITS), so crop, transaction and notification ids stay unique
+platform-wide. Each shard keeps its own archive next to it; leave
+ARCHIVE_DATABASE unset.
+
+Subsystems that open SQLite directly find the user's file through
+Storage.sqlite_path(): search, report jobs, the sync change log and the
+fragment cache's generation counters read the user's shard, and the web
+app keeps one SSE event broker per shard. The per-file jobs (scheduler,
+retention, rescore, ledger/impact/price repairs, backups) run once per
+file in Storage.sqlite_paths().
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import has_request_context, session
+
+from changelog import rebuild as rebuild_changelog
+from impact import rebuild as rebuild_impact
+from ledger import recompute as recompute_ledger
+from prices import rebuild as rebuild_prices
+from retention import ARCHIVED_TABLES, archive_path, attach_archive
+from storage import Storage, SQLiteStorage
+
+SHARD_DIR = os.environ.get('SHARD_DIR', 'shards')
+SHARD_BY = os.environ.get('SHARD_BY', 'state')
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 8))
+SHARD_WORKERS = int(os.environ.get('SHARD_WORKERS', 8))
+SHARD_ID_BITS = 32
+ROUTER_CACHE_SIZE = 100_000
+
+# Tables split by owner, and the column naming the owning user (users first: triggers update it)
+SHARDED_TABLES = {
+    'users': 'id',
+    'crops': 'farmer_id',
+    'transactions': 'farmer_id',
+    'notifications': 'user_id',
+    'waste_flows': 'farmer_id',
+    'storage_bookings': 'farmer_id',
+}
+
+# Buyer columns replicated from the directory; the ledger columns are each shard's own
+BUYER_LISTING = ('id', 'name', 'buyer_type', 'phone', 'email', 'address', 'city', 'state', 'pincode',
+                 'latitude', 'longitude', 'capacity_tons', 'price_per_kg', 'specialty_crops',
+                 'is_verified', 'created_at')
+
+DIRECTORY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS shards (
+        number INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS shard_directory (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        email TEXT UNIQUE,
+        shard TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_shard_directory_shard ON shard_directory(shard);
+'''
+
+
+def shard_key(user_id, state):
+    """The shard a new user belongs in"""
+    if SHARD_BY == 'hash':
+        return f'hash{user_id % SHARD_COUNT:02d}'
+    return re.sub(r'[^a-z0-9]+', '_', (state or '').strip().lower()).strip('_') or 'unassigned'
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+class ShardedStorage(Storage):
+    """
+    Per-user queries routed to the user's shard, platform-wide ones
+    gathered from every shard; the generic helpers (fetchone, execute, ...)
+    run on the directory
+    """
+
+    name = 'sharded'
+    sqlite_backed = True
+
+    def __init__(self, db_path, init_shard, shard_dir=SHARD_DIR, workers=SHARD_WORKERS):
+        self.directory = SQLiteStorage(db_path)
+        self.init_shard = init_shard
+        self.shard_dir = shard_dir
+        self.shards = {}
+        self.routes = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard')
+
+    def connection(self):
+        return self.directory.connection()
+
+    def _insert(self, cursor, query, params):
+        return self.directory._insert(cursor, query, params)
+
+    def init_schema(self):
+        """Directory tables, then bring every existing shard up to the current schema"""
+        with self.directory.connection() as conn:
+            conn.executescript(DIRECTORY_SCHEMA)
+        for name in self.names():
+            self.init_shard(self.path(name))
+
+    def close(self):
+        self.pool.shutdown()
+        self.directory.close()
+        for shard in self.shards.values():
+            shard.close()
+
+    # Shards
+
+    def path(self, name):
+        return os.path.join(self.shard_dir, f'{name}.db')
+
+    def names(self):
+        """Every shard, in creation order"""
+        try:
+            return [row['name'] for row in self.directory.fetchall('SELECT name FROM shards ORDER BY number')]
+        except sqlite3.OperationalError:
+            return []
+
+    def shard(self, name):
+        """The shard's storage, creating the shard on first use"""
+        shard = self.shards.get(name)
+        if shard is not None:
+            return shard
+        with self.lock:
+            if name not in self.shards:
+                if not os.path.exists(self.path(name)):
+                    self._create(name)
+                self.shards[name] = SQLiteStorage(self.path(name))
+            return self.shards[name]
+
+    def _create(self, name):
+        """Schema, id range and buyers for a new shard file (caller holds the lock)"""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        with self.directory.connection() as conn:
+            conn.execute('INSERT OR IGNORE INTO shards (name) VALUES (?)', (name,))
+            number = conn.execute('SELECT number FROM shards WHERE name = ?', (name,)).fetchone()[0]
+        self.init_shard(self.path(name))
+        conn = sqlite3.connect(self.path(name))
+        try:
+            tables = [row[0] for row in conn.execute('''SELECT name FROM sqlite_master
+                                                        WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'
+                                                        AND name NOT IN ('users', 'buyers')''')]
+            conn.executemany('DELETE FROM sqlite_sequence WHERE name = ?', [(table,) for table in tables])
+            conn.executemany('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                             [(table, number << SHARD_ID_BITS) for table in tables])
+            conn.commit()
+        finally:
+            conn.close()
+        self.replicate_buyers([SQLiteStorage(self.path(name))])
+
+    def all_shards(self):
+        return [self.shard(name) for name in self.names()]
+
+    def gather(self, method, *args):
+        """Call a Storage method on every shard in parallel; results in shard order"""
+        return list(self.pool.map(lambda shard: getattr(shard, method)(*args), self.all_shards()))
+
+    # Routing
+
+    def shard_name(self, user_id):
+        """The user's shard from the session, else the directory (remembered); None if unknown"""
+        user_id = int(user_id)
+        own = has_request_context() and session.get('user_id') == user_id
+        if own and session.get('shard') in self.shards:
+            return session['shard']
+        name = self.routes.get(user_id)
+        if name is None:
+            row = self.directory.fetchone('SELECT shard FROM shard_directory WHERE user_id = ?', (user_id,))
+            if row is None:
+                return None
+            name = row['shard']
+            if len(self.routes) >= ROUTER_CACHE_SIZE:
+                self.routes.clear()
+            self.routes[user_id] = name
+        if own and session.get('shard') != name:
+            session['shard'] = name
+        return name
+
+    def for_user(self, user_id):
+        """The user's shard; users the directory doesn't know read from it (and find nothing)"""
+        name = self.shard_name(user_id)
+        return self.shard(name) if name else self.directory
+
+    def sqlite_path(self, user_id):
+        return self.for_user(user_id).db_path
+
+    def sqlite_paths(self):
+        """The shards; the directory's own user rows are the pre-split copy, which nothing reads"""
+        return [self.path(name) for name in self.names()]
+
+    def local(self):
+        """The signed-in user's shard for reference data, else the directory"""
+        if has_request_context() and session.get('user_id'):
+            return self.for_user(session['user_id'])
+        return self.directory
+
+    # Buyers (replicated reference data)
+
+    def replicate_buyers(self, shards=None):
+        """Copy the directory's buyer listings to shards (default all); returns the rows copied"""
+        rows = self.directory.fetchall(f"SELECT {', '.join(BUYER_LISTING)}, rating FROM buyers")
+        updates = ', '.join(f'{column} = excluded.{column}' for column in BUYER_LISTING[1:])
+        query = f'''INSERT INTO buyers ({', '.join(BUYER_LISTING)}, rating)
+                    VALUES ({', '.join('?' * (len(BUYER_LISTING) + 1))})
+                    ON CONFLICT(id) DO UPDATE SET {updates}'''
+        for shard in self.all_shards() if shards is None else shards:
+            with shard.connection() as conn:
+                conn.executemany(query, [tuple(row) for row in rows])
+        return len(rows)
+
+    def seed_buyers(self, buyers):
+        seeded = self.directory.seed_buyers(buyers)
+        if seeded:
+            self.replicate_buyers()
+        return seeded
+
+    def matching_buyers(self, crop_name, limit=8):
+        return self.local().matching_buyers(crop_name, limit)
+
+    def verified_buyers(self):
+        return self.local().verified_buyers()
+
+    # Users
+
+    def find_user_for_login(self, identifier):
+        lookups = ('email', 'username') if '@' in identifier else ('username', 'email')
+        for column in lookups:
+            row = self.directory.fetchone(f'SELECT user_id FROM shard_directory WHERE {column} = ?', (identifier,))
+            if row:
+                return self.for_user(row['user_id']).get_user(row['user_id'])
+        return None
+
+    def create_user(self, username, email, password, phone, full_name, city, state, last_login):
+        """The directory hands out the id and enforces uniqueness; the profile goes to the user's shard"""
+        with self.directory.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('INSERT INTO shard_directory (username, email, shard) VALUES (?, ?, ?)',
+                           (username, email, ''))
+            user_id = cursor.lastrowid
+            name = shard_key(user_id, state)
+            cursor.execute('UPDATE shard_directory SET shard = ? WHERE user_id = ?', (name, user_id))
+        try:
+            self.shard(name).insert('''INSERT INTO users
+                                       (id, username, email, password, phone, full_name, city, state, last_login)
+                                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                    (user_id, username, email, password, phone, full_name, city, state,
+                                     last_login))
+        except BaseException:
+            self.directory.execute('DELETE FROM shard_directory WHERE user_id = ?', (user_id,))
+            raise
+        return user_id
+
+    def update_profile(self, user_id, full_name, email, phone, address, city, state, pincode):
+        """The email is claimed in the directory first, so a taken one fails before the shard changes"""
+        previous = self.directory.fetchone('SELECT email FROM shard_directory WHERE user_id = ?', (user_id,))
+        self.directory.execute('UPDATE shard_directory SET email = ? WHERE user_id = ?', (email, user_id))
+        try:
+            self.for_user(user_id).update_profile(user_id, full_name, email, phone, address, city, state, pincode)
+        except BaseException:
+            if previous:
+                self.directory.execute('UPDATE shard_directory SET email = ? WHERE user_id = ?',
+                                       (previous['email'], user_id))
+            raise
+
+    # Scatter-gather
+
+    def platform_totals(self):
+        totals = self.gather('platform_totals')
+        surplus = [row['surplus'] for row in totals if row['surplus'] is not None]
+        return {
+            'farmers': sum(row['farmers'] for row in totals),
+            'crops': sum(row['crops'] for row in totals),
+            'surplus': sum(surplus) if surplus else None,
+            'transactions': sum(row['transactions'] for row in totals),
+        }
+
+    def rescore_progress(self, model_version):
+        return self.directory.rescore_progress(model_version)
+
+    def price_rollups(self, crop, resolution, start, end, city=None):
+        """Every shard's rows, ordered by bucket and city for prices.merge_buckets"""
+        rows = [row for rows in self.gather('price_rollups', crop, resolution, start, end, city) for row in rows]
+        return sorted(rows, key=lambda row: (row['bucket'], row['city']))
+
+    def trace_waste_flow(self, qr_code):
+        return next((row for row in self.gather('trace_waste_flow', qr_code) if row), None)
+
+    @staticmethod
+    def _merge_rollups(rows):
+        """Sum impact rollup rows per (scope, key); the latest updated_at wins"""
+        merged = {}
+        for row in rows:
+            key = (row['scope'], row['scope_key'])
+            if key not in merged:
+                merged[key] = dict(row)
+                continue
+            total = merged[key]
+            for column in ('flows', 'quantity_tons', 'food_saved', 'co2_saved', 'compost_generated'):
+                total[column] += row[column]
+            total['updated_at'] = max(filter(None, (total['updated_at'], row['updated_at'])), default=None)
+        return list(merged.values())
+
+    def impact_rollup(self, scope, key):
+        if scope == 'farmer':
+            return self.for_user(key).impact_rollup(scope, key)
+        merged = self._merge_rollups(row for row in self.gather('impact_rollup', scope, key) if row)
+        return merged[0] if merged else None
+
+    def impact_regions(self, limit=10):
+        rows = self.gather('fetchall', "SELECT * FROM impact_rollups WHERE scope = 'region' AND flows > 0")
+        merged = self._merge_rollups(row for shard_rows in rows for row in shard_rows)
+        return sorted(merged, key=lambda row: -row['co2_saved'])[:limit]
+
+
+def _routed(name, position):
+    """A Storage method sent to the shard of the user in argument `position`"""
+    def method(self, *args, **kwargs):
+        return getattr(self.for_user(args[position]), name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(Storage, name).__doc__
+    return method
+
+
+# Per-user methods by the position of their user id argument
+for _name in ('get_user', 'record_login', 'unread_count', 'revision_validators', 'add_crop', 'recent_crops',
+              'list_crops', 'crop_totals', 'crop_summary', 'recent_transactions', 'transaction_history',
+              'record_transaction', 'record_waste_flows', 'list_waste_flows', 'label_waste_flows',
+              'create_notification', 'unread_notifications', 'list_notifications', 'mark_all_notifications_read'):
+    setattr(ShardedStorage, _name, _routed(_name, 0))
+for _name in ('get_crop', 'set_crop_status', 'delete_crop', 'crop_transactions', 'set_transaction_status',
+              'rate_transaction', 'set_waste_flow_status', 'mark_notification_read'):
+    setattr(ShardedStorage, _name, _routed(_name, 1))
+
+
+# ==================== MIGRATION ====================
+
+def _copy(conn, source, target, table, where, params):
+    """INSERT ... SELECT the columns both sides have; returns the rows copied"""
+    columns = [name for name in _columns(conn, target, table) if name in set(_columns(conn, source, table))]
+    if not columns:
+        return 0
+    column_list = ', '.join(columns)
+    return conn.execute(f'''INSERT OR IGNORE INTO {target}.{table} ({column_list})
+                            SELECT {column_list} FROM {source}.{table} WHERE {where}''', params).rowcount
+
+
+def split(storage, db_path, log=print):
+    """
+    Copy every user's rows from db_path into their shard, then rebuild each
+    shard's ledgers and rollups; returns {table: (source rows, copied rows)}
+    """
+    if storage.names():
+        raise RuntimeError(f'{db_path} is already split; remove its shards table and {storage.shard_dir} to redo it')
+    storage.init_schema()
+    users = storage.directory.fetchall('SELECT id, username, email, state FROM users ORDER BY id')
+    with storage.directory.connection() as conn:
+        conn.executemany('INSERT INTO shard_directory (user_id, username, email, shard) VALUES (?, ?, ?, ?)',
+                         [(user['id'], user['username'], user['email'], shard_key(user['id'], user['state']))
+                          for user in users])
+    names = sorted({shard_key(user['id'], user['state']) for user in users})
+    log(f"Splitting {len(users):,} users into {len(names)} shards under {storage.shard_dir}/")
+
+    source_archive = archive_path(db_path)
+    copied = {}
+    for name in names:
+        started = time.perf_counter()
+        path = storage.shard(name).db_path
+        conn = attach_archive(sqlite3.connect(path), path)
+        try:
+            conn.execute('ATTACH DATABASE ? AS source', (db_path,))
+            archived = os.path.exists(source_archive)
+            if archived:
+                conn.execute('ATTACH DATABASE ? AS source_archive', (source_archive,))
+            conn.execute('BEGIN')
+            owners = 'SELECT user_id FROM source.shard_directory WHERE shard = ?'
+            rows = 0
+            for table, owner in SHARDED_TABLES.items():
+                count = _copy(conn, 'source', 'main', table, f'{owner} IN ({owners})', (name,))
+                if archived and table in ARCHIVED_TABLES:
+                    count += _copy(conn, 'source_archive', 'archive', table, f'{owner} IN ({owners})', (name,))
+                copied[table] = copied.get(table, 0) + count
+                rows += count
+            # The scheduler's watermarks and the reminders already sent for these crops,
+            # so the shard's scheduler carries on where the unsplit database left off
+            conn.execute('INSERT OR REPLACE INTO main.scheduler_state SELECT * FROM source.scheduler_state')
+            conn.execute('''INSERT OR IGNORE INTO main.harvest_reminders SELECT * FROM source.harvest_reminders
+                            WHERE crop_id IN (SELECT id FROM main.crops)''')
+            # The copy fired the shard's triggers; rebuild from its own rows instead
+            conn.execute('DELETE FROM events')
+            recompute_ledger(conn)
+            rebuild_impact(conn)
+            rebuild_prices(conn)
+            rebuild_changelog(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        log(f"  {name:<24}{rows:>10,} rows  {time.perf_counter() - started:6.1f}s")
+
+    # Rows of users in the directory, live and archived, against what reached the shards
+    conn = attach_archive(sqlite3.connect(db_path), db_path)
+    try:
+        totals = {}
+        for table, owner in SHARDED_TABLES.items():
+            source = f'{table}_history' if table in ARCHIVED_TABLES else table
+            count = conn.execute(f'''SELECT COUNT(*) FROM {source}
+                                     WHERE {owner} IN (SELECT user_id FROM shard_directory)''').fetchone()[0]
+            totals[table] = (count, copied.get(table, 0))
+    finally:
+        conn.close()
+    return totals
+
+
+def status(storage):
+    print(f"\n  {'shard':<24}{'users':>8}{'crops':>10}{'transactions':>14}{'size MB':>10}")
+    counts = storage.gather('fetchone', '''SELECT (SELECT COUNT(*) FROM users) AS users,
+                                                  (SELECT COUNT(*) FROM crops) AS crops,
+                                                  (SELECT COUNT(*) FROM transactions) AS transactions''')
+    for name, row in zip(storage.names(), counts):
+        size = os.path.getsize(storage.path(name)) / 1e6
+        print(f"  {name:<24}{row['users']:>8,}{row['crops']:>10,}{row['transactions']:>14,}{size:>10.1f}")
+
+
+# ==================== BENCHMARK ====================
+
+def _writer(directory, shard_dir, farmer, start, seconds):
+    """One benchmark worker process: writes for one farmer from `start` for `seconds`"""
+    storage = ShardedStorage(directory, None, shard_dir) if shard_dir else SQLiteStorage(directory)
+    samples = []
+    time.sleep(max(0.0, start - time.time()))
+    while time.time() < start + seconds:
+        started = time.perf_counter()
+        if len(samples) % 4 == 3:
+            storage.create_notification(farmer, 'Bench', 'write')
+        else:
+            storage.add_crop(farmer, crop_name='tomato', area=1.5, planting_date='2024-06-01',
+                             predicted_yield=8.0, predicted_surplus=2.0, status='planned')
+        samples.append(time.perf_counter() - started)
+    storage.close()
+    return samples
+
+
+def benchmark(shard_counts=(0, 1, 2, 4, 8), processes=8, seconds=3.0):
+    """
+    Crop and notification writes from `processes` worker processes (as
+    under gunicorn), one farmer each, spread over each number of shards
+    (0: the unsharded SQLite backend); then the scatter-gather
+    platform_totals latency
+    """
+    import multiprocessing
+
+    from app import init_db, SAMPLE_BUYERS
+
+    print(f"\n🌱 {processes} writer processes on {os.cpu_count()} CPUs, {seconds:.0f}s per run, "
+          f"3 crop inserts : 1 notification")
+    print(f"\n  {'shards':>6}{'writes/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'totals p50 ms':>16}")
+    baseline = None
+    for count in shard_counts:
+        with tempfile.TemporaryDirectory() as scratch:
+            directory = os.path.join(scratch, 'directory.db')
+            shard_dir = os.path.join(scratch, 'shards') if count else None
+            init_db(directory)
+            if count:
+                storage = ShardedStorage(directory, init_db, shard_dir)
+                storage.init_schema()
+            else:
+                storage = SQLiteStorage(directory)
+            storage.seed_buyers(SAMPLE_BUYERS)
+            farmers = [storage.create_user(f'farmer{i}', f'farmer{i}@example.com', 'x', '', f'Farmer {i}',
+                                           'City', f'State {i % max(count, 1)}', None)
+                       for i in range(processes)]
+            assert not count or len(storage.names()) == count
+            storage.close()
+
+            start = time.time() + 1.0
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                latencies = pool.starmap(_writer, [(directory, shard_dir, farmer, start, seconds)
+                                                   for farmer in farmers])
+            samples = sorted(sample for per_process in latencies for sample in per_process)
+            rate = len(samples) / seconds
+            baseline = baseline or rate
+
+            storage = ShardedStorage(directory, init_db, shard_dir) if count else SQLiteStorage(directory)
+            gathered = []
+            for _ in range(50):
+                started = time.perf_counter()
+                totals = storage.platform_totals()
+                gathered.append(time.perf_counter() - started)
+            assert totals['crops'] == sum(len(s) - len(s) // 4 for s in latencies), 'a crop write went missing'
+            print(f"  {count or 'none':>6}{rate:>12,.0f}{statistics.median(samples) * 1000:>10.2f}"
+                  f"{samples[int(len(samples) * 0.99)] * 1000:>10.2f}{statistics.median(gathered) * 1000:>16.2f}"
+                  f"   ({rate / baseline:.1f}x)")
+            storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split the database into shards and inspect them')
+    parser.add_argument('--split', action='store_true', help='copy DATABASE into per-shard files')
+    parser.add_argument('--status', action='store_true', help='users and rows per shard')
+    parser.add_argument('--benchmark', action='store_true', help='write throughput as shards are added')
+    parser.add_argument('--processes', type=int, default=8, help='benchmark writer processes (default 8)')
+    parser.add_argument('--seconds', type=float, default=3.0, help='benchmark run length (default 3)')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(processes=args.processes, seconds=args.seconds)
+        return
+    if not (args.split or args.status):
+        parser.print_help()
+        return
+
+    from app import DATABASE, init_db
+    storage = ShardedStorage(DATABASE, init_db)
+    try:
+        if args.split:
+            started = time.perf_counter()
+            totals = split(storage, DATABASE)
+            print(f"\n  {'table':<20}{'source':>12}{'in shards':>12}")
+            for table, (source, copied) in totals.items():
+                print(f"  {table:<20}{source:>12,}{copied:>12,}  {'✓' if source == copied else '✗'}")
+            print(f"\n✓ Split in {time.perf_counter() - started:.1f}s. "
+                  f"Start the app with STORAGE_BACKEND=sharded to use the shards.")
+        if args.status:
+            status(storage)
+    finally:
+        storage.close()
+
+
+if __name__ == '__main__':
+    main()
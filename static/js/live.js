@@ -0,0 +1,48 @@
+// Live notifications and crop updates over Server-Sent Events
+(function () {
+    if (!window.EventSource) { return; }
+    var source = new EventSource('/events');
+
+    function setBadges(count) {
+        document.querySelectorAll('[data-unread-badge]').forEach(function (badge) {
+            badge.textContent = count;
+            badge.classList.toggle('d-none', !count);
+        });
+    }
+
+    function showAlert(type, title, message, url) {
+        var container = document.querySelector('main.container');
+        if (!container) { return; }
+        var alert = document.createElement('div');
+        alert.className = 'alert alert-' + type + ' alert-dismissible fade show';
+        alert.setAttribute('role', 'alert');
+        var heading = document.createElement('strong');
+        heading.textContent = title + ' ';
+        alert.appendChild(heading);
+        alert.appendChild(document.createTextNode(message + ' '));
+        if (url) {
+            var link = document.createElement('a');
+            link.href = url;
+            link.className = 'alert-link';
+            link.textContent = 'View';
+            alert.appendChild(link);
+        }
+        var close = document.createElement('button');
+        close.type = 'button';
+        close.className = 'btn-close';
+        close.setAttribute('data-bs-dismiss', 'alert');
+        alert.appendChild(close);
+        container.insertBefore(alert, container.firstChild);
+    }
+
+    source.addEventListener('notification', function (e) {
+        var n = JSON.parse(e.data);
+        setBadges(n.unread_count);
+        showAlert(n.type === 'info' ? 'info' : n.type, n.title, n.message, n.action_url);
+    });
+
+    source.addEventListener('crop', function (e) {
+        var crop = JSON.parse(e.data);
+        showAlert('info', 'Crop updated:', crop.crop_name + ' is now ' + crop.status + '.', '/crop/' + crop.id);
+    });
+})();
@@ -0,0 +1,35 @@
+// Request a PDF report, poll until it is rendered, then download it
+document.querySelectorAll('[data-report-url]').forEach(function (button) {
+    button.addEventListener('click', function () {
+        var label = button.innerHTML;
+        button.disabled = true;
+        button.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Preparing...';
+
+        function reset(message) {
+            button.disabled = false;
+            button.innerHTML = label;
+            if (message) { alert(message); }
+        }
+
+        function poll(job) {
+            if (job.status === 'done') {
+                window.location.href = job.download_url;
+                reset();
+            } else if (job.status === 'failed') {
+                reset('Report could not be generated. Please try again.');
+            } else {
+                setTimeout(function () {
+                    fetch(job.status_url)
+                        .then(function (r) { return r.json(); })
+                        .then(poll)
+                        .catch(function () { reset('Report could not be generated. Please try again.'); });
+                }, 1500);
+            }
+        }
+
+        fetch(button.dataset.reportUrl, { method: 'POST' })
+            .then(function (r) { return r.json(); })
+            .then(function (job) { job.error ? reset(job.error) : poll(job); })
+            .catch(function () { reset('Report could not be generated. Please try again.'); });
+    });
+});
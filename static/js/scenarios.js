@@ -0,0 +1,61 @@
+// Load a ranked what-if table for the crop and render it in place
+(function () {
+    var target = document.getElementById('scenarios');
+    if (!target) { return; }
+
+    function cell(text, className) {
+        var td = document.createElement('td');
+        td.textContent = text;
+        if (className) { td.className = className; }
+        return td;
+    }
+
+    function change(value) {
+        if (value === 0) { return cell('–', 'text-muted'); }
+        return cell((value > 0 ? '+' : '') + value.toFixed(2), value > 0 ? 'text-danger' : 'text-success');
+    }
+
+    function render(data) {
+        var base = data.baseline;
+        var table = document.createElement('table');
+        table.className = 'table table-sm mb-2';
+        table.innerHTML = '<thead><tr><th>Soil</th><th>Season</th><th>Irrigation</th><th>Area (ha)</th>' +
+            '<th>Weather</th><th>Yield (t)</th><th>Surplus (t)</th><th>Δ Surplus</th></tr></thead>';
+        var body = document.createElement('tbody');
+        data.results.forEach(function (row) {
+            var tr = document.createElement('tr');
+            [row.soil_type, row.season, row.irrigation_type, row.area, row.weather,
+             row.predicted_yield.toFixed(2), row.predicted_surplus.toFixed(2)].forEach(function (value) {
+                tr.appendChild(cell(value));
+            });
+            tr.appendChild(change(row.surplus_change));
+            body.appendChild(tr);
+        });
+        table.appendChild(body);
+
+        var note = document.createElement('p');
+        note.className = 'small text-muted mb-0';
+        note.textContent = 'Top ' + data.results.length + ' of ' + data.scenarios + ' scenarios. Current plan (' +
+            base.soil_type + ', ' + base.season + ', ' + base.irrigation_type + ', ' + base.area + ' ha): ' +
+            base.predicted_yield.toFixed(2) + ' t yield, ' + base.predicted_surplus.toFixed(2) + ' t surplus.';
+
+        target.innerHTML = '<div class="table-responsive"></div>';
+        target.firstChild.appendChild(table);
+        target.appendChild(note);
+    }
+
+    document.querySelectorAll('[data-scenarios-url]').forEach(function (button) {
+        button.addEventListener('click', function () {
+            target.innerHTML = '<p class="text-muted mb-0"><i class="fas fa-spinner fa-spin"></i> Scoring scenarios...</p>';
+            fetch(button.dataset.scenariosUrl)
+                .then(function (r) { return r.json(); })
+                .then(function (data) {
+                    if (data.error) { throw new Error(data.error); }
+                    render(data);
+                })
+                .catch(function () {
+                    target.innerHTML = '<p class="text-danger mb-0">Scenarios could not be loaded. Please try again.</p>';
+                });
+        });
+    });
+})();
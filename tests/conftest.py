@@ -0,0 +1,91 @@
+"""
+Shared fixtures for the test suite
+
+    python -m pytest -q
+    TEST_DATABASE_URL=postgresql://localhost/s2s_test python -m pytest -q   # also on PostgreSQL
+
+The app reads its configuration from the environment when it is imported,
+so a scratch DATABASE and report and backup directories are set here before
+any test imports it. The PostgreSQL cases are skipped unless
+TEST_DATABASE_URL names a scratch database; tests there create their own
+users and never clean up, so don't point it at real data.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from uuid import uuid4
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRATCH = tempfile.mkdtemp(prefix='s2s_tests_')
+os.environ.update({
+    'STORAGE_BACKEND': 'sqlite',
+    'DATABASE': os.path.join(SCRATCH, 'app.db'),
+    'REPORT_DIR': os.path.join(SCRATCH, 'reports'),
+    'BACKUP_DIR': os.path.join(SCRATCH, 'snapshots'),
+})
+os.environ.pop('ARCHIVE_DATABASE', None)
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', '')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """A fresh SQLite file with the app's full schema (app.init_db) and the sample buyers"""
+    from app import init_db, SAMPLE_BUYERS
+    from storage import SQLiteStorage
+
+    path = str(tmp_path / 'test.db')
+    init_db(path)
+    storage = SQLiteStorage(path)
+    storage.seed_buyers(SAMPLE_BUYERS)
+    storage.close()
+    return path
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def storage(request, tmp_path):
+    """Each backend in turn, schema built and buyers seeded"""
+    from app import SAMPLE_BUYERS
+    from storage import SQLiteStorage, PostgresStorage
+
+    if request.param == 'postgres':
+        if not TEST_DATABASE_URL:
+            pytest.skip('set TEST_DATABASE_URL to a scratch PostgreSQL database')
+        backend = PostgresStorage(TEST_DATABASE_URL)
+        backend.init_schema()
+    else:
+        backend = SQLiteStorage(request.getfixturevalue('sqlite_db'))
+    backend.seed_buyers(SAMPLE_BUYERS)
+    yield backend
+    backend.close()
+
+
+@pytest.fixture(scope='session')
+def web_app():
+    """The Flask app on the scratch DATABASE, schema and buyers set up once"""
+    from app import app, init_db
+
+    init_db()
+    return app
+
+
+@pytest.fixture
+def farmer_client(web_app):
+    """A test client signed in as a new farmer; returns (client, user_id)"""
+    from app import storage
+
+    suffix = uuid4().hex[:8]
+    user_id = storage.create_user(f'farmer_{suffix}', f'farmer_{suffix}@example.com', 'x', '', 'Test Farmer',
+                                  'Pune', 'Maharashtra', None)
+    client = web_app.test_client()
+    with client.session_transaction() as sess:
+        sess.update(user_id=user_id, username=f'farmer_{suffix}', full_name='Test Farmer', user_type='farmer')
+    return client, user_id
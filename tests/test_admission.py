@@ -0,0 +1,67 @@
+"""Admission control: 429 from the rate limits, 503 from the slot pools"""
+
+import pytest
+from flask import Flask, Response
+
+import admission
+
+
+@pytest.fixture(params=['in-process', 'shared'])
+def limited(request, tmp_path, monkeypatch):
+    """A small app behind an Admission: api burst of 3, an export pool of 2 with 1 reserved"""
+    monkeypatch.setitem(admission.RATE_LIMITS, 'api', (60.0, 3))
+    monkeypatch.setitem(admission.SLOT_LIMITS, 'export', 2)
+    shared = str(tmp_path / 'admission.db') if request.param == 'shared' else ''
+    gate = admission.Admission(shared_path=shared, enabled=True)
+
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.before_request(gate.check_request)
+
+    @app.route('/api/ping')
+    @app.route('/page')
+    def ping():
+        return 'ok'
+
+    @app.route('/export/rows')
+    @gate.slot('export')
+    def export_rows():
+        return Response(iter(['a\n', 'b\n']), mimetype='text/plain')
+
+    return app.test_client(), gate
+
+
+def test_api_bucket_empties_into_429(limited):
+    client, gate = limited
+    assert [client.get('/api/ping').status_code for _ in range(3)] == [200, 200, 200]
+    refused = client.get('/api/ping')
+    assert refused.status_code == 429
+    assert int(refused.headers['Retry-After']) >= 1
+    assert refused.get_json()['retry_after'] == int(refused.headers['Retry-After'])
+
+    # Pages and the pages' own fetches draw on the interactive bucket
+    assert client.get('/page').status_code == 200
+    assert client.get('/api/ping', headers={'Sec-Fetch-Site': 'same-origin'}).status_code == 200
+    assert gate.report()['api_limited'] == 1
+
+
+def test_full_pool_sheds_503_and_keeps_a_slot_for_pages(limited):
+    client, gate = limited
+    same_origin = {'Sec-Fetch-Site': 'same-origin'}
+
+    # A streamed response holds its slot until the stream closes
+    partner = client.get('/export/rows', buffered=False)
+    assert partner.status_code == 200
+    shed = client.get('/export/rows')
+    assert shed.status_code == 503 and shed.headers['Retry-After'] == '1'
+    assert 'error' in shed.get_json()
+
+    # The reserved slot still admits an interactive request, then the pool is full for everyone
+    page = client.get('/export/rows', headers=same_origin, buffered=False)
+    assert page.status_code == 200
+    assert client.get('/export/rows', headers=same_origin).status_code == 503
+
+    partner.close()
+    page.close()
+    assert client.get('/export/rows').status_code == 200
+    assert gate.report()['pools']['export']['shed'] == 2
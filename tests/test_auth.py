@@ -0,0 +1,52 @@
+"""Password hashing: the bounded KDF pool, its timeout and rehashing on login"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import auth
+
+
+@pytest.fixture
+def one_slot(monkeypatch):
+    """A KDF pool of one thread and no queue, with a short timeout"""
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(auth, '_kdf_pool', pool)
+    monkeypatch.setattr(auth, '_kdf_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(auth, 'KDF_TIMEOUT', 0.1)
+    yield
+    pool.shutdown()
+
+
+def test_timed_out_hash_keeps_its_slot_until_it_finishes(one_slot):
+    release = threading.Event()
+    with pytest.raises(auth.LoginThrottled):
+        auth._run_kdf(release.wait, 5)
+    # Still hashing for the caller that gave up: no room for another
+    with pytest.raises(auth.LoginThrottled):
+        auth._run_kdf(lambda: 'hashed')
+
+    release.set()
+    auth._kdf_pool.submit(lambda: None).result()
+    assert auth._run_kdf(lambda: 'hashed') == 'hashed'
+
+
+def test_login_rehashes_a_password_made_with_an_old_cost(web_app, monkeypatch):
+    from app import storage
+
+    monkeypatch.setattr(auth, 'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:2000')
+    suffix = uuid4().hex[:8]
+    old_hash = generate_password_hash('s3cret-pass', 'pbkdf2:sha256:1000')
+    storage.create_user(f'rehash_{suffix}', f'rehash_{suffix}@example.com', old_hash, '', '', '', '', None)
+    assert auth.needs_rehash(old_hash)
+
+    client = web_app.test_client()
+    response = client.post('/login', data={'username': f'rehash_{suffix}', 'password': 's3cret-pass'})
+    assert response.status_code == 302
+
+    new_hash = storage.find_user_for_login(f'rehash_{suffix}')['password']
+    assert new_hash.startswith('pbkdf2:sha256:2000$') and not auth.needs_rehash(new_hash)
+    assert auth.verify_password(new_hash, 's3cret-pass')
@@ -0,0 +1,73 @@
+"""Online backup and restore, with the archive kept in step"""
+
+import os
+import sqlite3
+
+import backup
+from retention import archive_batch, archive_path, attach_archive
+from storage import SQLiteStorage
+
+
+def seed(db_path, n=10):
+    """n completed sales from 2019, all old enough to archive; returns their ids"""
+    storage = SQLiteStorage(db_path)
+    farmer = storage.create_user('seller', 'seller@example.com', 'x', '', '', 'Pune', 'Maharashtra', None)
+    crop = storage.add_crop(farmer, crop_name='garlic', area=1.0, planting_date='2019-01-01')
+    buyer = storage.verified_buyers()[0]['id']
+    sales = []
+    for i in range(n):
+        sale = storage.record_transaction(farmer, crop, buyer, 1, 10)
+        storage.execute('UPDATE transactions SET transaction_date = ? WHERE id = ?', (f'2019-03-{1 + i:02d}', sale))
+        storage.set_transaction_status(sale, farmer, 'completed')
+        sales.append(sale)
+    storage.close()
+    return sales
+
+
+def sale_ids(path, table='transactions'):
+    """Row ids in a database or a (compressed) snapshot"""
+    path, is_temp = backup._open_snapshot(path)
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute(f'SELECT id FROM {table}')}
+    finally:
+        conn.close()
+        if is_temp:
+            os.remove(path)
+
+
+def test_snapshot_restores_the_database_and_its_archive(sqlite_db, tmp_path):
+    sales = seed(sqlite_db)
+    conn = attach_archive(sqlite3.connect(sqlite_db, isolation_level=None), sqlite_db)
+    archive_batch(conn, 'transactions', 0, batch_size=4)
+    (main_snapshot, stats), (archive_snapshot, _) = backup.backup(sqlite_db, str(tmp_path))
+    assert stats['integrity'] == 'ok' and backup.verify(main_snapshot) == 'ok'
+
+    archive_batch(conn, 'transactions', 0)
+    conn.execute('DELETE FROM crops')
+    conn.close()
+    backup.restore(sqlite_db, main_snapshot)
+    backup.restore(archive_path(sqlite_db), archive_snapshot)
+
+    assert sale_ids(sqlite_db) == set(sales[4:])
+    assert sale_ids(archive_path(sqlite_db)) == set(sales[:4])
+    assert sale_ids(sqlite_db, 'crops')
+
+
+def test_rows_archived_mid_backup_are_in_exactly_one_snapshot(sqlite_db, tmp_path, monkeypatch):
+    sales = seed(sqlite_db)
+    conn = attach_archive(sqlite3.connect(sqlite_db, isolation_level=None), sqlite_db)
+    copy_pages = backup.copy_pages
+
+    def archive_after_main(source, target_path, pages, sleep, name='main'):
+        stats = copy_pages(source, target_path, pages, sleep, name)
+        if name == 'main':
+            assert len(archive_batch(conn, 'transactions', 0)) == len(sales)
+        return stats
+
+    monkeypatch.setattr(backup, 'copy_pages', archive_after_main)
+    (main_snapshot, _), (archive_snapshot, _) = backup.backup(sqlite_db, str(tmp_path))
+    conn.close()
+
+    assert sale_ids(main_snapshot) == set(sales)
+    assert sale_ids(archive_snapshot) == set()
@@ -0,0 +1,69 @@
+"""Feature drift: binned counts against the training profile, in bounded windows"""
+
+import numpy as np
+import pytest
+
+import drift
+
+CROPS = np.array(['tomato', 'onion', 'potato', 'rice'])
+
+
+def traffic(rng, n, shifted=False):
+    """Predictions drawn like the profile's rows; shifted traffic plants larger areas and unseen crops"""
+    area = rng.uniform(0.5, 5, n) * (4 if shifted else 1)
+    crops = CROPS[rng.integers(0, len(CROPS), n)]
+    if shifted:
+        crops = np.where(rng.random(n) < 0.3, 'mango', crops)
+    return (crops, area, np.full(n, 'loamy'), np.full(n, 'kharif'), np.full(n, 'drip'),
+            rng.normal(750, 100, n), rng.normal(27, 3, n), rng.uniform(40, 90, n), area * 3)
+
+
+@pytest.fixture
+def profile():
+    rng = np.random.default_rng(1)
+    crops, area, soil, season, irrigation, rainfall, temperature, humidity, yields = traffic(rng, 5000)
+    inputs = {'crop_name': crops, 'area': area, 'soil_type': soil, 'season': season,
+              'irrigation_type': irrigation, 'rainfall': rainfall, 'temperature': temperature,
+              'humidity': humidity}
+    return drift.build_profile(inputs, yields, 'test')
+
+
+def test_observe_and_observe_batch_count_alike(profile):
+    rows = traffic(np.random.default_rng(2), 300, shifted=True)
+    one, batch = drift.DriftMonitor(profile), drift.DriftMonitor(profile)
+    for row in zip(*rows):
+        one.observe(*row)
+    batch.observe_batch(*rows)
+    for name, column in one.windows[-1].counts.items():
+        assert column.tolist() == batch.windows[-1].counts[name].tolist(), name
+    assert one.report()['features'] == batch.report()['features']
+
+
+def test_shifted_traffic_is_flagged_and_matching_traffic_is_not(profile):
+    rng = np.random.default_rng(3)
+    monitor = drift.DriftMonitor(profile)
+    monitor.observe_batch(*traffic(rng, 2000))
+    features = monitor.report()['features']
+    assert {feature['status'] for feature in features.values()} == {'stable'}
+
+    monitor = drift.DriftMonitor(profile)
+    monitor.observe_batch(*traffic(rng, 2000, shifted=True))
+    features = monitor.report()['features']
+    assert features['area']['status'] == 'shifted' and features['area']['out_of_range'] > 0.5
+    assert features['crop_name']['oov_rate'] == pytest.approx(0.3, abs=0.05)
+    assert list(features['crop_name']['unknown']) == ['mango']
+    assert features['season']['status'] == 'stable'
+
+
+def test_only_the_last_windows_are_kept(profile, monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(drift.time, 'time', lambda: clock[0])
+    monitor = drift.DriftMonitor(profile, window_seconds=60, windows=3)
+    rng = np.random.default_rng(4)
+    for _ in range(5):
+        monitor.observe_batch(*traffic(rng, 50))
+        clock[0] += 60
+
+    report = monitor.report()
+    assert len(monitor.windows) == 3 and report['count'] == 150
+    assert [window['count'] for window in report['windows']] == [50, 50, 50]
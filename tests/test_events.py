@@ -0,0 +1,51 @@
+"""Live events: the trigger-fed log, replay from Last-Event-ID and pruning"""
+
+import json
+import sqlite3
+
+import events
+from storage import SQLiteStorage
+
+
+def notify(conn, user_id, title):
+    conn.execute("INSERT INTO notifications (user_id, title, message, type) VALUES (?, ?, '', 'info')",
+                 (user_id, title))
+    conn.commit()
+
+
+def test_stream_replays_events_after_the_cursor(sqlite_db):
+    storage = SQLiteStorage(sqlite_db)
+    farmer = storage.create_user('streamer', 'streamer@example.com', 'x', '', '', '', '', None)
+    crop = storage.add_crop(farmer, crop_name='okra', area=1.0, planting_date='2024-05-01', status='planned')
+    storage.set_crop_status(crop, farmer, 'growing', '2024-06-01')
+    storage.close()
+    conn = sqlite3.connect(sqlite_db)
+    notify(conn, farmer, 'first')
+    notify(conn, farmer, 'second')
+    conn.close()
+
+    stream = events.event_stream(events.EventBroker(sqlite_db), farmer, last_event_id=0)
+    assert next(stream) == 'retry: 3000\n\n'
+    frames = [next(stream) for _ in range(3)]
+    stream.close()
+
+    assert [frame.split('\n')[1] for frame in frames] == ['event: crop', 'event: notification', 'event: notification']
+    assert json.loads(frames[0].split('data: ')[1])['status'] == 'growing'
+    second = json.loads(frames[2].split('data: ')[1])
+    assert second['title'] == 'second' and second['unread_count'] == 2
+
+
+def test_old_events_are_pruned_without_a_listener(sqlite_db, monkeypatch):
+    monkeypatch.setattr(events, 'EVENT_PRUNE_EVERY', 5)
+    conn = sqlite3.connect(sqlite_db)
+    events.init_events(conn.cursor())
+    conn.executemany("INSERT INTO events (user_id, event, data, created_at) VALUES (1, 'notification', '{}', ?)",
+                     [('2000-01-01 00:00:00',)] * 3)
+    conn.commit()
+    for i in range(6):
+        notify(conn, 1, f'fresh {i}')
+
+    remaining = conn.execute('SELECT created_at FROM events ORDER BY id').fetchall()
+    conn.close()
+    assert len(remaining) == 6
+    assert all(created_at > '2000-01-01 00:00:00' for created_at, in remaining)
@@ -0,0 +1,105 @@
+"""Buyer ledger: the parallel repair against a serial recompute"""
+
+import sqlite3
+
+import ledger
+from retention import attach_archive
+from storage import SQLiteStorage
+
+
+def ledger_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('''SELECT id, total_transactions, rating_count, rating_sum, decayed_weight,
+                                      decayed_sum, rating, decayed_rating FROM buyers ORDER BY id''').fetchall()
+    finally:
+        conn.close()
+
+
+def serial_recompute(db_path):
+    conn = attach_archive(sqlite3.connect(db_path, isolation_level=None), db_path)
+    try:
+        conn.execute('BEGIN')
+        ledger.recompute(conn)
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return ledger_rows(db_path)
+
+
+def seed(storage, n=400):
+    farmer = storage.create_user('seller', 'seller@example.com', 'x', '', '', 'Pune', 'Maharashtra', None)
+    crop = storage.add_crop(farmer, crop_name='tomato', area=1.0, planting_date='2024-01-01')
+    buyers = [row['id'] for row in storage.verified_buyers()]
+    sales = []
+    for i in range(n):
+        sale = storage.record_transaction(farmer, crop, buyers[i % len(buyers)], 1, 10)
+        storage.set_transaction_status(sale, farmer, 'completed')
+        storage.rate_transaction(sale, farmer, 1 + i % 5)
+        sales.append(sale)
+    return farmer, crop, buyers, sales
+
+
+def test_repair_keeps_writes_made_during_the_scan(sqlite_db, monkeypatch):
+    storage = SQLiteStorage(sqlite_db)
+    farmer, crop, buyers, sales = seed(storage)
+    aggregate, calls = ledger._aggregate, []
+
+    def aggregate_then_write(conn, table, low, high):
+        result = aggregate(conn, table, low, high)
+        calls.append(high)
+        if len(calls) == 2:
+            # Behind and ahead of the scan: re-rate, cancel, move to another buyer, add a sale
+            storage.rate_transaction(sales[0], farmer, 5)
+            storage.set_transaction_status(sales[1], farmer, 'cancelled')
+            storage.execute('UPDATE transactions SET buyer_id = ? WHERE id = ?', (buyers[-1], sales[2]))
+            storage.rate_transaction(sales[-1], farmer, 1)
+            new = storage.record_transaction(farmer, crop, buyers[0], 1, 10)
+            storage.set_transaction_status(new, farmer, 'completed')
+            storage.rate_transaction(new, farmer, 2)
+        return result
+
+    monkeypatch.setattr(ledger, '_aggregate', aggregate_then_write)
+    ledger.recompute_parallel(sqlite_db, workers=1)
+    assert len(calls) > 2
+    repaired = ledger_rows(sqlite_db)
+    assert repaired == serial_recompute(sqlite_db)
+    storage.close()
+
+
+def test_repair_matches_trigger_totals(sqlite_db):
+    storage = SQLiteStorage(sqlite_db)
+    seed(storage, n=200)
+    storage.close()
+    incremental = ledger_rows(sqlite_db)
+    ledger.recompute_parallel(sqlite_db, workers=3)
+    assert ledger_rows(sqlite_db) == incremental
+
+
+def test_only_visible_buyer_changes_bump_the_generation(storage):
+    from uuid import uuid4
+
+    suffix = uuid4().hex[:8]
+    seller = storage.create_user(f'seller_{suffix}', f'seller_{suffix}@example.com', 'x', '', '', '', '', None)
+    watcher = storage.create_user(f'watcher_{suffix}', f'watcher_{suffix}@example.com', 'x', '', '', '', '', None)
+    crop = storage.add_crop(seller, crop_name='tomato', area=1.0, planting_date='2024-01-01')
+    buyer = storage.verified_buyers()[0]['id']
+
+    def generation():
+        return storage.revision_validators(watcher)['buyers_generation']
+
+    before = generation()
+    # A sale rewrites the buyer's ledger totals but nothing pages show
+    sale = storage.record_transaction(seller, crop, buyer, 1, 10)
+    storage.set_transaction_status(sale, seller, 'completed')
+    assert generation() == before
+
+    rating = storage.fetchone('SELECT rating FROM buyers WHERE id = ?', (buyer,))['rating']
+    storage.rate_transaction(sale, seller, 1 if rating > 3 else 5)
+    assert generation() > before
+
+    before = generation()
+    storage.execute('UPDATE buyers SET phone = phone WHERE id = ?', (buyer,))
+    assert generation() == before
+    storage.execute("UPDATE buyers SET phone = phone || '0' WHERE id = ?", (buyer,))
+    assert generation() > before
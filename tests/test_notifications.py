@@ -0,0 +1,41 @@
+"""The unread counter on users and the navbar badge it feeds"""
+
+import re
+import sqlite3
+
+from storage import SQLiteStorage
+
+
+def badge(html):
+    """Counts shown in the navbar's unread badges"""
+    return re.findall(r'data-unread-badge>(\d+)<', html)
+
+
+def test_deleting_an_unread_notification_lowers_the_counter(sqlite_db):
+    storage = SQLiteStorage(sqlite_db)
+    user_id = storage.create_user('reader', 'reader@example.com', 'x', '', '', '', '', None)
+    ids = [storage.create_notification(user_id, 'Hi', str(i)) for i in range(3)]
+    storage.mark_notification_read(ids[0], user_id)
+    storage.close()
+
+    conn = sqlite3.connect(sqlite_db)
+    with conn:
+        conn.execute('DELETE FROM notifications WHERE id IN (?, ?)', ids[:2])
+    counted = conn.execute('SELECT COUNT(*) FROM notifications WHERE user_id = ? AND is_read = 0',
+                           (user_id,)).fetchone()[0]
+    stored = conn.execute('SELECT unread_count FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+    conn.close()
+    assert stored == counted == 1
+
+
+def test_badge_follows_the_counter_on_every_page(farmer_client):
+    from app import storage
+
+    client, user_id = farmer_client
+    for i in range(3):
+        storage.create_notification(user_id, 'Buyer interested', f'offer {i}')
+    assert badge(client.get('/crops').get_data(as_text=True)) == ['3', '3']
+
+    response = client.get('/mark_all_notifications_read', follow_redirects=True)
+    assert badge(response.get_data(as_text=True)) == ['0', '0']
+    assert storage.unread_count(user_id) == 0
@@ -0,0 +1,62 @@
+"""Price rollups: the trigger-maintained buckets against a full rebuild"""
+
+import sqlite3
+
+import prices
+from retention import archive_batch, attach_archive
+from storage import SQLiteStorage
+
+
+def snapshot(conn):
+    return [tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+            for row in prices._snapshot(conn)]
+
+
+def rebuilt(db_path):
+    conn = attach_archive(sqlite3.connect(db_path, isolation_level=None), db_path)
+    try:
+        incremental = snapshot(conn)
+        conn.execute('BEGIN')
+        prices.rebuild(conn)
+        rebuilt = snapshot(conn)
+        conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+    return incremental, rebuilt
+
+
+def test_rollups_match_rebuild_through_edits_and_archiving(sqlite_db):
+    storage = SQLiteStorage(sqlite_db)
+    farmer = storage.create_user('trader', 'trader@example.com', 'x', '', '', 'Pune', 'Maharashtra', None)
+    crops = [storage.add_crop(farmer, crop_name=name, area=1.0, planting_date='2018-01-01')
+             for name in ('Tomato', ' tomato ', 'Onion')]
+    buyers = [row['id'] for row in storage.verified_buyers()]
+
+    sales = []
+    for i in range(60):
+        sale = storage.record_transaction(farmer, crops[i % 3], buyers[i % len(buyers)], 1 + i % 4, 10 + i % 7)
+        storage.execute('UPDATE transactions SET transaction_date = ? WHERE id = ?',
+                        (f'20{18 + i % 2}-{1 + i % 12:02d}-{1 + i % 27:02d}', sale))
+        if i % 5:
+            storage.set_transaction_status(sale, farmer, 'completed')
+        sales.append(sale)
+
+    incremental, full = rebuilt(sqlite_db)
+    assert incremental == full and incremental
+
+    # Re-price, re-date (back into an earlier bucket), move to another buyer's city, cancel
+    storage.execute('UPDATE transactions SET price_per_kg = 99 WHERE id = ?', (sales[1],))
+    storage.execute("UPDATE transactions SET transaction_date = '2018-01-01' WHERE id = ?", (sales[2],))
+    storage.execute('UPDATE transactions SET buyer_id = ? WHERE id = ?', (buyers[-1], sales[3]))
+    storage.set_transaction_status(sales[4], farmer, 'cancelled')
+    storage.set_transaction_status(sales[6], farmer, 'cancelled')
+    incremental, full = rebuilt(sqlite_db)
+    assert incremental == full
+
+    # Archived sales stay counted, and rebuild() reads them back from the archive
+    conn = attach_archive(sqlite3.connect(sqlite_db, isolation_level=None), sqlite_db)
+    assert archive_batch(conn, 'transactions', 0)
+    conn.close()
+    incremental, full = rebuilt(sqlite_db)
+    assert incremental == full
+    storage.close()
@@ -0,0 +1,69 @@
+"""Report cache keys and job markers"""
+
+import os
+import sqlite3
+import time
+
+import pytest
+
+import reports
+from impact import parse_flow
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def farmer(sqlite_db):
+    storage = SQLiteStorage(sqlite_db)
+    user_id = storage.create_user('reporter', 'reporter@example.com', 'x', '', 'Reporter', 'Pune',
+                                  'Maharashtra', None)
+    crop_id = storage.add_crop(user_id, crop_name='tomato', area=1.0, planting_date='2024-01-01')
+    yield storage, user_id, crop_id
+    storage.close()
+
+
+def watermark(storage, user_id):
+    conn = sqlite3.connect(storage.db_path)
+    try:
+        return reports.data_watermark(conn, user_id)
+    finally:
+        conn.close()
+
+
+def test_watermark_follows_report_inputs(farmer):
+    storage, user_id, crop_id = farmer
+    other = storage.create_user('bystander', 'bystander@example.com', 'x', '', '', '', '', None)
+    seen = {watermark(storage, user_id)}
+
+    storage.add_crop(other, crop_name='onion', area=1.0, planting_date='2024-01-01')
+    assert watermark(storage, user_id) in seen
+
+    buyer = storage.matching_buyers('tomato')[0]
+    sale = storage.record_transaction(user_id, crop_id, buyer['id'], 1, 10)
+    seen.add(watermark(storage, user_id))
+    # A status flip that leaves counts, totals and the set of statuses as they were
+    storage.set_transaction_status(sale, user_id, 'completed')
+    storage.set_transaction_status(sale, user_id, 'pending')
+    seen.add(watermark(storage, user_id))
+    storage.record_waste_flows(user_id, [parse_flow({'crop_id': crop_id, 'waste_type': 'compost',
+                                                     'quantity_tons': 1, 'status': 'completed'})])
+    seen.add(watermark(storage, user_id))
+    storage.execute("UPDATE buyers SET name = 'Renamed' WHERE id = ?", (buyer['id'],))
+    seen.add(watermark(storage, user_id))
+    assert len(seen) == 5
+
+
+def test_stale_pending_marker_counts_as_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(reports, 'REPORT_DIR', str(tmp_path))
+    with open(reports.report_path('7-impact-abc', '.pending'), 'w') as f:
+        f.write(str(time.time()))
+    assert reports.report_status('7-impact-abc') == 'running'
+
+    with open(reports.report_path('7-impact-abc', '.pending'), 'w') as f:
+        f.write(str(time.time() - reports.REPORT_PENDING_TIMEOUT - 1))
+    assert reports.report_status('7-impact-abc') == 'failed'
+
+    # Markers written before they carried a time fall back to the file's mtime
+    open(reports.report_path('7-impact-old', '.pending'), 'w').close()
+    stale = time.time() - reports.REPORT_PENDING_TIMEOUT - 1
+    os.utime(reports.report_path('7-impact-old', '.pending'), (stale, stale))
+    assert reports.report_status('7-impact-old') == 'failed'
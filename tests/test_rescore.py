@@ -0,0 +1,62 @@
+"""Re-scoring after retraining: resumable chunks that leave edited crops alone"""
+
+import sqlite3
+
+import pytest
+
+import rescore
+from prediction import predictor
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def crops(sqlite_db):
+    """Five crops scored by an 'old' model; returns (db path, farmer, crop ids)"""
+    storage = SQLiteStorage(sqlite_db)
+    farmer = storage.create_user('rescorer', 'rescorer@example.com', 'x', '', '', '', '', None)
+    ids = [storage.add_crop(farmer, crop_name=name, area=1.5, planting_date='2024-01-01', soil_type='loamy',
+                            season='kharif', irrigation_type='drip', expected_consumption=1.0,
+                            predicted_yield=0.0, predicted_surplus=0.0, model_version='old')
+           for name in ('tomato', 'onion', 'potato', 'rice', 'wheat')]
+    storage.close()
+    return sqlite_db, farmer, ids
+
+
+def scores(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT id, predicted_yield, model_version FROM crops ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+def test_interrupted_job_resumes_after_its_last_chunk(crops):
+    db_path, _, ids = crops
+    job = rescore.run(db_path, 'v2', chunk_size=2, duty_cycle=1, log=lambda *_: None, stop_after=1)
+    assert (job['last_id'], job['scored'], job['total'], job['finished_at']) == (ids[1], 2, 5, None)
+    assert [row[2] for row in scores(db_path)] == ['v2', 'v2', 'old', 'old', 'old']
+
+    job = rescore.run(db_path, 'v2', chunk_size=2, duty_cycle=1, log=lambda *_: None)
+    assert (job['scored'], job['changed'], job['skipped']) == (5, 5, 0) and job['finished_at']
+    expected = predictor.predict_batch(['tomato', 'onion', 'potato', 'rice', 'wheat'], [1.5] * 5,
+                                       ['loamy'] * 5, ['kharif'] * 5, ['drip'] * 5)
+    assert [row[1] for row in scores(db_path)] == pytest.approx(expected.tolist())
+
+    # Finished and nothing new: the job keeps its figures and touches nothing
+    assert rescore.run(db_path, 'v2', duty_cycle=1, log=lambda *_: None) == job
+
+
+def test_crop_edited_while_its_chunk_is_scored_is_left_alone(crops, monkeypatch):
+    db_path, _, ids = crops
+    score_chunk = rescore.score_chunk
+
+    def edit_then_score(rows, version):
+        storage = SQLiteStorage(db_path)
+        storage.execute('UPDATE crops SET area = 9.0 WHERE id = ?', (ids[2],))
+        storage.close()
+        return score_chunk(rows, version)
+
+    monkeypatch.setattr(rescore, 'score_chunk', edit_then_score)
+    job = rescore.run(db_path, 'v2', duty_cycle=1, log=lambda *_: None)
+    assert (job['scored'], job['skipped']) == (4, 1)
+    assert scores(db_path)[2][1:] == (0.0, 'old')
@@ -0,0 +1,66 @@
+"""Archiving: rows move to the archive intact and the *_history views still see them"""
+
+import sqlite3
+
+import pytest
+
+import retention
+from storage import SQLiteStorage
+
+
+@pytest.fixture
+def history(sqlite_db):
+    """A farmer with old and recent sales and notifications; returns (db path, farmer, rows before)"""
+    storage = SQLiteStorage(sqlite_db)
+    farmer = storage.create_user('keeper', 'keeper@example.com', 'x', '', '', 'Pune', 'Maharashtra', None)
+    crop = storage.add_crop(farmer, crop_name='millet', area=1.0, planting_date='2019-01-01')
+    buyer = storage.verified_buyers()[0]['id']
+    for i, when in enumerate(('2019-02-01', '2019-03-01', '2099-01-01')):
+        sale = storage.record_transaction(farmer, crop, buyer, 1 + i, 10)
+        storage.execute('UPDATE transactions SET transaction_date = ? WHERE id = ?', (when, sale))
+        storage.set_transaction_status(sale, farmer, 'completed')
+    storage.record_transaction(farmer, crop, buyer, 5, 10)  # pending: never archived
+    for i in range(4):
+        note = storage.create_notification(farmer, 'Old news', str(i))
+        storage.execute("UPDATE notifications SET created_at = '2019-01-01 00:00:00' WHERE id = ?", (note,))
+        if i < 3:
+            storage.mark_notification_read(note, farmer)
+    storage.close()
+
+    conn = sqlite3.connect(sqlite_db)
+    before = {table: conn.execute(f'SELECT * FROM {table} ORDER BY id').fetchall()
+              for table in retention.ARCHIVED_TABLES}
+    conn.close()
+    return sqlite_db, farmer, before
+
+
+def test_archived_rows_round_trip_through_the_history_views(history):
+    db_path, farmer, before = history
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    moved = retention.run_once(conn, db_path)
+    assert (moved['transactions'], moved['notifications']) == (2, 3)
+
+    assert conn.execute('SELECT COUNT(*) FROM main.transactions').fetchone()[0] == 2
+    assert conn.execute('SELECT COUNT(*) FROM main.notifications WHERE is_read = 1').fetchone()[0] == 0
+    for table, rows in before.items():
+        assert conn.execute(f'SELECT * FROM {table}_history ORDER BY id').fetchall() == rows
+    # Only read notifications are archived, so the unread counter is untouched
+    assert conn.execute('SELECT unread_count FROM users WHERE id = ?', (farmer,)).fetchone()[0] == 1
+
+    assert retention.run_once(conn, db_path)['transactions'] == 0
+    conn.close()
+
+
+def test_columns_added_to_the_live_table_reach_the_archive(history):
+    db_path, _, before = history
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    retention.run_once(conn, db_path, vacuum=False)
+    conn.close()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('ALTER TABLE transactions ADD COLUMN invoice_number TEXT')
+    retention.attach_archive(conn, db_path)
+    assert 'invoice_number' in {row[1] for row in conn.execute('PRAGMA archive.table_info(transactions)')}
+    rows = conn.execute('SELECT id, invoice_number FROM transactions_history ORDER BY id').fetchall()
+    conn.close()
+    assert rows == [(row[0], None) for row in before['transactions']]
@@ -0,0 +1,69 @@
+"""Conditional GET: ETags from the data revision, and the build fingerprint behind them"""
+
+import revisions
+
+
+def test_build_tag_follows_code_and_templates(tmp_path, monkeypatch):
+    (tmp_path / 'templates').mkdir()
+    (tmp_path / 'templates' / 'dashboard.html').write_text('<h1>{{ user }}</h1>')
+    (tmp_path / 'app.py').write_text('VERSION = 1\n')
+    monkeypatch.setattr(revisions, '_ROOT', str(tmp_path))
+
+    tag, _ = revisions._build_fingerprint()
+    assert revisions._build_fingerprint()[0] == tag
+    (tmp_path / 'app.py').write_text('VERSION = 2\n')
+    assert revisions._build_fingerprint()[0] != tag
+    (tmp_path / 'app.py').write_text('VERSION = 1\n')
+    (tmp_path / 'templates' / 'dashboard.html').write_text('<h2>{{ user }}</h2>')
+    assert revisions._build_fingerprint()[0] != tag
+
+
+def revalidate(client, path, etag):
+    return client.get(path, headers={'If-None-Match': etag})
+
+
+def test_unchanged_pages_answer_304(farmer_client):
+    from app import storage
+
+    client, user_id = farmer_client
+    first = client.get('/dashboard')
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+    assert etag.startswith('W/')
+
+    not_modified = revalidate(client, '/dashboard', etag)
+    assert not_modified.status_code == 304 and not_modified.data == b''
+    assert not_modified.headers['ETag'] == etag
+
+    # Another farmer's write leaves this one's pages valid
+    other = storage.create_user(f'other_{user_id}', f'other_{user_id}@example.com', 'x', '', '', '', '', None)
+    storage.add_crop(other, crop_name='onion', area=1.0, planting_date='2024-01-01')
+    assert revalidate(client, '/dashboard', etag).status_code == 304
+
+    storage.add_crop(user_id, crop_name='tomato', area=1.0, planting_date='2024-01-01',
+                     predicted_yield=4.0, predicted_surplus=1.5)
+    changed = revalidate(client, '/dashboard', etag)
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    crops_etag = client.get('/crops').headers['ETag']
+    assert revalidate(client, '/crops', crops_etag).status_code == 304
+
+    # /crops shows no buyers, so a buyer edit only expires pages that do
+    storage.execute("UPDATE buyers SET phone = phone || '0' WHERE id = ?", (storage.verified_buyers()[0]['id'],))
+    assert revalidate(client, '/crops', crops_etag).status_code == 304
+    assert revalidate(client, '/dashboard', changed.headers['ETag']).status_code == 200
+
+
+def test_display_name_and_flashes_bypass_the_etag(farmer_client):
+    client, _ = farmer_client
+    etag = client.get('/dashboard').headers['ETag']
+
+    with client.session_transaction() as sess:
+        sess['full_name'] = 'Renamed Farmer'
+    renamed = revalidate(client, '/dashboard', etag)
+    assert renamed.status_code == 200 and renamed.headers['ETag'] != etag
+
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('success', 'Crop added')]
+    flashed = revalidate(client, '/dashboard', renamed.headers['ETag'])
+    assert flashed.status_code == 200 and 'ETag' not in flashed.headers
+    assert flashed.headers['Cache-Control'] == 'no-store'
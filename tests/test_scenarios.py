@@ -0,0 +1,56 @@
+"""What-if scenarios: one batched scoring per grid, ranking and the grid cache"""
+
+import contextlib
+import io
+
+import numpy as np
+import pytest
+
+import scenarios
+from prediction import predictor
+
+WEATHER = {'temperature': 28.5, 'rainfall': 450, 'humidity': 65}
+
+
+@pytest.fixture
+def crop():
+    scenarios.cache.clear()
+    return {'id': 1, 'crop_name': 'tomato', 'area': 2.0, 'soil_type': 'clay', 'season': 'rabi',
+            'irrigation_type': 'drip', 'expected_consumption': 4.0}
+
+
+def test_grid_starts_with_the_crop_as_planned_and_matches_per_row_scores(crop):
+    grid = scenarios.build_grid(crop, WEATHER)
+    n = len(scenarios.SOIL_TYPES) * len(scenarios.SEASONS) * len(scenarios.IRRIGATION_TYPES) \
+        * len(scenarios.AREA_FACTORS) * len(scenarios.WEATHER_OUTLOOKS)
+    assert len(grid['area']) == n
+    assert (grid['soil_type'][0], grid['season'][0], grid['irrigation_type'][0], grid['area'][0],
+            grid['weather'][0]) == ('clay', 'rabi', 'drip', 2.0, 'forecast')
+
+    yields, surplus = scenarios.score_grid(crop, grid)
+    with contextlib.redirect_stdout(io.StringIO()):
+        per_row = [predictor.predict_yield_ml('tomato', grid['area'][i], grid['soil_type'][i], grid['season'][i],
+                                              grid['irrigation_type'][i], grid['rainfall'][i],
+                                              grid['temperature'][i], grid['humidity'][i])
+                   for i in range(0, n, 101)]
+    assert np.allclose(per_row, yields[::101])
+    assert np.allclose(surplus, np.maximum(0, yields - 4.0), atol=0.01)
+
+
+def test_rankings_order_the_table(crop):
+    fit = scenarios.explore(crop, WEATHER, 'fit', limit=50)['results']
+    gaps = [abs(row['predicted_yield'] - 4.0) for row in fit]
+    assert gaps == sorted(gaps)
+    by_yield = [row['predicted_yield'] for row in scenarios.explore(crop, WEATHER, 'yield', limit=50)['results']]
+    assert by_yield == sorted(by_yield, reverse=True)
+
+
+def test_grid_is_cached_until_the_crop_changes(crop):
+    before = scenarios.cache.report()
+    first = scenarios.explore(crop, WEATHER)
+    assert not first['cached'] and scenarios.explore(crop, WEATHER, 'surplus')['cached']
+    assert first['baseline']['predicted_yield'] == scenarios.explore(crop, WEATHER)['baseline']['predicted_yield']
+
+    assert not scenarios.explore(dict(crop, area=3.0), WEATHER)['cached']
+    after = scenarios.cache.report()
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses'], after['entries']) == (2, 2, 2)
@@ -0,0 +1,60 @@
+"""Harvest reminders: the date watermarks and crops entered late"""
+
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import scheduler
+from storage import SQLiteStorage
+
+TODAY = date(2024, 6, 15)
+
+
+@pytest.fixture
+def farm(sqlite_db):
+    storage = SQLiteStorage(sqlite_db)
+    farmer = storage.create_user('grower', 'grower@example.com', 'x', '', '', '', '', None)
+    conn = sqlite3.connect(sqlite_db, isolation_level=None)
+
+    def plant(name, harvest_in_days, status='growing'):
+        harvest = (TODAY + timedelta(days=harvest_in_days)).isoformat()
+        return storage.add_crop(farmer, crop_name=name, area=1.0, planting_date='2024-01-01',
+                                expected_harvest_date=harvest, status=status)
+
+    def reminders(day=TODAY):
+        scheduler.run_once(conn, day)
+        return sorted(conn.execute('SELECT crop_id, kind FROM harvest_reminders').fetchall())
+
+    yield plant, reminders
+    conn.close()
+    storage.close()
+
+
+def test_each_reminder_fires_once_as_harvest_comes_due(farm):
+    plant, reminders = farm
+    crop = plant('onion', 10)
+    assert reminders() == []
+    assert reminders(TODAY + timedelta(days=3)) == [(crop, 'upcoming')]
+    assert reminders(TODAY + timedelta(days=3)) == [(crop, 'upcoming')]
+    assert reminders(TODAY + timedelta(days=14)) == [(crop, 'harvest'), (crop, 'overdue'), (crop, 'upcoming')]
+
+
+def test_crop_entered_behind_the_watermark_still_gets_its_reminders(farm):
+    plant, reminders = farm
+    # Move every kind's watermark forward: 'upcoming' to a week out, the others to four days ago
+    ahead, behind = plant('okra', 7), plant('beans', -4)
+    seen = [(ahead, 'upcoming'), (behind, 'harvest'), (behind, 'overdue'), (behind, 'upcoming')]
+    assert reminders() == sorted(seen)
+
+    # A 75-day tomato planted 70 days ago: harvest in 5 days, behind the 'upcoming' watermark
+    tomato = plant('tomato', 5)
+    # Harvest passed 10 days ago and still growing: only 'overdue' is still worth sending
+    late = plant('chilli', -10)
+    # Long past and already harvested: nothing
+    plant('maize', -60, status='harvested')
+    seen += [(tomato, 'upcoming'), (late, 'overdue')]
+    assert reminders() == sorted(seen)
+
+    seen += [(tomato, 'harvest')]
+    assert reminders(TODAY + timedelta(days=5)) == sorted(seen)
@@ -0,0 +1,54 @@
+"""Full-text search through /api/search, with the FTS indexes kept in step by triggers"""
+
+from search import build_match_query
+
+
+def found(client, q, scope='buyers', **params):
+    response = client.get('/api/search', query_string={'q': q, 'scope': scope, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_match_query_quotes_prefix_terms():
+    assert build_match_query('Tom, PUNE!') == '"tom"* "pune"*'
+    # FTS5 syntax is quoted away, not interpreted
+    assert build_match_query('"") OR (*') == '"or"*'
+    assert build_match_query('-- !!') is None
+
+
+def test_buyers_by_prefix_and_rank(farmer_client):
+    client, _ = farmer_client
+    results = found(client, 'toma pun')['results']
+    assert {row['name'] for row in results} >= {'Green Valley Processing', 'Metro Fresh Market'}
+    assert all(row['city'] == 'Pune' for row in results)
+    # Name matches carry the most weight
+    assert found(client, 'compost')['results'][0]['name'] == 'EcoCompost Solutions'
+
+    first = found(client, 'nashik', per_page=1)
+    second = found(client, 'nashik', per_page=1, page=2)
+    assert first['has_more'] and len(first['results']) == 1
+    assert first['results'][0]['id'] != second['results'][0]['id']
+
+    assert found(client, '***')['results'] == []
+    assert client.get('/api/search?q=x&scope=users').status_code == 400
+
+
+def test_crop_index_follows_writes_and_owner(farmer_client):
+    from app import storage
+
+    client, user_id = farmer_client
+    crop = storage.add_crop(user_id, crop_name='brinjal', variety='Pusa Purple Long', area=1.0,
+                            planting_date='2024-01-01')
+    other = storage.create_user(f'searcher_{user_id}', f'searcher_{user_id}@example.com', 'x', '', '',
+                                '', '', None)
+    storage.add_crop(other, crop_name='brinjal', area=1.0, planting_date='2024-01-01')
+
+    assert [row['id'] for row in found(client, 'pusa purp', 'crops')['results']] == [crop]
+    assert [row['id'] for row in found(client, 'brinjal', 'crops')['results']] == [crop]
+
+    storage.execute('UPDATE crops SET crop_name = ? WHERE id = ?', ('eggplant', crop))
+    assert found(client, 'brinjal', 'crops')['results'] == []
+    assert [row['id'] for row in found(client, 'eggpl', 'crops')['results']] == [crop]
+
+    storage.delete_crop(crop, user_id)
+    assert found(client, 'eggplant', 'crops')['results'] == []
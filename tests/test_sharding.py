@@ -0,0 +1,92 @@
+"""Sharded storage: routing users to their state's shard, and splitting a single database"""
+
+import sqlite3
+
+import pytest
+
+from sharding import SHARD_ID_BITS, ShardedStorage, split
+from storage import IntegrityError, SQLiteStorage
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    from app import init_db, SAMPLE_BUYERS
+
+    directory = str(tmp_path / 'directory.db')
+    init_db(directory)
+    storage = ShardedStorage(directory, init_db, shard_dir=str(tmp_path / 'shards'), workers=2)
+    storage.init_schema()
+    storage.seed_buyers(SAMPLE_BUYERS)
+    yield storage
+    storage.close()
+
+
+def crop_ids(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute('SELECT id FROM crops')}
+    finally:
+        conn.close()
+
+
+def test_users_and_their_rows_land_in_their_shard(sharded):
+    west = sharded.create_user('west', 'west@example.com', 'x', '', '', 'Pune', 'Maharashtra', None)
+    north = sharded.create_user('north', 'north@example.com', 'x', '', '', 'Ludhiana', ' Punjab ', None)
+    assert sharded.names() == ['maharashtra', 'punjab']
+    assert sharded.shard_name(north) == 'punjab'
+
+    west_crop = sharded.add_crop(west, crop_name='onion', area=1.0, planting_date='2024-01-01')
+    north_crop = sharded.add_crop(north, crop_name='wheat', area=1.0, planting_date='2024-01-01')
+    assert crop_ids(sharded.path('maharashtra')) == {west_crop}
+    assert crop_ids(sharded.path('punjab')) == {north_crop}
+    assert west_crop >> SHARD_ID_BITS != north_crop >> SHARD_ID_BITS
+    assert sharded.get_crop(north_crop, west) is None
+    assert sharded.get_crop(north_crop, north)['crop_name'] == 'wheat'
+
+    # Usernames stay unique across shards, and a refused user leaves no directory entry
+    with pytest.raises(IntegrityError):
+        sharded.create_user('west', 'other@example.com', 'x', '', '', '', 'Punjab', None)
+    assert sharded.directory.fetchone('SELECT 1 FROM shard_directory WHERE email = ?', ('other@example.com',)) is None
+    assert sharded.find_user_for_login('north@example.com')['id'] == north
+
+    # Buyers are replicated to each shard; platform reads gather every shard
+    assert all(shard.verified_buyers() for shard in sharded.all_shards())
+    assert sharded.platform_totals()['crops'] == 2
+
+
+def test_split_copies_every_users_rows(tmp_path):
+    from app import init_db, SAMPLE_BUYERS
+
+    db_path = str(tmp_path / 'single.db')
+    init_db(db_path)
+    single = SQLiteStorage(db_path)
+    single.seed_buyers(SAMPLE_BUYERS)
+    buyer = single.verified_buyers()[0]['id']
+    farmers = {}
+    for name, state in (('ana', 'Maharashtra'), ('bo', 'Gujarat'), ('cy', 'Gujarat')):
+        farmers[name] = single.create_user(name, f'{name}@example.com', 'x', '', '', '', state, None)
+        crop = single.add_crop(farmers[name], crop_name='tomato', area=1.0, planting_date='2024-01-01')
+        for _ in range(3):
+            sale = single.record_transaction(farmers[name], crop, buyer, 1, 10)
+            single.set_transaction_status(sale, farmers[name], 'completed')
+            single.rate_transaction(sale, farmers[name], 4)
+    single.close()
+
+    storage = ShardedStorage(db_path, init_db, shard_dir=str(tmp_path / 'shards'), workers=2)
+    try:
+        totals = split(storage, db_path, log=lambda line: None)
+        assert all(source == copied for source, copied in totals.values()), totals
+        assert totals['transactions'] == (9, 9)
+        assert sorted(storage.names()) == ['gujarat', 'maharashtra']
+
+        assert len(storage.transaction_history(farmers['cy'])) == 3
+        assert storage.shard_name(farmers['cy']) == storage.shard_name(farmers['bo']) == 'gujarat'
+        # Each shard's ledger counts its own sales
+        ledgers = {name: storage.shard(name).fetchone('SELECT total_transactions FROM buyers WHERE id = ?',
+                                                      (buyer,))['total_transactions']
+                   for name in storage.names()}
+        assert ledgers == {'gujarat': 6, 'maharashtra': 3}
+        with pytest.raises(RuntimeError):
+            split(storage, db_path, log=lambda line: None)
+    finally:
+        storage.close()
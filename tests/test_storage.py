@@ -0,0 +1,205 @@
+"""The Storage contract, run on SQLite and (with TEST_DATABASE_URL) PostgreSQL"""
+
+import re
+from uuid import uuid4
+
+import pytest
+
+from storage import check, create_storage, IntegrityError, PostgresStorage, UnsupportedBackend, require_sqlite
+from impact import parse_flow
+
+TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+
+def new_user(storage, state='Maharashtra'):
+    suffix = uuid4().hex[:8]
+    return storage.create_user(f'user_{suffix}', f'user_{suffix}@example.com', 'x', '', 'Test',
+                               'Pune', state, '2024-01-01 00:00:00')
+
+
+def scenario(storage):
+    """The same writes on any backend; returns what the routes would read, minus ids and clocks"""
+    farmer = new_user(storage)
+    crop_ids = [storage.add_crop(farmer, crop_name=name, area=2.0, planting_date='2024-03-01',
+                                 expected_harvest_date=harvest, predicted_yield=6.0,
+                                 predicted_surplus=surplus, status='planned')
+                for name, harvest, surplus in (('tomato', '2024-06-01', 4.5), ('onion', None, None),
+                                               ('potato', '2024-05-01', 1.0))]
+    buyer = storage.matching_buyers('tomato')[0]
+    sales = [storage.record_transaction(farmer, crop_ids[0], buyer['id'], 1.5, 12),
+             storage.record_transaction(farmer, crop_ids[2], buyer['id'], 2.0, 10)]
+    storage.set_transaction_status(sales[0], farmer, 'completed')
+    storage.rate_transaction(sales[0], farmer, 4, 'Prompt pickup')
+    storage.set_transaction_status(sales[1], farmer, 'cancelled')
+    flows = storage.record_waste_flows(farmer, [parse_flow({
+        'crop_id': crop_ids[1], 'waste_type': 'compost', 'quantity_tons': 3, 'status': 'completed'})])
+    for i in range(3):
+        storage.create_notification(farmer, f'Note {i}', 'Hello')
+    storage.mark_notification_read(storage.unread_notifications(farmer, 1)[0]['id'], farmer)
+
+    strip = lambda rows, *keys: [tuple(row[key] for key in keys) for row in rows]
+    return {
+        'totals': dict(storage.crop_totals(farmer)),
+        'summary': sorted(strip(storage.crop_summary(farmer), 'crop_name', 'count', 'surplus')),
+        'by_surplus': strip(storage.list_crops(farmer, sort='surplus_high'), 'crop_name'),
+        'by_harvest': strip(storage.list_crops(farmer, sort='harvest_date'), 'crop_name'),
+        'history': sorted(strip(storage.transaction_history(farmer), 'crop_name', 'status', 'rating',
+                                'total_amount')),
+        'flows': strip(storage.list_waste_flows(farmer), 'crop_name', 'waste_type', 'compost_generated'),
+        'impact': {key: value for key, value in dict(storage.impact_rollup('farmer', farmer)).items()
+                   if key not in ('scope_key', 'updated_at')},
+        'unread': storage.unread_count(farmer),
+        'flow_count': len(flows),
+    }
+
+
+def test_check(storage):
+    user_id, crop_ids = check(storage, n_crops=200, n_notifications=50)
+    assert len(crop_ids) == 200
+    assert storage.get_user(user_id)['unread_count'] == 0
+
+
+def test_rows_behave_like_sqlite_rows(storage):
+    user_id = new_user(storage)
+    row = storage.get_user(user_id)
+    assert row['id'] == row[0] == dict(row)['id'] == user_id
+    assert TIMESTAMP.match(row['created_at']) and row['last_login'] == '2024-01-01 00:00:00'
+
+
+def test_duplicate_email_names_the_column(storage):
+    user_id = new_user(storage)
+    email = storage.get_user(user_id)['email']
+    with pytest.raises(IntegrityError, match='email'):
+        storage.create_user(f'other_{uuid4().hex[:8]}', email, 'x', '', '', '', '', None)
+
+
+def test_login_lookup_and_profile(storage):
+    user_id = new_user(storage)
+    user = storage.get_user(user_id)
+    assert storage.find_user_for_login(user['email'])['id'] == user_id
+    assert storage.find_user_for_login(user['username'])['id'] == user_id
+    assert storage.find_user_for_login(f'nobody_{uuid4().hex}') is None
+    storage.record_login(user_id, '2024-05-01 10:00:00', new_password='rehashed')
+    storage.update_profile(user_id, 'New Name', user['email'], '99', 'Street', 'Nashik', 'Maharashtra', '422001')
+    user = storage.get_user(user_id)
+    assert (user['password'], user['last_login'], user['full_name'], user['city']) == \
+        ('rehashed', '2024-05-01 10:00:00', 'New Name', 'Nashik')
+
+
+def test_crops_are_scoped_to_their_farmer(storage):
+    farmer, other = new_user(storage), new_user(storage)
+    crop_id = storage.add_crop(farmer, crop_name='tomato', area=1.0, planting_date='2024-01-01')
+    assert storage.get_crop(crop_id, other) is None
+    assert storage.set_crop_status(crop_id, other, 'growing', '2024-02-01 00:00:00') == 0
+    assert storage.delete_crop(crop_id, other) == 0
+    assert storage.delete_crop(crop_id, farmer) == 1
+    assert storage.get_crop(crop_id, farmer) is None
+
+
+def test_record_transaction_needs_own_crop_and_verified_buyer(storage):
+    farmer, other = new_user(storage), new_user(storage)
+    crop_id = storage.add_crop(farmer, crop_name='tomato', area=1.0, planting_date='2024-01-01')
+    buyer = storage.matching_buyers('tomato')[0]
+    assert storage.record_transaction(other, crop_id, buyer['id'], 1, 10) is None
+    assert storage.record_transaction(farmer, crop_id, -1, 1, 10) is None
+    sale = storage.record_transaction(farmer, crop_id, buyer['id'], 1, 10)
+    assert storage.rate_transaction(sale, farmer, 5) == 0  # still pending
+    assert storage.set_transaction_status(sale, farmer, 'completed') == 1
+    assert storage.set_transaction_status(sale, farmer, 'completed') == 0
+    assert storage.rate_transaction(sale, farmer, 5) == 1
+    assert storage.recent_transactions(farmer)[0]['buyer_name'] == buyer['name']
+
+
+def test_buyer_ledger_follows_ratings(storage):
+    farmer = new_user(storage)
+    crop_id = storage.add_crop(farmer, crop_name='tomato', area=1.0, planting_date='2024-01-01')
+    buyer = storage.matching_buyers('tomato')[0]
+    before = storage.fetchone('SELECT * FROM buyers WHERE id = ?', (buyer['id'],))
+    sale = storage.record_transaction(farmer, crop_id, buyer['id'], 1, 10)
+    storage.set_transaction_status(sale, farmer, 'completed')
+    storage.rate_transaction(sale, farmer, 3)
+    after = storage.fetchone('SELECT * FROM buyers WHERE id = ?', (buyer['id'],))
+    assert after['total_transactions'] == before['total_transactions'] + 1
+    assert after['rating_count'] == before['rating_count'] + 1
+    assert after['rating_sum'] == before['rating_sum'] + 3
+    storage.set_transaction_status(sale, farmer, 'cancelled')
+    restored = storage.fetchone('SELECT * FROM buyers WHERE id = ?', (buyer['id'],))
+    for column in ('total_transactions', 'rating_count', 'rating_sum', 'decayed_weight', 'decayed_sum',
+                   'decayed_rating'):
+        assert restored[column] == before[column], column
+    # With no ratings left the listed rating stays where it was
+    assert restored['rating'] == (before['rating'] if before['rating_count'] else after['rating'])
+
+
+def test_notification_counters_and_revision(storage):
+    user_id = new_user(storage)
+    start = storage.revision_validators(user_id)['data_revision']
+    ids = [storage.create_notification(user_id, 'Hi', str(i)) for i in range(4)]
+    assert storage.unread_count(user_id) == 4
+    assert storage.mark_notification_read(ids[0], user_id + 1) == 0
+    assert storage.mark_notification_read(ids[0], user_id) == 1
+    assert storage.mark_notification_read(ids[0], user_id) == 1  # already read: counter unchanged
+    assert storage.unread_count(user_id) == 3
+    assert storage.mark_all_notifications_read(user_id) == 3
+    assert storage.unread_count(user_id) == 0
+    validators = storage.revision_validators(user_id)
+    assert validators['data_revision'] > start and validators['buyers_generation'] >= 1
+
+
+def test_iter_rows_streams_in_batches(storage):
+    user_id = new_user(storage)
+    for i in range(25):
+        storage.create_notification(user_id, f'Note {i}', 'x')
+    rows = storage.iter_rows('SELECT title FROM notifications WHERE user_id = ? ORDER BY id', (user_id,),
+                             fetch_size=4)
+    assert next(rows) == ['title']
+    assert [row[0] for row in rows] == [f'Note {i}' for i in range(25)]
+
+
+def test_empty_stream_still_names_its_columns(storage):
+    rows = list(storage.iter_rows('SELECT id, title FROM notifications WHERE user_id = ?', (-1,)))
+    assert rows == [['id', 'title']]
+
+
+def test_backends_agree(sqlite_db):
+    """Same writes, same answers: sort order of NULLs, numeric types, trigger-maintained rollups"""
+    from app import SAMPLE_BUYERS
+    from conftest import TEST_DATABASE_URL
+    from storage import SQLiteStorage
+
+    if not TEST_DATABASE_URL:
+        pytest.skip('set TEST_DATABASE_URL to a scratch PostgreSQL database')
+    postgres = PostgresStorage(TEST_DATABASE_URL)
+    try:
+        postgres.init_schema()
+        postgres.seed_buyers(SAMPLE_BUYERS)
+        assert scenario(SQLiteStorage(sqlite_db)) == scenario(postgres)
+    finally:
+        postgres.close()
+
+
+def test_sqlite_features_refuse_postgres():
+    class Unconnected(PostgresStorage):
+        def __init__(self):
+            pass
+
+    with pytest.raises(UnsupportedBackend, match='search'):
+        require_sqlite(Unconnected())
+    require_sqlite(create_storage(':memory:', 'sqlite'))
+
+
+def test_text_dates_stay_on_the_pool(storage):
+    """Dates come back as text from the pool, but other psycopg2 connections keep their casters"""
+    from conftest import TEST_DATABASE_URL
+    import psycopg2
+
+    if storage.name != 'postgres':
+        pytest.skip('PostgreSQL only')
+    assert TIMESTAMP.match(storage.fetchone("SELECT TIMESTAMP '2024-01-02 03:04:05' AS at")['at'])
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DATE '2024-01-02'")
+        assert not isinstance(cursor.fetchone()[0], str)
+    finally:
+        conn.close()
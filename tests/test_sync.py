@@ -0,0 +1,77 @@
+"""Delta sync: /api/sync batches, tombstones and resets"""
+
+import sqlite3
+
+import changelog
+from impact import parse_flow
+
+
+def sync(client, since=0):
+    response = client.get(f'/api/sync?since={since}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def ids(batch, table):
+    change = batch['changes'].get(table, {'columns': ['id'], 'rows': []})
+    position = change['columns'].index('id')
+    return {row[position] for row in change['rows']}
+
+
+def test_sync_sends_own_rows_then_only_changes(farmer_client):
+    from app import storage
+
+    client, user_id = farmer_client
+    crop = storage.add_crop(user_id, crop_name='tomato', area=1.0, planting_date='2024-01-01')
+    other = storage.create_user(f'neighbour_{user_id}', f'neighbour_{user_id}@example.com', 'x', '', '',
+                                '', '', None)
+    foreign = storage.add_crop(other, crop_name='onion', area=1.0, planting_date='2024-01-01')
+
+    snapshot = sync(client)
+    assert snapshot['reset'] is False and not snapshot['more']
+    assert crop in ids(snapshot, 'crops') and foreign not in ids(snapshot, 'crops')
+    assert ids(snapshot, 'buyers')
+
+    storage.set_crop_status(crop, user_id, 'harvested', '2024-06-01 00:00:00')
+    [flow] = storage.record_waste_flows(user_id, [parse_flow({'crop_id': crop, 'waste_type': 'compost',
+                                                              'quantity_tons': 1, 'status': 'completed'})])
+    delta = sync(client, snapshot['seq'])
+    assert delta['seq'] > snapshot['seq']
+    assert ids(delta, 'crops') == {crop} and ids(delta, 'waste_flows') == {flow}
+    assert 'buyers' not in delta['changes']
+    assert sync(client, delta['seq'])['changes'] == {}
+
+
+def test_deletes_survive_compaction_as_tombstones(farmer_client):
+    from app import storage, DATABASE
+
+    client, user_id = farmer_client
+    kept = storage.add_crop(user_id, crop_name='okra', area=1.0, planting_date='2024-01-01')
+    dropped = storage.add_crop(user_id, crop_name='chilli', area=1.0, planting_date='2024-01-01')
+    since = sync(client)['seq']
+
+    storage.execute('UPDATE crops SET notes = ? WHERE id = ?', ('edited', dropped))
+    storage.delete_crop(dropped, user_id)
+    conn = sqlite3.connect(DATABASE)
+    with conn:
+        changelog.compact(conn)
+    conn.close()
+
+    delta = sync(client, since)
+    assert delta['changes']['crops']['deleted'] == [dropped]
+    assert delta['changes']['crops']['rows'] == []
+    full = sync(client)
+    assert kept in ids(full, 'crops') and dropped not in ids(full, 'crops')
+
+
+def test_seq_ahead_of_the_log_resets(farmer_client):
+    from app import storage
+
+    client, user_id = farmer_client
+    crop = storage.add_crop(user_id, crop_name='maize', area=1.0, planting_date='2024-01-01')
+    latest = sync(client)['seq']
+
+    reset = sync(client, latest + 1_000_000)
+    assert reset['reset'] is True
+    assert crop in ids(reset, 'crops')
+    assert client.get('/api/sync?since=-1').status_code == 400
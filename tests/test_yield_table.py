@@ -0,0 +1,79 @@
+"""The tabulated yield model: lookups, interpolation and PREDICTOR_MODE=table"""
+
+import contextlib
+import io
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from prediction import YieldPredictor
+from yield_table import CATEGORICAL, YieldTable, build_table, model_digest
+
+FEATURE_COLS = ['crop_name_encoded', 'area', 'soil_type_encoded', 'season_encoded',
+                'irrigation_type_encoded', 'rainfall', 'temperature', 'humidity']
+CLASSES = {'crop_name': ['onion', 'tomato'], 'soil_type': ['clay', 'loamy'],
+           'season': ['kharif', 'rabi'], 'irrigation_type': ['drip', 'flood']}
+RANGES = {'area': (0.5, 5.0), 'rainfall': (300, 1200), 'temperature': (15, 40), 'humidity': (30, 90)}
+
+
+class LinearModel:
+    """Stands in for the forest: yield per hectare linear in each input, so the table is exact"""
+
+    def predict(self, features):
+        crop, area, soil, season, irrigation, rainfall, temperature, humidity = np.asarray(features, dtype=float).T
+        return area * (1 + crop + 0.5 * soil + 0.25 * season + 0.1 * irrigation
+                       + 0.002 * rainfall + 0.05 * temperature + 0.01 * humidity)
+
+
+def encoders():
+    return {column: LabelEncoder().fit(values) for column, values in CLASSES.items()}
+
+
+def forest_yield(crop, area, soil, season, irrigation, rainfall, temperature, humidity):
+    codes = [CLASSES[column].index(value) for column, value in zip(CATEGORICAL, (crop, soil, season, irrigation))]
+    return LinearModel().predict([[codes[0], area, codes[1], codes[2], codes[3], rainfall, temperature, humidity]])[0]
+
+
+def test_lookups_interpolate_between_grid_points_and_clamp_outside(tmp_path):
+    table = build_table(LinearModel(), encoders(), FEATURE_COLS, RANGES, 'v1', grid_points=4, area_points=3)
+    table.save(str(tmp_path / 'table.npz'))
+    table = YieldTable.load(str(tmp_path / 'table.npz'))
+    assert table.version == 'v1' and table.table.shape == (2, 2, 2, 2, 4, 4, 4)
+
+    row = ('tomato', 2.3, 'loamy', 'rabi', 'drip', 777, 21.5, 64)
+    assert table.predict_one(*row) == pytest.approx(forest_yield(*row), rel=1e-5)
+    codes = [table.codes(column, [value]) for column, value in zip(CATEGORICAL, (row[0],) + row[2:5])]
+    assert table.lookup(codes, [2.3], 777, 21.5, 64)[0] == pytest.approx(forest_yield(*row), rel=1e-5)
+
+    # Weather beyond the training range is held at its edge
+    assert table.predict_one('onion', 1, 'clay', 'kharif', 'flood', 5000, 15, 30) == \
+        pytest.approx(forest_yield('onion', 1, 'clay', 'kharif', 'flood', 1200, 15, 30), rel=1e-5)
+    assert table.predict_one('mango', 1, 'clay', 'kharif', 'flood', 500, 20, 50) is None
+    assert table.codes('crop_name', ['Tomato', 'mango']).tolist() == [1, -1]
+
+
+def test_predictor_serves_from_a_table_built_from_its_model(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    joblib.dump(LinearModel(), 'model.pkl')
+    joblib.dump(encoders(), 'encoders.pkl')
+    joblib.dump(FEATURE_COLS, 'feature_cols.pkl')
+    build_table(LinearModel(), encoders(), FEATURE_COLS, RANGES, 'stale').save('yield_table.npz')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stale = YieldPredictor('table')
+    assert stale.table is None and stale.version == model_digest('model.pkl')
+
+    build_table(LinearModel(), encoders(), FEATURE_COLS, RANGES, model_digest('model.pkl')).save('yield_table.npz')
+    with contextlib.redirect_stdout(io.StringIO()):
+        forest, tabulated = YieldPredictor('forest'), YieldPredictor('table')
+    assert tabulated.version == forest.version + '-table'
+
+    rows = (['tomato', 'onion', 'mango'], [2.0, 1.5, 1.0], ['loamy', 'clay', 'loamy'],
+            ['rabi', 'kharif', 'rabi'], ['drip', 'flood', 'drip'])
+    expected = forest.predict_batch(*rows, rainfall=800, temperature=26, humidity=60)
+    tabulated_yields = tabulated.predict_batch(*rows, rainfall=800, temperature=26, humidity=60)
+    assert tabulated_yields == pytest.approx(expected, abs=0.011)
+    # Unknown crops get the rule-based estimate in both modes
+    assert expected[2] == pytest.approx(tabulated.predict_yield_fallback('mango', 1.0, 'drip'))
@@ -10,6 +10,8 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
+from drift import DRIFT_PROFILE, build_profile, save_profile
+from yield_table import YIELD_TABLE, build_table, evaluate, model_digest, print_accuracy, training_ranges
 import matplotlib.pyplot as plt
 import seaborn as sns
 
@@ -304,6 +306,19 @@ def main():
     # Save model
     save_model(model, encoders, feature_cols)
     
+    # Save drift reference: training inputs and the model's predictions on them
+    df_encoded = df.copy()
+    for col, encoder in encoders.items():
+        df_encoded[f'{col}_encoded'] = encoder.transform(df[col])
+    save_profile(build_profile(df, model.predict(df_encoded[feature_cols]), 'model.pkl'))
+    print(f"✓ Drift reference saved as '{DRIFT_PROFILE}'")
+    
+    # Tabulate the model for PREDICTOR_MODE=table and compare it with the forest
+    table = build_table(model, encoders, feature_cols, training_ranges(df), model_digest('model.pkl'))
+    table.save()
+    print(f"✓ Yield table saved as '{YIELD_TABLE}'")
+    print_accuracy(evaluate(table, model, X_test, y_test), len(X_test))
+    
     # Create visualizations
     create_visualizations(df, X_test, y_test, y_pred_test)
     
@@ -315,8 +330,10 @@ def main():
     print("  2. encoders.pkl - Label encoders for categorical features")
     print("  3. feature_cols.pkl - Feature column names")
     print("  4. training_data.csv - Synthetic training dataset")
-    print("  5. prediction_accuracy.png - Visualization")
-    print("  6. yield_by_crop.png - Crop yield distribution")
+    print(f"  5. {DRIFT_PROFILE} - Reference distributions for drift monitoring")
+    print(f"  6. {YIELD_TABLE} - Tabulated model for PREDICTOR_MODE=table")
+    print("  7. prediction_accuracy.png - Visualization")
+    print("  8. yield_by_crop.png - Crop yield distribution")
     print("\nYou can now use this model in your Flask app!")
     print("The model will make real predictions based on trained data.")
 
@@ -0,0 +1,262 @@
+"""
+Tabulated Yield Model for Surplus-to-Sustain
+
+The model's categorical inputs span only 9 crops x 4 soils x 3 seasons x
+4 irrigation types = 432 combinations. For every one of them build_table()
+asks the trained forest for yields on a TABLE_GRID_POINTS^3 grid of
+rainfall, temperature and humidity over the training range, at
+TABLE_AREA_POINTS planted areas, and keeps the least-squares yield per
+hectare at each grid point. The whole table is one float32 array (about
+370 KB), saved as yield_table.npz with the version of the model it came
+from.
+
+A lookup indexes the four categories and interpolates multilinearly
+between the 8 surrounding weather grid points, then scales by area.
+Weather outside the training range is clamped to its edge, as the
+forest's splits effectively do. PREDICTOR_MODE=table selects it in
+prediction.YieldPredictor.
+
+    python yield_table.py               # build from model.pkl, report accuracy vs the forest
+    python yield_table.py --benchmark   # also per-prediction latency of both
+"""
+
+import argparse
+import bisect
+import hashlib
+import itertools
+import os
+import time
+
+import numpy as np
+
+YIELD_TABLE = os.environ.get('YIELD_TABLE', 'yield_table.npz')
+TABLE_GRID_POINTS = int(os.environ.get('TABLE_GRID_POINTS', 6))
+TABLE_AREA_POINTS = int(os.environ.get('TABLE_AREA_POINTS', 5))
+
+CATEGORICAL = ('crop_name', 'soil_type', 'season', 'irrigation_type')
+WEATHER = ('rainfall', 'temperature', 'humidity')
+
+
+def model_digest(path):
+    """Short content hash of a model file, used as its version"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def training_ranges(df):
+    """(min, max) of area and each weather input, the span the table covers"""
+    return {name: (df[name].min(), df[name].max()) for name in ('area',) + WEATHER}
+
+
+class YieldTable:
+    """Per-hectare yields indexed by category codes, interpolated over weather"""
+
+    def __init__(self, table, axes, classes, version):
+        self.table = table
+        self.axes = axes
+        self.classes = classes
+        self.version = version
+        self.index = {column: {value: i for i, value in enumerate(values)}
+                      for column, values in classes.items()}
+        self.edges = [axis.tolist() for axis in axes]
+
+    @classmethod
+    def load(cls, path=YIELD_TABLE):
+        """The saved table, or None if there isn't one"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(data['table'], [data[f'axis_{name}'] for name in WEATHER],
+                       {column: data[f'classes_{column}'].tolist() for column in CATEGORICAL},
+                       str(data['version']))
+
+    def save(self, path=YIELD_TABLE):
+        np.savez_compressed(path, table=self.table, version=np.array(self.version),
+                            **{f'axis_{name}': axis for name, axis in zip(WEATHER, self.axes)},
+                            **{f'classes_{column}': np.array(values) for column, values in self.classes.items()})
+
+    def codes(self, column, values):
+        """Category codes for a column, -1 where the value isn't in the table"""
+        index = self.index[column]
+        return np.array([index.get(value, -1) for value in np.char.lower(np.asarray(values, dtype=str)).tolist()],
+                        dtype=np.int64)
+
+    def predict_one(self, crop_name, area, soil_type, season, irrigation_type, rainfall, temperature, humidity):
+        """
+        Yield (tons) for a single row without array overhead, or None if
+        a category isn't in the table
+        """
+        codes = []
+        for column, value in zip(CATEGORICAL, (crop_name, soil_type, season, irrigation_type)):
+            code = self.index[column].get(str(value).lower())
+            if code is None:
+                return None
+            codes.append(code)
+        cells = self.table[tuple(codes)]
+        lower, fraction = [], []
+        for edges, value in zip(self.edges, (rainfall, temperature, humidity)):
+            value = min(max(float(value), edges[0]), edges[-1])
+            i = min(max(bisect.bisect_right(edges, value) - 1, 0), len(edges) - 2)
+            lower.append(i)
+            fraction.append((value - edges[i]) / (edges[i + 1] - edges[i]))
+        block = cells[lower[0]:lower[0] + 2, lower[1]:lower[1] + 2, lower[2]:lower[2] + 2].tolist()
+        (fx, fy, fz) = fraction
+        per_hectare = 0.0
+        for x in (0, 1):
+            for y in (0, 1):
+                for z in (0, 1):
+                    weight = (fx if x else 1 - fx) * (fy if y else 1 - fy) * (fz if z else 1 - fz)
+                    per_hectare += weight * block[x][y][z]
+        return per_hectare * float(area)
+
+    def lookup(self, codes, areas, rainfall, temperature, humidity):
+        """
+        Yields (tons) for rows of known category codes
+
+        codes is a sequence of four code arrays in CATEGORICAL order; the
+        weather arguments may be scalars.
+        """
+        areas = np.asarray(areas, dtype=float)
+        n = len(areas)
+        cells = self.table[tuple(codes)]
+        rows = np.arange(n)
+        lower, fraction = [], []
+        for axis, values in zip(self.axes, (rainfall, temperature, humidity)):
+            values = np.clip(np.broadcast_to(np.asarray(values, dtype=float), (n,)), axis[0], axis[-1])
+            i = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+            lower.append(i)
+            fraction.append((values - axis[i]) / (axis[i + 1] - axis[i]))
+        per_hectare = np.zeros(n)
+        for corner in itertools.product((0, 1), repeat=3):
+            weight = np.ones(n)
+            for upper, f in zip(corner, fraction):
+                weight *= f if upper else 1 - f
+            per_hectare += weight * cells[rows, lower[0] + corner[0], lower[1] + corner[1], lower[2] + corner[2]]
+        return per_hectare * areas
+
+
+def build_table(model, encoders, feature_cols, ranges, version,
+                grid_points=TABLE_GRID_POINTS, area_points=TABLE_AREA_POINTS):
+    """
+    Tabulate a trained model
+
+    ranges maps 'area' and each weather input to its (min, max) in the
+    training data.
+    """
+    classes = {column: [str(value) for value in encoders[column].classes_] for column in CATEGORICAL}
+    axes = [np.linspace(*ranges[name], grid_points) for name in WEATHER]
+    areas = np.linspace(*ranges['area'], area_points)
+
+    categories = np.array(list(itertools.product(*(range(len(classes[column])) for column in CATEGORICAL))))
+    weather = np.array(list(itertools.product(*axes)))
+    n_cat, n_weather = len(categories), len(weather)
+    cat = np.repeat(np.arange(n_cat), n_weather * area_points)
+    cell = np.tile(np.repeat(np.arange(n_weather), area_points), n_cat)
+    area = np.tile(np.arange(area_points), n_cat * n_weather)
+
+    columns = {f'{column}_encoded': categories[cat, i] for i, column in enumerate(CATEGORICAL)}
+    columns['area'] = areas[area]
+    columns.update({name: weather[cell, i] for i, name in enumerate(WEATHER)})
+    features = np.column_stack([columns[name] for name in feature_cols])
+    if hasattr(model, 'feature_names_in_'):
+        import pandas as pd
+        features = pd.DataFrame(features, columns=model.feature_names_in_)
+
+    yields = model.predict(features).reshape(n_cat, n_weather, area_points)
+    # Least-squares slope through the origin: yield = per_hectare * area
+    per_hectare = (yields * areas).sum(axis=-1) / (areas ** 2).sum()
+    shape = tuple(len(classes[column]) for column in CATEGORICAL) + (grid_points,) * len(WEATHER)
+    return YieldTable(per_hectare.reshape(shape).astype(np.float32), axes, classes, version)
+
+
+def evaluate(table, model, X_test, y_test):
+    """Held-out accuracy of the forest and the table, and how far the table strays from the forest"""
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    forest = model.predict(X_test)
+    codes = [X_test[f'{column}_encoded'].to_numpy(dtype=np.int64) for column in CATEGORICAL]
+    tabulated = table.lookup(codes, X_test['area'], *(X_test[name] for name in WEATHER))
+    gap = np.abs(tabulated - forest)
+    return {
+        'forest_mae': mean_absolute_error(y_test, forest),
+        'forest_r2': r2_score(y_test, forest),
+        'table_mae': mean_absolute_error(y_test, tabulated),
+        'table_r2': r2_score(y_test, tabulated),
+        'mean_gap': float(gap.mean()),
+        'max_gap': float(gap.max()),
+    }
+
+
+def print_accuracy(accuracy, rows):
+    print(f"\n  Held-out accuracy ({rows} rows)")
+    print(f"  {'':<10}{'MAE (t)':>10}{'R²':>10}")
+    print(f"  {'forest':<10}{accuracy['forest_mae']:>10.3f}{accuracy['forest_r2']:>10.4f}")
+    print(f"  {'table':<10}{accuracy['table_mae']:>10.3f}{accuracy['table_r2']:>10.4f}")
+    print(f"  {'delta':<10}{accuracy['table_mae'] - accuracy['forest_mae']:>+10.3f}"
+          f"{accuracy['table_r2'] - accuracy['forest_r2']:>+10.4f}")
+    print(f"  Table vs forest: {accuracy['mean_gap']:.3f} t mean, {accuracy['max_gap']:.3f} t max difference")
+
+
+def benchmark(runs=2000):
+    """Single-prediction latency through YieldPredictor in forest and table mode"""
+    import contextlib
+    import io
+    import warnings
+
+    from prediction import YieldPredictor
+
+    rng = np.random.default_rng(3)
+    rows = [(str(rng.choice(['tomato', 'onion', 'potato', 'wheat'])), float(rng.uniform(0.5, 10)),
+             'loamy', 'rabi', 'drip', float(rng.uniform(300, 1200)), float(rng.uniform(20, 35)),
+             float(rng.uniform(50, 90))) for _ in range(runs)]
+    print(f"\n  {'mode':<10}{'p50 µs':>10}{'p99 µs':>10}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        predictors = {mode: YieldPredictor(mode) for mode in ('forest', 'table')}
+    for mode, predictor in predictors.items():
+        timings = []
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for row in rows[:runs if mode == 'table' else runs // 10]:
+                started = time.perf_counter()
+                predictor.predict_yield_ml(*row)
+                timings.append((time.perf_counter() - started) * 1e6)
+        print(f"  {mode:<10}{np.percentile(timings, 50):>10.0f}{np.percentile(timings, 99):>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tabulate the trained yield model')
+    parser.add_argument('--benchmark', action='store_true', help='also time single predictions in both modes')
+    args = parser.parse_args()
+
+    import joblib
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+
+    if not os.path.exists('model.pkl') or not os.path.exists('training_data.csv'):
+        print("⚠ Needs model.pkl and training_data.csv; run train_model.py first.")
+        return
+    model = joblib.load('model.pkl')
+    encoders = joblib.load('encoders.pkl')
+    feature_cols = joblib.load('feature_cols.pkl')
+    df = pd.read_csv('training_data.csv')
+    for column in CATEGORICAL:
+        df[f'{column}_encoded'] = encoders[column].transform(df[column])
+    # The split train_model.train_model() held out
+    _, X_test, _, y_test = train_test_split(df[feature_cols], df['yield_tons'], test_size=0.2, random_state=42)
+
+    started = time.perf_counter()
+    table = build_table(model, encoders, feature_cols, training_ranges(df), model_digest('model.pkl'))
+    table.save()
+    print(f"✓ Tabulated {table.table.size:,} per-hectare yields ({table.table.nbytes / 1024:.0f} KB) "
+          f"in {time.perf_counter() - started:.1f}s, saved as '{YIELD_TABLE}'")
+    print_accuracy(evaluate(table, model, X_test, y_test), len(X_test))
+
+    if args.benchmark:
+        benchmark()
+
+
+if __name__ == '__main__':
+    main()